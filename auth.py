@@ -1,28 +1,152 @@
 # Auth
+import asyncio
+import logging
 import os
 import uuid
 import secrets
+import time
+from collections import OrderedDict
 from datetime import datetime
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
 from passlib.context import CryptContext
+from pymongo import UpdateOne
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
-from typing import Optional
-from bd import users_coll, sessions_coll
+from typing import Dict, List, Optional, Tuple
+from bd import users_coll, sessions_coll, revocaciones_coll
+from filtros.ejecutor import en_hash
+from metricas import medir
 from dotenv import load_dotenv
 load_dotenv()
+logger = logging.getLogger(__name__)
 
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecret")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Caché de sesiones validadas: una revocación hecha en otro proceso tarda como máximo AUTH_CACHE_TTL segundos en verse
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "30"))
+AUTH_CACHE_TAMANO = int(os.getenv("AUTH_CACHE_TAMANO", "1024"))
+# "sesiones": cada token se busca en sessions_coll. "stateless": se valida la firma y el sid del token contra
+# las revocaciones en memoria, sincronizadas cada AUTH_REVOCACION_INTERVALO segundos (ventana máxima ~2 intervalos)
+AUTH_MODO = os.getenv("AUTH_MODO", "sesiones")
+AUTH_REVOCACION_INTERVALO = float(os.getenv("AUTH_REVOCACION_INTERVALO", "5"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Costo bcrypt; los hashes con menos rondas se rehacen en el siguiente login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__default_rounds=BCRYPT_ROUNDS, bcrypt__min_rounds=BCRYPT_ROUNDS)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
+_sesiones_cache: "OrderedDict[str, tuple]" = OrderedDict()
+# Sube con cada invalidación: una validación que empezó antes no puede volver a cachear un token ya revocado
+_cache_generacion = 0
+
+#Caché de sesiones
+def _cache_obtener(token):
+    entrada = _sesiones_cache.get(token)
+    if entrada is None:
+        return None
+    expira, user = entrada
+    if expira < time.time():
+        _sesiones_cache.pop(token, None)
+        return None
+    _sesiones_cache.move_to_end(token)
+    return dict(user)
+
+def _cache_guardar(token, user, exp_token, generacion):
+    if AUTH_CACHE_TTL <= 0 or generacion != _cache_generacion:
+        return
+    expira = min(time.time() + AUTH_CACHE_TTL, exp_token or float("inf"))
+    _sesiones_cache[token] = (expira, user)
+    _sesiones_cache.move_to_end(token)
+    while len(_sesiones_cache) > AUTH_CACHE_TAMANO:
+        _sesiones_cache.popitem(last=False)
+
+def invalidar_token_cache(token):
+    global _cache_generacion
+    _cache_generacion += 1
+    _sesiones_cache.pop(token, None)
+
+def invalidar_usuario_cache(user_id: Optional[str] = None, email: Optional[str] = None):
+    global _cache_generacion
+    _cache_generacion += 1
+    for token, (_, user) in list(_sesiones_cache.items()):
+        if (user_id is not None and str(user["_id"]) == user_id) or (email is not None and user.get("email") == email):
+            _sesiones_cache.pop(token, None)
+
+#Revocaciones
+class Revocaciones:
+    """Sesiones revocadas (sid -> expiración) sincronizadas por polling desde revocaciones_coll."""
+
+    def __init__(self, intervalo: float):
+        self.intervalo = intervalo
+        self._revocadas: Dict[str, datetime] = {}
+        self._ultima: Optional[datetime] = None
+        self._sincronizado: Optional[float] = None
+        self._tarea: Optional[asyncio.Task] = None
+
+    def al_dia(self) -> bool:
+        # Si la sincronización se atrasa, get_current_user vuelve a consultar sessions_coll
+        return self._sincronizado is not None and time.monotonic() - self._sincronizado <= 2 * self.intervalo
+
+    def revocada(self, sid: str) -> bool:
+        return sid in self._revocadas
+
+    def agregar(self, sid: str, expira: datetime):
+        self._revocadas[sid] = expira
+
+    async def sincronizar(self):
+        # Solape de dos intervalos por si los relojes de los procesos que revocan no coinciden
+        filtro = {} if self._ultima is None else {"revocada_en": {"$gt": self._ultima - timedelta(seconds=2 * self.intervalo)}}
+        async for doc in revocaciones_coll.find(filtro, {"expira": 1, "revocada_en": 1}):
+            self._revocadas[doc["_id"]] = doc["expira"]
+            if self._ultima is None or doc["revocada_en"] > self._ultima:
+                self._ultima = doc["revocada_en"]
+        ahora = datetime.utcnow()
+        for sid in [sid for sid, expira in self._revocadas.items() if expira < ahora]:
+            del self._revocadas[sid]
+        self._sincronizado = time.monotonic()
+
+    async def _bucle(self):
+        while True:
+            await asyncio.sleep(self.intervalo)
+            try:
+                await self.sincronizar()
+            except Exception as e:
+                logger.warning("No se pudieron sincronizar las revocaciones: %s", e)
+
+    async def iniciar(self):
+        try:
+            await self.sincronizar()
+        except Exception as e:
+            logger.warning("No se pudieron cargar las revocaciones: %s", e)
+        self._tarea = asyncio.create_task(self._bucle())
+
+    async def detener(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            self._tarea = None
+
+revocaciones = Revocaciones(AUTH_REVOCACION_INTERVALO)
+
+async def _registrar_revocaciones(user_id, session_ids: List[str]):
+    # En modo "sesiones" basta con borrar la sesión: nadie consulta revocaciones_coll
+    if AUTH_MODO != "stateless" or not session_ids:
+        return
+    ahora = datetime.utcnow()
+    # Ningún token vigente vive más allá de ahora + ACCESS_TOKEN_EXPIRE_MINUTES
+    expira = ahora + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    for sid in session_ids:
+        revocaciones.agregar(sid, expira)
+    await revocaciones_coll.bulk_write([
+        UpdateOne({"_id": sid}, {"$set": {"user_id": user_id, "expira": expira, "revocada_en": ahora}}, upsert=True)
+        for sid in session_ids
+    ], ordered=False)
+
 #Tokens
-async def save_token(user_id, token):
-    session_id = str(uuid.uuid4())
+async def save_token(user_id, token, session_id: Optional[str] = None):
+    session_id = session_id or str(uuid.uuid4())
     await sessions_coll.insert_one({
         "user_id": user_id,
         "token": token,
@@ -31,11 +155,20 @@ async def save_token(user_id, token):
     })
     return session_id
 
+# La caché se invalida después de borrar la sesión: una validación en curso que ya pasó is_token_valid
+# ve la generación nueva y no guarda el token revocado
 async def revoke_token(token):
+    session = await sessions_coll.find_one({"token": token})
+    if session:
+        await _registrar_revocaciones(session["user_id"], [session["session_id"]])
     await sessions_coll.delete_one({"token": token})
+    invalidar_token_cache(token)
     
 async def revoke_all_tokens(user_id):
+    sessions = await sessions_coll.find({"user_id": user_id}, {"session_id": 1}).to_list(None)
+    await _registrar_revocaciones(user_id, [s["session_id"] for s in sessions])
     await sessions_coll.delete_many({"user_id": user_id})
+    invalidar_usuario_cache(user_id=user_id)
 
 async def is_token_valid(token):
     session = await sessions_coll.find_one({"token": token})
@@ -83,7 +216,7 @@ async def reset_password(token: str, new_password: str) -> bool:
         return False
         
     # Hash de la nueva contraseña
-    hashed_pw = get_password_hash(new_password)
+    hashed_pw = await hash_password_async(new_password)
     
     # Actualizar contraseña y eliminar el token de reseteo
     await users_coll.update_one(
@@ -93,19 +226,40 @@ async def reset_password(token: str, new_password: str) -> bool:
             "$unset": {"reset_token": "", "reset_token_expires": ""}
         }
     )
+    invalidar_usuario_cache(email=email)
     
     return True
 
 #Funciones
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    with medir("bcrypt"):
+        return pwd_context.hash(password)
 
 def verify_password(plain: str, hashed: str) -> bool:
-    return pwd_context.verify(plain, hashed)
+    with medir("bcrypt"):
+        return pwd_context.verify(plain, hashed)
 
-def create_access_token(sub: str, expires_delta: Optional[timedelta] = None) -> str:
+def _verificar_y_actualizar(plain: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    with medir("bcrypt"):
+        return pwd_context.verify_and_update(plain, hashed)
+
+# Versiones async: bcrypt corre en el pool de hash (503 si está saturado), nunca en el event loop
+async def hash_password_async(password: str) -> str:
+    return await en_hash(get_password_hash, password)
+
+async def verify_password_async(plain: str, hashed: str) -> bool:
+    return await en_hash(verify_password, plain, hashed)
+
+async def verify_and_update_password(plain: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """Devuelve (válida, nuevo_hash). nuevo_hash no es None si passlib marca el hash como obsoleto (needs_update)."""
+    return await en_hash(_verificar_y_actualizar, plain, hashed)
+
+def create_access_token(sub: str, expires_delta: Optional[timedelta] = None, session_id: Optional[str] = None) -> str:
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode = {"exp": expire, "sub": sub}
+    # jti aleatorio: dos logins en el mismo segundo no deben generar el mismo token (índice único en sessions)
+    to_encode = {"exp": expire, "sub": sub, "jti": uuid.uuid4().hex}
+    if session_id:
+        to_encode["sid"] = session_id
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
@@ -114,8 +268,21 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         detail={"error_code": "UNAUTHORIZED", "message": "Credenciales inválidas"},
         headers={"WWW-Authenticate": "Bearer"},
     )
+    sid = None
+    if AUTH_MODO == "stateless" and revocaciones.al_dia():
+        try:
+            sid = jwt.get_unverified_claims(token).get("sid")
+        except JWTError:
+            raise credentials_exception
+        if sid is not None and revocaciones.revocada(sid):
+            raise credentials_exception
+    user = _cache_obtener(token)
+    if user is not None:
+        return user
+    generacion = _cache_generacion
     try:
-        if not await is_token_valid(token):
+        # Sin sid (tokens antiguos) o con las revocaciones atrasadas se consulta sessions_coll
+        if sid is None and not await is_token_valid(token):
             raise credentials_exception
             
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -128,4 +295,5 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     user = await users_coll.find_one({"email": email})
     if not user:
         raise credentials_exception
-    return user
\ No newline at end of file
+    _cache_guardar(token, user, payload.get("exp"), generacion)
+    return dict(user)
\ No newline at end of file
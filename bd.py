@@ -1,17 +1,121 @@
 # BD
+import asyncio
+import logging
 import os
+from datetime import datetime
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure
 from pymongo.server_api import ServerApi
 from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
+from metricas import MonitorMongo
 
 load_dotenv() 
+logger = logging.getLogger(__name__)
 MONGO_URI = os.getenv("MONGO_URI")
 DATABASE_NAME = os.getenv("DATABASE_NAME", "testdb")
 
 client = AsyncIOMotorClient(
     MONGO_URI,
     server_api=ServerApi("1"),
+    event_listeners=[MonitorMongo()],
 )
 db = client[DATABASE_NAME]
 users_coll = db["users"]
 sessions_coll = db["sessions"]
+ocr_cache_coll = db["ocr_cache"]
+revocaciones_coll = db["revocaciones"]
+huellas_coll = db["huellas"]
+
+MONGO_CREAR_INDICES = os.getenv("MONGO_CREAR_INDICES", "1") == "1"
+MONGO_VERIFICAR_PLANES = os.getenv("MONGO_VERIFICAR_PLANES", "0") == "1"
+MONGO_INDICES_TIMEOUT = float(os.getenv("MONGO_INDICES_TIMEOUT", "10"))
+# Días sin volver a ver una captura tras los que se olvida su huella
+HUELLAS_TTL_DIAS = float(os.getenv("HUELLAS_TTL_DIAS", "90"))
+
+class ConsultasSinIndice(RuntimeError):
+    """Alguna consulta caliente no la resuelve un índice."""
+
+#Índices
+async def _crear_indice_ttl(coll, campo, segundos, nombre):
+    try:
+        await coll.create_index([(campo, ASCENDING)], expireAfterSeconds=segundos, name=nombre)
+    except OperationFailure as e:
+        # El índice ya existía con otro expireAfterSeconds: se actualiza en lugar de recrearlo
+        if e.code not in (85, 86):
+            raise
+        await db.command({"collMod": coll.name, "index": {"name": nombre, "expireAfterSeconds": segundos}})
+
+async def crear_indices(expiracion_sesion_segundos: int):
+    """Crea (idempotente) los índices que usan las consultas de login, sesiones y reseteo de contraseña."""
+    await users_coll.create_index([("email", ASCENDING)], unique=True, name="email_unico")
+    await users_coll.create_index([("username", ASCENDING)], unique=True, name="username_unico")
+    await users_coll.create_index([("reset_token", ASCENDING)], sparse=True, name="reset_token")
+    await sessions_coll.create_index([("token", ASCENDING)], unique=True, name="token_unico")
+    await sessions_coll.create_index([("user_id", ASCENDING)], name="user_id")
+    await _crear_indice_ttl(sessions_coll, "created_at", expiracion_sesion_segundos, "sesiones_ttl")
+    await _crear_indice_ttl(ocr_cache_coll, "expira", 0, "ocr_cache_ttl")
+    await revocaciones_coll.create_index([("revocada_en", ASCENDING)], name="revocada_en")
+    await _crear_indice_ttl(revocaciones_coll, "expira", 0, "revocaciones_ttl")
+    await _crear_indice_ttl(huellas_coll, "vista", int(HUELLAS_TTL_DIAS * 86400), "huellas_ttl")
+
+# Consultas calientes: (colección, filtro, campo que debe resolver un índice)
+CONSULTAS_CALIENTES = [
+    ("users", {"email": "planes@example.com"}, "email"),
+    ("users", {"username": "planes"}, "username"),
+    ("users", {"reset_token": "planes", "reset_token_expires": {"$gt": datetime(2000, 1, 1)}}, "reset_token"),
+    ("sessions", {"token": "planes"}, "token"),
+    ("sessions", {"user_id": "planes"}, "user_id"),
+    ("revocaciones", {"revocada_en": {"$gt": datetime(2000, 1, 1)}}, "revocada_en"),
+]
+
+def _etapas(plan):
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for valor in plan.values():
+            yield from _etapas(valor)
+    elif isinstance(plan, list):
+        for valor in plan:
+            yield from _etapas(valor)
+
+async def verificar_planes():
+    """Comprueba con explain() que las consultas calientes usan un índice (IXSCAN) y no un COLLSCAN.
+    Con un sustituto sin explain() (p. ej. mongomock) comprueba que exista un índice que empiece por el campo."""
+    errores = []
+    for nombre, filtro, campo in CONSULTAS_CALIENTES:
+        coll = db[nombre]
+        try:
+            plan = await coll.find(filtro).explain()
+            etapas = set(_etapas(plan.get("queryPlanner", {}).get("winningPlan", {})))
+            if not any("IXSCAN" in etapa or etapa == "IDHACK" for etapa in etapas) or "COLLSCAN" in etapas:
+                errores.append(f"{coll.name} {filtro}: {sorted(etapas)}")
+        except (AttributeError, NotImplementedError):
+            indices = await coll.index_information()
+            if not any(info["key"][0][0] == campo for info in indices.values()):
+                errores.append(f"{coll.name} {filtro}: sin índice sobre {campo}")
+    if errores:
+        raise ConsultasSinIndice("Consultas sin índice: " + "; ".join(errores))
+
+async def preparar_bd(expiracion_sesion_segundos: int):
+    """Migración de arranque: índices y, si MONGO_VERIFICAR_PLANES=1, verificación de planes."""
+    if not MONGO_CREAR_INDICES:
+        return
+    try:
+        await asyncio.wait_for(crear_indices(expiracion_sesion_segundos), MONGO_INDICES_TIMEOUT)
+    except Exception as e:
+        logger.warning("No se pudieron crear los índices de MongoDB: %s", e)
+        return
+    if MONGO_VERIFICAR_PLANES:
+        await verificar_planes()
+
+if __name__ == "__main__":
+    # python bd.py: crea los índices y verifica los planes contra MONGO_URI (p. ej. un mongod local)
+    from auth import ACCESS_TOKEN_EXPIRE_MINUTES
+
+    async def _main():
+        await crear_indices(ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+        await verificar_planes()
+        print("Índices creados y planes verificados")
+
+    asyncio.run(_main())
@@ -0,0 +1,106 @@
+# Backends OCR: latencia y concordancia de lo que extraen filtro_claves y filtro_ocr con cada motor
+# Uso (desde la raíz del repo): python -m benchmarks.bench_backends_ocr [--backends ocrspace,local] [--max N]
+# El primer backend de la lista es la referencia para la concordancia.
+import argparse
+import asyncio
+import time
+from fastapi import HTTPException
+from benchmarks.corpus import generar_corpus
+from filtros.cliente_ocr import ClienteOCR, OCRError, crear_backend
+from filtros.filtro_claves import analizar_claves, extraer_palabras, normalizar_texto, preparar_imagen_claves
+from filtros.filtro_ocr import preparar_recorte, validar_comprobante
+from filtros.imagen import decodificar_imagen
+from filtros.preprocesado_ocr import DATOS_OCR, mapear_overlay
+
+CAMPOS = ("estructura", "monto", "receptor", "fecha", "hora", "codigo_seguridad", "destino", "codigo_operacion")
+
+def percentil(valores, p):
+    if not valores:
+        return float("nan")
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+def campos_comprobante(respuesta):
+    if not respuesta or respuesta.get("IsErroredOnProcessing"):
+        return {"error": "ocr"}
+    resultado = respuesta["ParsedResults"][0]
+    try:
+        comprobante = validar_comprobante(resultado["ParsedText"].strip(), resultado.get("TextOverlay", {}).get("Lines", []))
+    except HTTPException as e:
+        return {"error": e.detail}
+    return {campo: comprobante.get(campo) for campo in CAMPOS}
+
+async def medir(cliente: ClienteOCR, archivo, datos):
+    inicio = time.perf_counter()
+    try:
+        respuesta = await cliente.enviar(archivo, datos, usar_cache=False)
+    except OCRError as e:
+        return None, (time.perf_counter() - inicio) * 1000, str(e)
+    return respuesta, (time.perf_counter() - inicio) * 1000, None
+
+async def main(args):
+    nombres = args.backends.split(",")
+    clientes = {nombre: ClienteOCR(crear_backend(nombre)) for nombre in nombres}
+    latencias = {nombre: [] for nombre in nombres}
+    errores = {nombre: 0 for nombre in nombres}
+    casos = []
+    for i, (nombre_img, _, contenido) in enumerate(generar_corpus()):
+        if i >= args.max:
+            break
+        imagen = decodificar_imagen(contenido)
+        recorte = preparar_recorte(imagen)
+        recorte_claves = preparar_imagen_claves(imagen)
+        caso = {"imagen": nombre_img}
+        for nombre, cliente in clientes.items():
+            # Los dos filtros comparten recorte y parámetros: en producción es una sola llamada
+            comprobante, ms_comp, error_comp = await medir(cliente, recorte.archivo, DATOS_OCR)
+            latencias[nombre].append(ms_comp)
+            errores[nombre] += bool(error_comp)
+            if recorte_claves.contenido == recorte.contenido:
+                claves, error_claves = comprobante, error_comp
+            else:
+                claves, ms_claves, error_claves = await medir(cliente, recorte_claves.archivo, DATOS_OCR)
+                latencias[nombre].append(ms_claves)
+                errores[nombre] += bool(error_claves)
+            claves = mapear_overlay(claves, recorte_claves.transformacion) if claves else claves
+            caso[nombre] = {
+                "claves": analizar_claves(claves or {}),
+                "palabras": {normalizar_texto(p["WordText"]) for p in extraer_palabras(claves or {})},
+                "comprobante": campos_comprobante(comprobante),
+                "error": error_claves or error_comp,
+            }
+        casos.append(caso)
+
+    print(f"{'backend':<10}{'llamadas':>9}{'errores':>9}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}")
+    for nombre in nombres:
+        v = latencias[nombre]
+        print(f"{nombre:<10}{len(v):>9}{errores[nombre]:>9}{percentil(v, 50):>9.0f}{percentil(v, 95):>9.0f}{max(v, default=0):>9.0f}")
+
+    referencia = nombres[0]
+    for nombre in nombres[1:]:
+        comparables = [c for c in casos if not c[referencia]["error"] and not c[nombre]["error"]]
+        print(f"\nConcordancia {nombre} vs {referencia} ({len(comparables)} imágenes con ambos OK)")
+        if not comparables:
+            continue
+        veredicto = sum(c[nombre]["claves"].get("advertencia") == c[referencia]["claves"].get("advertencia") for c in comparables)
+        jaccard = [len(c[nombre]["palabras"] & c[referencia]["palabras"]) / max(1, len(c[nombre]["palabras"] | c[referencia]["palabras"]))
+                   for c in comparables]
+        print(f"  veredicto claves igual: {veredicto}/{len(comparables)}")
+        print(f"  palabras (Jaccard medio): {sum(jaccard) / len(jaccard):.2f}")
+        for campo in ("error",) + CAMPOS:
+            iguales = sum(c[nombre]["comprobante"].get(campo) == c[referencia]["comprobante"].get(campo) for c in comparables)
+            print(f"  {campo:<18}{iguales:>4}/{len(comparables)}")
+
+    if args.detalle:
+        for caso in casos:
+            for nombre in nombres:
+                print(caso["imagen"], nombre, caso[nombre]["error"] or "", caso[nombre]["claves"], caso[nombre]["comprobante"])
+    for cliente in clientes.values():
+        await cliente.cerrar()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", default="ocrspace,local")
+    parser.add_argument("--max", type=int, default=16, help="máximo de imágenes del corpus")
+    parser.add_argument("--detalle", action="store_true", help="imprime lo extraído por imagen y backend")
+    asyncio.run(main(parser.parse_args()))
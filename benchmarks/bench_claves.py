@@ -0,0 +1,61 @@
+# Similitud de palabras clave (filtro_claves): regresión contra el dorado y ms por comprobante
+# Uso (desde la raíz del repo): python -m benchmarks.bench_claves [--regenerar]
+# Sale con código 1 si algún porcentaje difiere de benchmarks/golden_claves.json.
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from filtros.filtro_claves import PLANTILLA1, PLANTILLA2, calcular_similitud
+
+GOLDEN_PATH = os.path.join(os.path.dirname(__file__), "golden_claves.json")
+SEMILLA = 11
+CASOS = 120
+RELLENO = ["Nro.", "de", "celular", "operación", "Yape", "S/", "25.50", "Juan", "Perez", "DATOS", "LA",
+           "TRANSACCIÓN", "Destino", "Pago", "", "seguridad", "c0digo", "Yapeaste", "iTe", "Sl", "12:30", "ago."]
+
+def generar_palabras(rnd: random.Random):
+    """Overlay denso: las palabras de una plantilla desplazadas y escaladas, más relleno en toda la imagen."""
+    plantilla = rnd.choice([PLANTILLA1, PLANTILLA2])
+    escala = rnd.choice([1.0, 1.0, 1.3, 0.8])
+    dx, dy = rnd.randint(-60, 60), rnd.randint(-80, 80)
+    palabras = []
+    for item in plantilla:
+        if rnd.random() < 0.9:
+            texto = item["WordText"] if rnd.random() < 0.8 else item["WordText"].upper().replace("Ö", "O")
+            palabras.append({"WordText": texto, "Left": item["Left"] * escala + dx, "Top": item["Top"] * escala + dy})
+    for _ in range(rnd.choice([20, 80, 300])):
+        palabras.append({"WordText": rnd.choice(RELLENO), "Left": rnd.randint(0, 1100), "Top": rnd.randint(0, 2000)})
+    rnd.shuffle(palabras)
+    return palabras
+
+def main(regenerar: bool) -> int:
+    rnd = random.Random(SEMILLA)
+    casos = [generar_palabras(rnd) for _ in range(CASOS)]
+    resultados = [[calcular_similitud(PLANTILLA1, p), calcular_similitud(PLANTILLA2, p)] for p in casos]
+    if regenerar:
+        with open(GOLDEN_PATH, "w", encoding="utf-8") as f:
+            json.dump(resultados, f)
+        print(f"{len(resultados)} resultados guardados en {GOLDEN_PATH}")
+        return 0
+
+    with open(GOLDEN_PATH, encoding="utf-8") as f:
+        dorado = json.load(f)
+    distintos = [i for i, (r, d) in enumerate(zip(resultados, dorado)) if r != d]
+    if len(dorado) != len(resultados):
+        distintos.append(len(resultados))
+
+    inicio = time.perf_counter()
+    for palabras in casos:
+        calcular_similitud(PLANTILLA1, palabras)
+        calcular_similitud(PLANTILLA2, palabras)
+    ms = (time.perf_counter() - inicio) * 1000 / len(casos)
+    print(f"{len(casos)} comprobantes (media {sum(map(len, casos)) / len(casos):.0f} palabras), {ms:.3f} ms por comprobante")
+    print("OK" if not distintos else f"{len(distintos)} resultados distintos al dorado: {distintos[:10]}")
+    return 1 if distintos else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--regenerar", action="store_true", help="reescribe el dorado con la implementación actual")
+    sys.exit(main(parser.parse_args().regenerar))
@@ -0,0 +1,44 @@
+# Benchmark: decodificar desde archivo temporal vs desde el buffer en memoria
+# Uso (desde la raíz del repo): python -m benchmarks.bench_decodificacion
+import os
+import tempfile
+import time
+import cv2
+from filtros.imagen import decodificar_imagen
+from filtros.filtro_logo import plantilla1, plantilla2
+
+DURACION = 2.0
+
+def via_archivo_temporal(contenido, flags):
+    # Lo que hacían filtro_ruido / filtro_logo antes: escribir, releer con imread y borrar
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
+        tmp.write(contenido)
+        tmp_path = tmp.name
+    try:
+        return cv2.imread(tmp_path, flags)
+    finally:
+        os.unlink(tmp_path)
+
+def via_memoria(contenido, flags):
+    return decodificar_imagen(contenido, flags)
+
+def throughput(funcion, contenido, flags):
+    n = 0
+    inicio = time.perf_counter()
+    while time.perf_counter() - inicio < DURACION:
+        funcion(contenido, flags)
+        n += 1
+    return n / (time.perf_counter() - inicio)
+
+def main():
+    print(f"{'imagen':<12}{'modo':>10}{'temporal img/s':>17}{'memoria img/s':>16}{'mejora':>9}")
+    for ruta in (plantilla1, plantilla2):
+        with open(ruta, "rb") as f:
+            contenido = f.read()
+        for nombre, flags in (("color", cv2.IMREAD_COLOR), ("gris", cv2.IMREAD_GRAYSCALE)):
+            temporal = throughput(via_archivo_temporal, contenido, flags)
+            memoria = throughput(via_memoria, contenido, flags)
+            print(f"{os.path.basename(ruta):<12}{nombre:>10}{temporal:>17.1f}{memoria:>16.1f}{memoria / temporal:>8.2f}x")
+
+if __name__ == "__main__":
+    main()
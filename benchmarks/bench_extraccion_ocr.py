@@ -0,0 +1,50 @@
+# Extracción de campos del OCR (filtro_ocr): regresión contra el corpus dorado y ms por comprobante
+# Uso (desde la raíz del repo): python -m benchmarks.bench_extraccion_ocr [--regenerar]
+# Sale con código 1 si algún resultado difiere de benchmarks/golden_ocr.json.
+import argparse
+import json
+import os
+import sys
+import time
+from fastapi import HTTPException
+from benchmarks.corpus_ocr import generar_casos_ocr
+from filtros.filtro_ocr import validar_comprobante
+
+GOLDEN_PATH = os.path.join(os.path.dirname(__file__), "golden_ocr.json")
+REPETICIONES = 20
+
+def extraer(texto, lineas):
+    try:
+        return validar_comprobante(texto, lineas)
+    except HTTPException as e:
+        return {"error": e.status_code, "detail": e.detail}
+
+def main(regenerar: bool) -> int:
+    casos = list(generar_casos_ocr())
+    resultados = [extraer(texto, lineas) for texto, lineas in casos]
+    if regenerar:
+        with open(GOLDEN_PATH, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=0)
+        print(f"{len(resultados)} resultados guardados en {GOLDEN_PATH}")
+        return 0
+
+    with open(GOLDEN_PATH, encoding="utf-8") as f:
+        dorado = json.load(f)
+    # Se compara también el orden de las claves: la respuesta JSON debe ser idéntica
+    distintos = [i for i, (r, d) in enumerate(zip(resultados, dorado)) if list(r.items()) != list(d.items())]
+    if len(dorado) != len(resultados):
+        distintos.append(len(resultados))
+
+    inicio = time.perf_counter()
+    for _ in range(REPETICIONES):
+        for texto, lineas in casos:
+            extraer(texto, lineas)
+    ms = (time.perf_counter() - inicio) * 1000 / (REPETICIONES * len(casos))
+    print(f"{len(casos)} comprobantes, {ms:.3f} ms por comprobante")
+    print("OK" if not distintos else f"{len(distintos)} resultados distintos al dorado: {distintos[:10]}")
+    return 1 if distintos else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--regenerar", action="store_true", help="reescribe el dorado con la implementación actual")
+    sys.exit(main(parser.parse_args().regenerar))
@@ -0,0 +1,40 @@
+# Benchmark: detectar_logo_multiescala exhaustivo vs pirámide
+# Uso (desde la raíz del repo): python -m benchmarks.bench_logo
+import statistics
+import time
+import cv2
+from filtros.filtro_logo import detectar_logo_multiescala, logo_path, plantilla1, plantilla2
+
+ESCALAS_IMAGEN = [0.5, 0.6, 0.7, 0.8]
+REPETICIONES = 5
+
+def medir(imagen, logo, piramide):
+    tiempos = []
+    box = None
+    for _ in range(REPETICIONES):
+        inicio = time.perf_counter()
+        _, box = detectar_logo_multiescala(imagen, logo, piramide=piramide)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return box, statistics.median(tiempos)
+
+def main():
+    logo = cv2.imread(logo_path)
+    total_exhaustivo = total_piramide = 0.0
+    print(f"{'imagen':<12}{'escala':>8}{'exhaustivo ms':>16}{'piramide ms':>14}{'dif. px':>10}")
+    for ruta in (plantilla1, plantilla2):
+        original = cv2.imread(ruta)
+        for escala in ESCALAS_IMAGEN:
+            imagen = cv2.resize(original, None, fx=escala, fy=escala, interpolation=cv2.INTER_AREA)
+            box_e, ms_e = medir(imagen, logo, piramide=False)
+            box_p, ms_p = medir(imagen, logo, piramide=True)
+            total_exhaustivo += ms_e
+            total_piramide += ms_p
+            if box_e and box_p:
+                diferencia = max(abs(a - b) for a, b in zip(box_e, box_p))
+            else:
+                diferencia = "-" if box_e == box_p else "sin logo"
+            print(f"{ruta.split('/')[-1]:<12}{escala:>8}{ms_e:>16.1f}{ms_p:>14.1f}{diferencia:>10}")
+    print(f"Aceleración total: {total_exhaustivo / total_piramide:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# Prueba de carga: latencia de /me antes y durante una ráfaga de logins
+# Uso (con el servidor levantado): python -m benchmarks.carga_login --url http://localhost:8000
+# Con bcrypt en el event loop el p99 de /me sube a cientos de ms durante la ráfaga; con el pool de hash debe mantenerse.
+import argparse
+import asyncio
+import time
+import uuid
+import httpx
+
+def percentil(valores, p):
+    if not valores:
+        return float("nan")
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+async def crear_usuario(cliente: httpx.AsyncClient, password: str) -> str:
+    nombre = f"carga_{uuid.uuid4().hex[:8]}"
+    r = await cliente.post("/register", json={
+        "email": f"{nombre}@example.com", "username": nombre, "name": "Carga", "password": password
+    })
+    r.raise_for_status()
+    return nombre
+
+async def iniciar_sesion(cliente: httpx.AsyncClient, usuario: str, password: str) -> httpx.Response:
+    return await cliente.post("/login", data={"username": usuario, "password": password})
+
+async def medir_me(cliente: httpx.AsyncClient, token: str, duracion: float, latencias: list):
+    fin = time.perf_counter() + duracion
+    while time.perf_counter() < fin:
+        inicio = time.perf_counter()
+        r = await cliente.get("/me", headers={"Authorization": f"Bearer {token}"})
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        r.raise_for_status()
+
+async def rafaga_logins(cliente: httpx.AsyncClient, usuario: str, password: str, duracion: float, codigos: dict):
+    fin = time.perf_counter() + duracion
+    while time.perf_counter() < fin:
+        r = await iniciar_sesion(cliente, usuario, password)
+        codigos[r.status_code] = codigos.get(r.status_code, 0) + 1
+
+async def fase(cliente, token, usuario, password, duracion, logins_concurrentes, lectores):
+    latencias, codigos = [], {}
+    tareas = [medir_me(cliente, token, duracion, latencias) for _ in range(lectores)]
+    tareas += [rafaga_logins(cliente, usuario, password, duracion, codigos) for _ in range(logins_concurrentes)]
+    await asyncio.gather(*tareas)
+    return latencias, codigos
+
+async def main(args):
+    limites = httpx.Limits(max_connections=args.logins + args.lectores + 4)
+    async with httpx.AsyncClient(base_url=args.url, timeout=30, limits=limites) as cliente:
+        usuario = await crear_usuario(cliente, args.password)
+        r = await iniciar_sesion(cliente, usuario, args.password)
+        r.raise_for_status()
+        token = r.json()["access_token"]
+
+        print(f"{'fase':<10}{'peticiones /me':>16}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}  logins")
+        for nombre, logins in (("reposo", 0), ("rafaga", args.logins)):
+            latencias, codigos = await fase(cliente, token, usuario, args.password, args.duracion, logins, args.lectores)
+            print(f"{nombre:<10}{len(latencias):>16}{percentil(latencias, 50):>9.1f}"
+                  f"{percentil(latencias, 99):>9.1f}{max(latencias):>9.1f}  {codigos or '-'}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--password", default="Carga-123456")
+    parser.add_argument("--duracion", type=float, default=10.0, help="segundos por fase")
+    parser.add_argument("--logins", type=int, default=20, help="clientes haciendo login en bucle durante la ráfaga")
+    parser.add_argument("--lectores", type=int, default=4, help="clientes consultando /me")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,39 @@
+# Corpus sintético de comprobantes generado a partir de filtros/plantillas
+import os
+from typing import Iterator, Tuple
+import cv2
+import numpy as np
+from filtros.filtro_pixeles import listar_plantillas
+
+ESCALAS = (0.75, 1.25)
+CALIDADES_JPEG = (90, 70, 50)
+
+def _jpeg(imagen: np.ndarray, calidad: int = 95) -> bytes:
+    return cv2.imencode(".jpg", imagen, [cv2.IMWRITE_JPEG_QUALITY, calidad])[1].tobytes()
+
+def _alterar(imagen: np.ndarray) -> np.ndarray:
+    # Simula una edición: tapa una franja del cuadro blanco y escribe otro monto encima
+    alterada = imagen.copy()
+    h, w = alterada.shape[:2]
+    y0, y1 = int(h * 0.28), int(h * 0.34)
+    cv2.rectangle(alterada, (int(w * 0.08), y0), (int(w * 0.6), y1), (255, 255, 255), -1)
+    cv2.putText(alterada, "S/ 499", (int(w * 0.1), y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, w / 600, (40, 40, 40), 3)
+    return alterada
+
+def generar_corpus() -> Iterator[Tuple[str, str, bytes]]:
+    """Genera (nombre, tipo, bytes JPEG). tipo es 'original', 'escalada', 'recomprimida', 'recortada' o 'alterada'."""
+    for ruta in sorted(listar_plantillas()):
+        base = os.path.splitext(os.path.basename(ruta))[0]
+        imagen = cv2.imread(ruta)
+        if imagen is None:
+            continue
+        h, w = imagen.shape[:2]
+        yield f"{base}", "original", _jpeg(imagen)
+        for escala in ESCALAS:
+            escalada = cv2.resize(imagen, None, fx=escala, fy=escala, interpolation=cv2.INTER_AREA)
+            yield f"{base}_x{escala}", "escalada", _jpeg(escalada)
+        for calidad in CALIDADES_JPEG:
+            yield f"{base}_q{calidad}", "recomprimida", _jpeg(imagen, calidad)
+        recortada = imagen[int(h * 0.03):int(h * 0.97), int(w * 0.03):int(w * 0.97)]
+        yield f"{base}_recorte", "recortada", _jpeg(recortada)
+        yield f"{base}_alterada", "alterada", _jpeg(_alterar(imagen))
@@ -0,0 +1,89 @@
+# Corpus sintético de respuestas OCR (texto + overlay) de comprobantes Yape
+import random
+from typing import Dict, Iterator, List, Tuple
+
+SEMILLA = 7
+CASOS = 200
+
+NOMBRES = ["Juan Perez", "Maria Lopez Diaz", "Rosa", "J. Quispe", "Ana Maria Torres Ruiz", "Luis A. Rojas", "Pedro 2 Ramos"]
+MESES = ["ene", "feb.", "mar", "abril", "may.", "jun", "jul", "ago.", "sept.", "oct", "nov", "dic", "xyz"]
+COMENTARIOS = ["Pago de almuerzo", "gracias", "Destino final", "", "Cuota de marzo 2024", "Yape de prueba"]
+DESTINOS = ["Yape", "Plin", "Caja Arequipa", "Banco de la Nación", "BCP"]
+
+def _monto(rnd: random.Random) -> str:
+    valor = rnd.choice(["25.50", "40", "0", "750.00", "499.99", "12.5", "3"])
+    return rnd.choice(["S/ {}", "S/{}", "{}", "S/ {}", "S/\n{}"]).format(valor)
+
+def _fecha(rnd: random.Random) -> str:
+    dia = rnd.choice(["12", "3", "31", "29"])
+    anio = rnd.choice(["2023", "2024", "2099"])
+    mes = rnd.choice(MESES)
+    return rnd.choice(["{} {} {} - 03:15 pm", "{} {} {} 10:05 a. m.", "{} {} {}", "{} {} {} - 9:00 am"]).format(dia, mes, anio)
+
+def _texto(rnd: random.Random, estructura: int) -> Tuple[List[str], str, str]:
+    destino = rnd.choice(DESTINOS)
+    codigo = "".join(rnd.choice("0123456789") for _ in range(3))
+    lineas = ["¡Yapeaste!" if estructura == 1 else "¡Te Yapearon!"]
+    lineas += _monto(rnd).split("\n")
+    if rnd.random() < 0.85:
+        lineas.append(rnd.choice(NOMBRES))
+    if rnd.random() < 0.9:
+        lineas.append(_fecha(rnd))
+    comentario = rnd.choice(COMENTARIOS)
+    if comentario:
+        lineas.append(comentario)
+    lineas += ["CÓDIGO DE SEGURIDAD", "DATOS DE LA TRANSACCIÓN", "Nro. de celular"]
+    if rnd.random() < 0.7:
+        lineas.append(rnd.choice(["*** *** 123", "****** 456", "******789", "**** 12"]))
+    lineas += ["Destino", destino, "Nro. de operación"]
+    if rnd.random() < 0.85:
+        lineas.append(rnd.choice(["12345678", "00981234", "1234567", "123456789"]))
+    return lineas, codigo, destino
+
+def _palabra(rnd: random.Random, texto: str, left: int, top: int) -> Dict:
+    palabra = {"WordText": texto, "Left": left, "Top": top, "Height": 30, "Width": 15 * len(texto)}
+    defecto = rnd.random()
+    # Variantes que aparecen en respuestas reales o malformadas del OCR
+    if defecto < 0.05:
+        del palabra["Width"]
+    elif defecto < 0.08:
+        palabra["Left"] = f"{left}.5"
+    elif defecto < 0.15:
+        palabra["Top"] = float(top)
+    elif defecto < 0.20:
+        palabra["Left"] = str(left)
+    return palabra
+
+def _overlay(rnd: random.Random, lineas_texto: List[str], codigo: str, destino: str) -> List[Dict]:
+    lineas = []
+    top = 100
+    for linea in lineas_texto:
+        if linea in ("Destino", destino):
+            continue
+        palabras, left = [], 40
+        for texto in linea.split():
+            palabras.append(_palabra(rnd, texto, left, top))
+            left += 15 * len(texto) + 12
+        if linea == "CÓDIGO DE SEGURIDAD":
+            # Los dígitos del código van a la derecha, a la misma altura (con algo de desvío)
+            for digito in codigo:
+                palabras.append(_palabra(rnd, digito, left, top + rnd.randint(-14, 14)))
+                left += 40
+        lineas.append({"Words": palabras})
+        top += 52
+    fila = [_palabra(rnd, "Destino", 40, top)]
+    left = 400
+    for texto in destino.split():
+        fila.append(_palabra(rnd, rnd.choice([texto, " " + texto]), left, top + rnd.randint(-12, 12)))
+        left += 15 * len(texto) + 12
+    lineas.append({"Words": fila})
+    rnd.shuffle(lineas)
+    return lineas
+
+def generar_casos_ocr(casos: int = CASOS, semilla: int = SEMILLA) -> Iterator[Tuple[str, List[Dict]]]:
+    """Genera (texto, lineas_overlay) con la forma de ParsedText / TextOverlay.Lines de OCR.space."""
+    rnd = random.Random(semilla)
+    for _ in range(casos):
+        estructura = rnd.choice([1, 2])
+        lineas_texto, codigo, destino = _texto(rnd, estructura)
+        yield "\n".join(lineas_texto), _overlay(rnd, lineas_texto, codigo, destino)
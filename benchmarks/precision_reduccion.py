@@ -0,0 +1,53 @@
+# Regresión de precisión: puntajes a resolución completa vs decodificación reducida
+# Uso (desde la raíz del repo): python -m benchmarks.precision_reduccion
+# Sale con código 1 si algún filtro se desvía más de la tolerancia o cambia de veredicto.
+import sys
+import time
+import cv2
+import numpy as np
+from benchmarks.corpus import generar_corpus
+from filtros.imagen import decodificar_imagen
+from filtros.filtro_histograma import analizar_histograma, REDUCCION_DECODIFICACION as REDUCCION_HISTOGRAMA
+from filtros.filtro_yape import REDUCCION_DECODIFICACION as REDUCCION_YAPE
+
+TOLERANCIA_HISTOGRAMA = 0.5   # puntos de similitud
+TOLERANCIA_YAPE = 0.01        # proporción de píxeles
+
+def proporciones_yape(bgr):
+    hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
+    total = hsv.shape[0] * hsv.shape[1]
+    morado = cv2.countNonZero(cv2.inRange(hsv, np.array([120, 50, 50]), np.array([160, 255, 255]))) / total
+    blanco = cv2.countNonZero(cv2.inRange(hsv, np.array([0, 0, 200]), np.array([180, 30, 255]))) / total
+    return morado, blanco
+
+def cronometrar(funcion, *args):
+    inicio = time.perf_counter()
+    resultado = funcion(*args)
+    return resultado, (time.perf_counter() - inicio) * 1000
+
+def main():
+    fallos = 0
+    print(f"{'imagen':<22}{'filtro':>12}{'completa':>12}{'reducida':>12}{'ms compl.':>11}{'ms red.':>9}")
+    for nombre, _, contenido in generar_corpus():
+        completa, ms_c = cronometrar(decodificar_imagen, contenido)
+        reducida, ms_r = cronometrar(decodificar_imagen, contenido, cv2.IMREAD_COLOR, REDUCCION_YAPE)
+        (m_c, b_c), (m_r, b_r) = proporciones_yape(completa), proporciones_yape(reducida)
+        desvio = max(abs(m_c - m_r), abs(b_c - b_r))
+        veredicto_c = m_c > 0.2 and b_c > 0.3
+        veredicto_r = m_r > 0.2 and b_r > 0.3
+        if desvio > TOLERANCIA_YAPE or veredicto_c != veredicto_r:
+            fallos += 1
+        print(f"{nombre:<22}{'yape':>12}{m_c:>6.3f}/{b_c:.3f}{m_r:>6.3f}/{b_r:.3f}{ms_c:>11.1f}{ms_r:>9.1f}")
+
+        bgr_r, ms_r = cronometrar(decodificar_imagen, contenido, cv2.IMREAD_COLOR, REDUCCION_HISTOGRAMA)
+        h_c = analizar_histograma(completa, bins="ninguno")
+        h_r = analizar_histograma(bgr_r, bins="ninguno")
+        if abs(h_c["similitud"] - h_r["similitud"]) > TOLERANCIA_HISTOGRAMA or h_c["advertencia"] != h_r["advertencia"]:
+            fallos += 1
+        print(f"{nombre:<22}{'histograma':>12}{h_c['similitud']:>12.2f}{h_r['similitud']:>12.2f}{ms_c:>11.1f}{ms_r:>9.1f}")
+
+    print("OK" if not fallos else f"{fallos} desviaciones fuera de tolerancia")
+    return 1 if fallos else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,304 @@
+# Suite de benchmarks: latencia por filtro (llamada directa y vía la app ASGI), throughput y RSS pico
+# Uso (desde la raíz del repo): python -m benchmarks.suite [--repeticiones 3] [--concurrencia 4] [--ocr]
+#                                   [--salida reporte.json] [--comparar anterior.json] [--tolerancia 20]
+# El corpus es determinista (benchmarks/corpus.py) y el reporte JSON tiene claves ordenadas: dos reportes
+# de commits distintos se comparan con --comparar (o con diff). Los filtros con OCR solo corren con --ocr.
+import os
+
+# Sin índices de MongoDB al arrancar, cachés ni huellas: cada repetición mide el trabajo completo
+os.environ.setdefault("MONGO_CREAR_INDICES", "0")
+os.environ.setdefault("OCR_CACHE_TAMANO", "0")
+os.environ.setdefault("HUELLAS_ACTIVAS", "0")
+os.environ.setdefault("VEREDICTOS_CACHE_TAMANO", "0")
+
+import argparse
+import asyncio
+import hashlib
+import json
+import platform
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+import cv2
+import httpx
+import numpy as np
+from benchmarks.corpus import generar_corpus
+from filtros.filtro_pixeles import analizar_pixeles
+from filtros.filtro_verificar import FILTROS, verificar_imagen
+from filtros.imagen import ImagenDecodificada
+from main import app
+
+VERSION_REPORTE = 1
+RUTAS = {
+    "filter_yape": "/filter_yape",
+    "filtro_pixeles": "/filtro_pixeles",
+    "filtro_exif": "/filtro_exif",
+    "filtro_ruido": "/filtro_ruido",
+    "histograma": "/histograma",
+    "logo": "/logo",
+    "ocr": "/ocr",
+    "filtro_ocr": "/filtro_ocr",
+    "verificar": "/verificar",
+}
+FILTROS_OCR = {"ocr", "filtro_ocr", "verificar"}
+# Variables de entorno que cambian el rendimiento y se guardan en el reporte (nunca claves ni URIs)
+PREFIJOS_ENTORNO = ("OCR_", "EJECUTOR_", "LOGO_", "HASH_", "LOTE_", "REDUCCION_")
+SECRETOS = ("KEY", "SECRET", "TOKEN", "URI", "PASSWORD")
+
+class MuestreoRSS:
+    """RSS pico del proceso durante un bloque, muestreando /proc/self/statm. Donde no existe se usa
+    ru_maxrss, que es el pico acumulado desde el arranque."""
+
+    def __init__(self, intervalo: float = 0.005):
+        self.intervalo = intervalo
+        self.pico = 0
+        self._parar = threading.Event()
+        self._hilo = threading.Thread(target=self._muestrear, daemon=True)
+
+    @staticmethod
+    def rss_actual() -> int:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _muestrear(self):
+        while not self._parar.is_set():
+            self.pico = max(self.pico, self.rss_actual())
+            self._parar.wait(self.intervalo)
+
+    def __enter__(self):
+        self.pico = self.rss_actual()
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._hilo.join()
+        self.pico = max(self.pico, self.rss_actual())
+
+    @property
+    def pico_mb(self) -> float:
+        return round(self.pico / 2 ** 20, 1)
+
+def resumen(tiempos_ms, errores: int, duracion_s: float, rss: MuestreoRSS) -> dict:
+    tiempos = np.array(tiempos_ms or [float("nan")])
+    return {
+        "n": len(tiempos_ms),
+        "errores": errores,
+        "p50_ms": round(float(np.percentile(tiempos, 50)), 2),
+        "p90_ms": round(float(np.percentile(tiempos, 90)), 2),
+        "p99_ms": round(float(np.percentile(tiempos, 99)), 2),
+        "media_ms": round(float(tiempos.mean()), 2),
+        "max_ms": round(float(tiempos.max()), 2),
+        "throughput_rps": round(len(tiempos_ms) / duracion_s, 2) if duracion_s > 0 else None,
+        "rss_pico_mb": rss.pico_mb,
+    }
+
+def funcion_directa(nombre):
+    if nombre == "filtro_pixeles":
+        # La función de análisis, sin el pool de procesos que usa /verificar
+        return lambda img: analizar_pixeles(img.gray)
+    if nombre == "verificar":
+        return verificar_imagen
+    return FILTROS[nombre]
+
+async def medir_directo(nombre, corpus, repeticiones):
+    funcion = funcion_directa(nombre)
+    tiempos, errores = [], 0
+    with MuestreoRSS() as rss:
+        inicio_fase = time.perf_counter()
+        for _ in range(repeticiones):
+            for _, _, contenido in corpus:
+                # Imagen nueva en cada llamada: las representaciones derivadas (gris, HSV...) cuentan en el filtro
+                img = ImagenDecodificada(contenido)
+                inicio = time.perf_counter()
+                try:
+                    resultado = funcion(img)
+                    if asyncio.iscoroutine(resultado):
+                        await resultado
+                except Exception:
+                    errores += 1
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+        duracion = time.perf_counter() - inicio_fase
+    return resumen(tiempos, errores, duracion, rss)
+
+def medir_decodificacion(corpus, repeticiones):
+    tiempos = []
+    with MuestreoRSS() as rss:
+        inicio_fase = time.perf_counter()
+        for _ in range(repeticiones):
+            for _, _, contenido in corpus:
+                inicio = time.perf_counter()
+                ImagenDecodificada(contenido)
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+        duracion = time.perf_counter() - inicio_fase
+    return resumen(tiempos, 0, duracion, rss)
+
+async def _peticion(cliente, ruta, nombre, contenido):
+    inicio = time.perf_counter()
+    try:
+        r = await cliente.post(ruta, files={"file": (f"{nombre}.jpg", contenido, "image/jpeg")})
+        ok = r.status_code == 200
+    except httpx.HTTPError:
+        ok = False
+    return (time.perf_counter() - inicio) * 1000, ok
+
+async def medir_asgi(cliente, ruta, corpus, repeticiones, concurrencia):
+    trabajos = [(nombre, contenido) for _ in range(repeticiones) for nombre, _, contenido in corpus]
+    # Secuencial: latencia sin contención
+    tiempos, errores = [], 0
+    with MuestreoRSS() as rss:
+        inicio_fase = time.perf_counter()
+        for nombre, contenido in trabajos:
+            ms, ok = await _peticion(cliente, ruta, nombre, contenido)
+            tiempos.append(ms)
+            errores += not ok
+        duracion = time.perf_counter() - inicio_fase
+    secuencial = resumen(tiempos, errores, duracion, rss)
+
+    # Concurrente: throughput con `concurrencia` clientes
+    pendientes = iter(trabajos)
+    tiempos_c, errores_c = [], 0
+
+    async def cliente_carga():
+        nonlocal errores_c
+        for nombre, contenido in pendientes:
+            ms, ok = await _peticion(cliente, ruta, nombre, contenido)
+            tiempos_c.append(ms)
+            errores_c += not ok
+
+    with MuestreoRSS() as rss_c:
+        inicio_fase = time.perf_counter()
+        await asyncio.gather(*(cliente_carga() for _ in range(concurrencia)))
+        duracion = time.perf_counter() - inicio_fase
+    concurrente = resumen(tiempos_c, errores_c, duracion, rss_c)
+    return {"secuencial": secuencial, "concurrente": concurrente}
+
+def _git(*args) -> str:
+    try:
+        return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def entorno() -> dict:
+    variables = {
+        k: v for k, v in sorted(os.environ.items())
+        if k.startswith(PREFIJOS_ENTORNO) and not any(s in k for s in SECRETOS)
+    }
+    return {
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "variables": variables,
+    }
+
+async def ejecutar(args) -> dict:
+    corpus = list(generar_corpus())
+    huella = hashlib.sha256()
+    for nombre, _, contenido in corpus:
+        huella.update(nombre.encode())
+        huella.update(contenido)
+    filtros = [f for f in RUTAS if args.ocr or f not in FILTROS_OCR]
+    if args.filtros:
+        filtros = [f for f in filtros if f in args.filtros.split(",")]
+
+    reporte = {
+        "version": VERSION_REPORTE,
+        "commit": (_git("rev-parse", "--short", "HEAD") or "desconocido") + ("+cambios" if _git("status", "--porcelain", "--untracked-files=no") else ""),
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "entorno": entorno(),
+        "parametros": {"repeticiones": args.repeticiones, "concurrencia": args.concurrencia, "ocr": args.ocr, "filtros": filtros},
+        "corpus": {"imagenes": len(corpus), "huella": huella.hexdigest()[:16]},
+        "directo": {},
+        "asgi": {},
+    }
+
+    async with app.router.lifespan_context(app):
+        # Calentamiento: plantillas, logo, pools y backends listos antes de medir
+        for nombre in filtros:
+            await medir_directo(nombre, corpus[:1], 1)
+        reporte["directo"]["decodificacion"] = medir_decodificacion(corpus, args.repeticiones)
+        for nombre in filtros:
+            reporte["directo"][nombre] = await medir_directo(nombre, corpus, args.repeticiones)
+            print(f"directo {nombre}: p50 {reporte['directo'][nombre]['p50_ms']} ms", file=sys.stderr)
+
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=None) as cliente:
+            for nombre in filtros:
+                nombre_img, _, contenido = corpus[0]
+                await _peticion(cliente, RUTAS[nombre], nombre_img, contenido)
+                reporte["asgi"][nombre] = await medir_asgi(cliente, RUTAS[nombre], corpus, args.repeticiones, args.concurrencia)
+                print(f"asgi {nombre}: p50 {reporte['asgi'][nombre]['secuencial']['p50_ms']} ms", file=sys.stderr)
+    reporte["rss_pico_total_mb"] = round(max(
+        [r["rss_pico_mb"] for r in reporte["directo"].values()]
+        + [r[m]["rss_pico_mb"] for r in reporte["asgi"].values() for m in ("secuencial", "concurrente")]
+    ), 1)
+    return reporte
+
+def imprimir(reporte: dict):
+    print(f"commit {reporte['commit']}  corpus {reporte['corpus']['imagenes']} imágenes ({reporte['corpus']['huella']})")
+    print(f"{'modo':<9}{'filtro':<16}{'n':>5}{'err':>5}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'req/s':>8}{'RSS MB':>8}")
+    filas = [("directo", k, v) for k, v in reporte["directo"].items()]
+    filas += [(f"asgi/{m[:3]}", k, v[m]) for k, v in reporte["asgi"].items() for m in ("secuencial", "concurrente")]
+    for modo, nombre, r in filas:
+        print(f"{modo:<9}{nombre:<16}{r['n']:>5}{r['errores']:>5}{r['p50_ms']:>9.1f}{r['p90_ms']:>9.1f}{r['p99_ms']:>9.1f}"
+              f"{r['throughput_rps'] or 0:>8.1f}{r['rss_pico_mb']:>8.1f}")
+
+def _metricas_planas(reporte: dict) -> dict:
+    planas = {("directo", k): v for k, v in reporte.get("directo", {}).items()}
+    for k, v in reporte.get("asgi", {}).items():
+        for modo in ("secuencial", "concurrente"):
+            planas[(f"asgi/{modo[:3]}", k)] = v[modo]
+    return planas
+
+def comparar(anterior: dict, actual: dict, tolerancia: float) -> int:
+    """Imprime la variación de p50, p99 y throughput; 1 si algún p50 empeora más de `tolerancia` %."""
+    if anterior.get("corpus", {}).get("huella") != actual["corpus"]["huella"]:
+        print("Aviso: los corpus difieren (otra versión de OpenCV o de benchmarks/corpus.py)")
+    for parametro in ("repeticiones", "concurrencia"):
+        if anterior.get("parametros", {}).get(parametro) != actual["parametros"][parametro]:
+            print(f"Aviso: {parametro} distinto ({anterior.get('parametros', {}).get(parametro)} vs {actual['parametros'][parametro]})")
+    previas, nuevas = _metricas_planas(anterior), _metricas_planas(actual)
+    print(f"\n{anterior.get('commit')} -> {actual['commit']}")
+    print(f"{'modo':<9}{'filtro':<16}{'p50 antes':>10}{'p50 ahora':>10}{'p50 %':>8}{'p99 %':>8}{'req/s %':>9}")
+    regresiones = []
+    for clave in sorted(set(previas) & set(nuevas)):
+        a, n = previas[clave], nuevas[clave]
+        variacion = lambda campo: (n[campo] - a[campo]) / a[campo] * 100 if a.get(campo) else float("nan")
+        p50 = variacion("p50_ms")
+        if p50 > tolerancia:
+            regresiones.append(clave)
+        print(f"{clave[0]:<9}{clave[1]:<16}{a['p50_ms']:>10.1f}{n['p50_ms']:>10.1f}{p50:>+8.1f}{variacion('p99_ms'):>+8.1f}"
+              f"{variacion('throughput_rps'):>+9.1f}")
+    if regresiones:
+        print(f"p50 más de {tolerancia:.0f}% peor en: {', '.join('/'.join(c) for c in regresiones)}")
+    return 1 if regresiones else 0
+
+def main(args) -> int:
+    reporte = asyncio.run(ejecutar(args))
+    imprimir(reporte)
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump(reporte, f, ensure_ascii=False, indent=1, sort_keys=True)
+    print(f"Reporte guardado en {args.salida}")
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            return comparar(json.load(f), reporte, args.tolerancia)
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeticiones", type=int, default=3, help="pasadas sobre el corpus por filtro")
+    parser.add_argument("--concurrencia", type=int, default=4, help="clientes simultáneos en la fase de throughput ASGI")
+    parser.add_argument("--ocr", action="store_true", help="incluye ocr, filtro_ocr y verificar (usan el backend OCR_BACKEND)")
+    parser.add_argument("--filtros", default="", help="lista separada por comas; por defecto todos")
+    parser.add_argument("--salida", default="reporte_benchmark.json")
+    parser.add_argument("--comparar", default="", help="reporte anterior contra el que comparar")
+    parser.add_argument("--tolerancia", type=float, default=20.0, help="%% de empeoramiento del p50 que hace fallar la comparación")
+    sys.exit(main(parser.parse_args()))
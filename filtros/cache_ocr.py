@@ -0,0 +1,122 @@
+# Caché de respuestas OCR por contenido
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from fastapi import APIRouter
+from bd import ocr_cache_coll
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+OCR_CACHE_TAMANO = int(os.getenv("OCR_CACHE_TAMANO", "512"))
+OCR_CACHE_TTL = float(os.getenv("OCR_CACHE_TTL", "86400"))
+OCR_CACHE_MONGO = os.getenv("OCR_CACHE_MONGO", "0") == "1"
+OCR_CACHE_MONGO_TIMEOUT = float(os.getenv("OCR_CACHE_MONGO_TIMEOUT", "0.5"))
+
+def clave_ocr(contenido: bytes, datos: Dict[str, str]) -> str:
+    """SHA-256 de los bytes enviados al OCR más los parámetros del motor (sin la apikey)."""
+    h = hashlib.sha256(contenido)
+    for campo in sorted(datos):
+        if campo != "apikey":
+            h.update(f"\0{campo}={datos[campo]}".encode())
+    return h.hexdigest()
+
+class CacheOCR:
+    """LRU con TTL en memoria y, opcionalmente, una segunda capa en MongoDB (colección ocr_cache)."""
+
+    def __init__(self, tamano: int = OCR_CACHE_TAMANO, ttl: float = OCR_CACHE_TTL,
+                 mongo: bool = OCR_CACHE_MONGO, coleccion=ocr_cache_coll):
+        self.tamano = tamano
+        self.ttl = ttl
+        self.mongo = mongo
+        self.coleccion = coleccion
+        self._entradas: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.aciertos_mongo = 0
+        self.fallos = 0
+
+    def _guardar_local(self, clave: str, respuesta: Dict, expira: float):
+        with self._lock:
+            self._entradas[clave] = (expira, respuesta)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.tamano:
+                self._entradas.popitem(last=False)
+
+    def _obtener_local(self, clave: str) -> Optional[Dict]:
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return None
+            expira, respuesta = entrada
+            if expira < time.monotonic():
+                del self._entradas[clave]
+                return None
+            self._entradas.move_to_end(clave)
+            return respuesta
+
+    async def obtener(self, clave: str) -> Optional[Dict]:
+        respuesta = self._obtener_local(clave)
+        if respuesta is not None:
+            self.aciertos += 1
+            return respuesta
+        if self.mongo:
+            try:
+                doc = await asyncio.wait_for(
+                    self.coleccion.find_one({"_id": clave, "expira": {"$gt": datetime.utcnow()}}),
+                    OCR_CACHE_MONGO_TIMEOUT
+                )
+            except Exception as e:
+                logger.warning("Caché OCR en MongoDB no disponible: %s", e)
+                doc = None
+            if doc:
+                restante = (doc["expira"] - datetime.utcnow()).total_seconds()
+                self._guardar_local(clave, doc["respuesta"], time.monotonic() + restante)
+                self.aciertos_mongo += 1
+                return doc["respuesta"]
+        self.fallos += 1
+        return None
+
+    async def guardar(self, clave: str, respuesta: Dict):
+        self._guardar_local(clave, respuesta, time.monotonic() + self.ttl)
+        if self.mongo:
+            try:
+                await asyncio.wait_for(
+                    self.coleccion.update_one(
+                        {"_id": clave},
+                        {"$set": {"respuesta": respuesta, "expira": datetime.utcnow() + timedelta(seconds=self.ttl)}},
+                        upsert=True
+                    ),
+                    OCR_CACHE_MONGO_TIMEOUT
+                )
+            except Exception as e:
+                logger.warning("No se pudo guardar en la caché OCR de MongoDB: %s", e)
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def estadisticas(self) -> Dict:
+        consultas = self.aciertos + self.aciertos_mongo + self.fallos
+        return {
+            "entradas": len(self._entradas),
+            "tamano_maximo": self.tamano,
+            "ttl_segundos": self.ttl,
+            "mongo": self.mongo,
+            "aciertos": self.aciertos,
+            "aciertos_mongo": self.aciertos_mongo,
+            "fallos": self.fallos,
+            "tasa_aciertos": round((self.aciertos + self.aciertos_mongo) / consultas, 4) if consultas else 0.0
+        }
+
+cache_ocr = CacheOCR()
+
+@router.get("/ocr/cache")
+async def estadisticas_cache_ocr():
+    return cache_ocr.estadisticas()
@@ -0,0 +1,109 @@
+# Memoización de veredictos completos y de la respuesta de cada filtro por contenido de la subida
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from fastapi import APIRouter
+from filtros.cliente_ocr import OCR_BACKEND
+from filtros.ejecutor import en_hilos
+from filtros.preprocesado_ocr import OCR_PREPROCESADO
+from filtros.recursos import version_recursos
+
+router = APIRouter()
+
+VEREDICTOS_CACHE_TAMANO = int(os.getenv("VEREDICTOS_CACHE_TAMANO", "1024"))
+VEREDICTOS_CACHE_TTL = float(os.getenv("VEREDICTOS_CACHE_TTL", "3600"))
+# Subir al cambiar la lógica de algún filtro: invalida los veredictos memorizados
+VERSION_FILTROS = "3"
+
+def version_cache() -> str:
+    """Incluye la huella de mtimes de plantillas y logo (revisada como mucho cada RECURSOS_REVISION_SEGUNDOS)."""
+    return f"{VERSION_FILTROS}:{OCR_BACKEND}:{OCR_PREPROCESADO}:{version_recursos()}"
+
+class CacheVeredictos:
+    """LRU con TTL en memoria: "ruta:sha256" de la subida -> respuesta. Las entradas de otra
+    versión de plantillas/logo se descartan en bloque al detectar el cambio."""
+
+    def __init__(self, tamano: int = VEREDICTOS_CACHE_TAMANO, ttl: float = VEREDICTOS_CACHE_TTL):
+        self.tamano = tamano
+        self.ttl = ttl
+        self.version: Optional[str] = None
+        self._entradas: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.invalidaciones = 0
+
+    def _comprobar_version(self):
+        version = version_cache()
+        if version != self.version:
+            if self._entradas:
+                self.invalidaciones += 1
+            self._entradas.clear()
+            self.version = version
+
+    def obtener(self, clave: str) -> Optional[Any]:
+        if self.tamano <= 0:
+            return None
+        with self._lock:
+            self._comprobar_version()
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada[0] < time.monotonic():
+                del self._entradas[clave]
+                entrada = None
+            if entrada is None:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[1]
+
+    def guardar(self, clave: str, respuesta: Any):
+        if self.tamano <= 0:
+            return
+        with self._lock:
+            self._comprobar_version()
+            self._entradas[clave] = (time.monotonic() + self.ttl, respuesta)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.tamano:
+                self._entradas.popitem(last=False)
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def estadisticas(self) -> Dict:
+        consultas = self.aciertos + self.fallos
+        return {
+            "entradas": len(self._entradas),
+            "tamano_maximo": self.tamano,
+            "ttl_segundos": self.ttl,
+            "version": self.version,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "invalidaciones": self.invalidaciones,
+            "tasa_aciertos": round(self.aciertos / consultas, 4) if consultas else 0.0
+        }
+
+cache_veredictos = CacheVeredictos()
+
+def _sha256(contenido: bytes) -> str:
+    return hashlib.sha256(contenido).hexdigest()
+
+async def memorizar(ruta: str, contenido: bytes, calcular: Callable[[], Awaitable[Any]], parametros: str = "") -> Any:
+    """Respuesta de un filtro individual memorizada por ruta, parámetros y sha256 de la subida.
+    Las excepciones (HTTPException incluidas) no se memorizan; el resultado no debe mutarse."""
+    if cache_veredictos.tamano <= 0:
+        return await calcular()
+    clave = f"{ruta}:{parametros}:{await en_hilos(_sha256, contenido)}"
+    resultado = cache_veredictos.obtener(clave)
+    if resultado is None:
+        resultado = await calcular()
+        cache_veredictos.guardar(clave, resultado)
+    return resultado
+
+@router.get("/verificar/cache")
+async def estadisticas_cache_veredictos():
+    return cache_veredictos.estadisticas()
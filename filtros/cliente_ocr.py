@@ -0,0 +1,231 @@
+# Cliente OCR asíncrono compartido: caché + backend intercambiable (ocr.space o motor local)
+import asyncio
+import logging
+import os
+import random
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Tuple
+import httpx
+from dotenv import load_dotenv
+from filtros.cache_ocr import cache_ocr, clave_ocr
+from metricas import medir
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+OCR_API_URL = os.getenv("OCR_API_URL", "https://api.ocr.space/parse/image")
+# Sin OCR_API_KEY el backend ocr.space queda deshabilitado: responde 503 sin llamar a la API
+OCR_API_KEY = os.getenv("OCR_API_KEY")
+OCR_MAX_CONCURRENCIA = int(os.getenv("OCR_MAX_CONCURRENCIA", "4"))
+OCR_TIMEOUT = float(os.getenv("OCR_TIMEOUT", "30"))
+OCR_REINTENTOS = int(os.getenv("OCR_REINTENTOS", "2"))
+OCR_FALLOS_CIRCUITO = int(os.getenv("OCR_FALLOS_CIRCUITO", "5"))
+OCR_ENFRIAMIENTO = float(os.getenv("OCR_ENFRIAMIENTO", "30"))
+# "ocrspace" (API remota) o "local" (Tesseract en proceso, ver filtros/ocr_local.py)
+OCR_BACKEND = os.getenv("OCR_BACKEND", "ocrspace")
+
+class OCRError(Exception):
+    def __init__(self, mensaje: str, status_code: Optional[int] = None):
+        super().__init__(mensaje)
+        self.status_code = status_code
+
+class OCRTimeout(OCRError):
+    pass
+
+class OCRNoDisponible(OCRError):
+    pass
+
+class BackendOCR(ABC):
+    """Motor OCR. reconocer() devuelve un dict con la forma de la respuesta de ocr.space:
+    IsErroredOnProcessing y ParsedResults[0] con ParsedText y TextOverlay.Lines[].Words[]
+    (WordText, Left, Top, Width, Height), que es lo que leen filtro_ocr y filtro_claves."""
+
+    nombre = ""
+
+    @abstractmethod
+    async def reconocer(self, archivo: Tuple[str, bytes, str], datos: Dict[str, str], timeout: Optional[float] = None) -> Dict:
+        ...
+
+    async def cerrar(self):
+        pass
+
+class BackendOCRSpace(BackendOCR):
+    """API de ocr.space: httpx con keep-alive, concurrencia acotada, reintentos con jitter y circuit breaker."""
+
+    nombre = "ocrspace"
+
+    def __init__(
+        self,
+        url: str = OCR_API_URL,
+        api_key: Optional[str] = OCR_API_KEY,
+        max_concurrencia: int = OCR_MAX_CONCURRENCIA,
+        timeout: float = OCR_TIMEOUT,
+        reintentos: int = OCR_REINTENTOS,
+        fallos_circuito: int = OCR_FALLOS_CIRCUITO,
+        enfriamiento: float = OCR_ENFRIAMIENTO,
+        backoff_base: float = 0.5,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.url = url
+        self.api_key = api_key
+        self.max_concurrencia = max_concurrencia
+        self.timeout = timeout
+        self.reintentos = reintentos
+        self.fallos_circuito = fallos_circuito
+        self.enfriamiento = enfriamiento
+        self.backoff_base = backoff_base
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaforo: Optional[asyncio.Semaphore] = None
+        self._fallos_consecutivos = 0
+        self._abierto_hasta = 0.0
+        self._sondeando = False
+
+    def _obtener_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            limites = httpx.Limits(
+                max_connections=self.max_concurrencia,
+                max_keepalive_connections=self.max_concurrencia
+            )
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=limites, transport=self.transport)
+            self._semaforo = asyncio.Semaphore(self.max_concurrencia)
+        return self._client
+
+    @property
+    def circuito_abierto(self) -> bool:
+        return time.monotonic() < self._abierto_hasta
+
+    def _iniciar_intento(self) -> bool:
+        """False si el circuito no deja pasar el intento. Pasado el enfriamiento (semiabierto) pasa una sola
+        sonda a la vez: si falla se vuelve a abrir, si responde se cierra."""
+        if self.circuito_abierto:
+            return False
+        if self._fallos_consecutivos >= self.fallos_circuito:
+            if self._sondeando:
+                return False
+            self._sondeando = True
+        return True
+
+    def _registrar_fallo(self):
+        self._fallos_consecutivos += 1
+        if self._fallos_consecutivos >= self.fallos_circuito:
+            self._abierto_hasta = time.monotonic() + self.enfriamiento
+
+    def _registrar_exito(self):
+        self._fallos_consecutivos = 0
+        self._abierto_hasta = 0.0
+
+    async def reconocer(self, archivo: Tuple[str, bytes, str], datos: Dict[str, str], timeout: Optional[float] = None) -> Dict:
+        if not self.api_key:
+            raise OCRNoDisponible("OCR externo deshabilitado: falta configurar OCR_API_KEY", 503)
+        client = self._obtener_client()
+        datos = {"apikey": self.api_key, **datos}
+        ultimo_error: OCRError = OCRError("Error llamando al OCR externo")
+        for intento in range(self.reintentos + 1):
+            if intento:
+                await asyncio.sleep(random.uniform(0, self.backoff_base * 2 ** intento))
+            sonda = self._fallos_consecutivos >= self.fallos_circuito
+            if not self._iniciar_intento():
+                raise OCRNoDisponible("El OCR externo no está disponible temporalmente", 503)
+            try:
+                async with self._semaforo:
+                    response = await client.post(self.url, files={"file": archivo}, data=datos, timeout=timeout or self.timeout)
+            except httpx.TimeoutException:
+                ultimo_error = OCRTimeout("El OCR externo tardó demasiado (timeout).", 504)
+                self._registrar_fallo()
+                continue
+            except httpx.TransportError as e:
+                ultimo_error = OCRError(f"Error llamando al OCR externo: {e}", 502)
+                self._registrar_fallo()
+                continue
+            finally:
+                if sonda:
+                    self._sondeando = False
+            if response.status_code >= 500 or response.status_code == 429:
+                ultimo_error = OCRError(f"OCR externo respondió mal: {response.status_code}", 502)
+                self._registrar_fallo()
+                continue
+            if response.status_code != 200:
+                raise OCRError(f"OCR externo respondió mal: {response.status_code}", 502)
+            self._registrar_exito()
+            try:
+                return response.json()
+            except ValueError:
+                raise OCRError("El OCR externo devolvió una respuesta inválida", 502)
+        raise ultimo_error
+
+    async def cerrar(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+class _LlamadaEnCurso:
+    """Una llamada al backend compartida por quienes la esperan; se cancela solo si la abandonan todos."""
+
+    def __init__(self, tarea: asyncio.Future):
+        self.tarea = tarea
+        self.esperando = 0
+
+    async def esperar(self) -> Dict:
+        self.esperando += 1
+        try:
+            return await asyncio.shield(self.tarea)
+        except asyncio.CancelledError:
+            if self.esperando == 1:
+                self.tarea.cancel()
+            raise
+        finally:
+            self.esperando -= 1
+
+def crear_backend(nombre: str = OCR_BACKEND) -> BackendOCR:
+    if nombre == "local":
+        from filtros.ocr_local import BackendOCRLocal
+        return BackendOCRLocal()
+    if nombre == "ocrspace":
+        if not OCR_API_KEY:
+            logger.warning("OCR_API_KEY no configurada: el OCR externo (ocr.space) queda deshabilitado")
+        return BackendOCRSpace()
+    raise ValueError(f"OCR_BACKEND desconocido: {nombre}")
+
+class ClienteOCR:
+    """Punto de entrada de los filtros: caché por contenido delante del backend configurado."""
+
+    def __init__(self, backend: Optional[BackendOCR] = None):
+        self.backend = backend or crear_backend()
+        # Llamadas en curso por clave: dos filtros que piden lo mismo a la vez comparten una sola llamada
+        self._en_curso: Dict[str, "_LlamadaEnCurso"] = {}
+
+    async def enviar(self, archivo: Tuple[str, bytes, str], datos: Dict[str, str], timeout: Optional[float] = None,
+                     usar_cache: bool = True) -> Dict:
+        """Envía una imagen al OCR y devuelve el JSON de respuesta. Lanza OCRTimeout, OCRNoDisponible u OCRError.
+        Las respuestas correctas se guardan en cache_ocr por hash de los bytes, parámetros y backend; pedidos
+        iguales simultáneos esperan la misma llamada."""
+        if not usar_cache:
+            return await self._reconocer(archivo, datos, timeout)
+        clave = clave_ocr(archivo[1], {**datos, "backend": self.backend.nombre})
+        respuesta = await cache_ocr.obtener(clave)
+        if respuesta is not None:
+            return respuesta
+        llamada = self._en_curso.get(clave)
+        if llamada is None:
+            llamada = _LlamadaEnCurso(asyncio.ensure_future(self._reconocer_y_guardar(clave, archivo, datos, timeout)))
+            self._en_curso[clave] = llamada
+            llamada.tarea.add_done_callback(lambda _: self._en_curso.pop(clave, None) if self._en_curso.get(clave) is llamada else None)
+        return await llamada.esperar()
+
+    async def _reconocer_y_guardar(self, clave: str, archivo: Tuple[str, bytes, str], datos: Dict[str, str],
+                                   timeout: Optional[float]) -> Dict:
+        respuesta = await self._reconocer(archivo, datos, timeout)
+        if not respuesta.get("IsErroredOnProcessing"):
+            await cache_ocr.guardar(clave, respuesta)
+        return respuesta
+
+    async def _reconocer(self, archivo: Tuple[str, bytes, str], datos: Dict[str, str], timeout: Optional[float]) -> Dict:
+        with medir(f"ocr_{self.backend.nombre}"):
+            return await self.backend.reconocer(archivo, datos, timeout)
+
+    async def cerrar(self):
+        await self.backend.cerrar()
+
+cliente_ocr = ClienteOCR()
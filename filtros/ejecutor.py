@@ -0,0 +1,124 @@
+# Ejecutores para el trabajo de CPU de los filtros
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, Optional
+from fastapi import HTTPException
+from metricas import ejecutar_con_etapas, registrar_etapas
+
+EJECUTOR_HILOS = int(os.getenv("EJECUTOR_HILOS", str(os.cpu_count() or 4)))
+EJECUTOR_PROCESOS = int(os.getenv("EJECUTOR_PROCESOS", str(os.cpu_count() or 2)))
+# Máximo de tareas en curso o en espera por pool antes de responder 503
+EJECUTOR_COLA_HILOS = int(os.getenv("EJECUTOR_COLA_HILOS", "64"))
+EJECUTOR_COLA_PROCESOS = int(os.getenv("EJECUTOR_COLA_PROCESOS", "16"))
+# Pool aparte para bcrypt: una ráfaga de logins no debe quitarle hilos a los filtros ni al resto de peticiones
+HASH_HILOS = int(os.getenv("HASH_HILOS", str(min(4, os.cpu_count() or 1))))
+HASH_COLA = int(os.getenv("HASH_COLA", "32"))
+
+class EjecutorSaturado(HTTPException):
+    def __init__(self, pool: str):
+        super().__init__(
+            status_code=503,
+            detail=f"Servidor saturado ({pool}), intente de nuevo en unos segundos",
+            headers={"Retry-After": "1"}
+        )
+
+class PoolAcotado:
+    """Pool creado bajo demanda que rechaza trabajo cuando hay demasiadas tareas pendientes."""
+
+    def __init__(self, nombre: str, crear: Callable[[], Executor], trabajadores: int, max_pendientes: int):
+        self.nombre = nombre
+        self.trabajadores = trabajadores
+        self.max_pendientes = max(trabajadores, max_pendientes)
+        self.pendientes = 0
+        self._crear = crear
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    def executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = self._crear()
+        return self._executor
+
+    def _liberar(self, _futuro=None):
+        with self._lock:
+            self.pendientes -= 1
+
+    async def ejecutar(self, funcion, *args, **kwargs):
+        with self._lock:
+            if self.pendientes >= self.max_pendientes:
+                raise EjecutorSaturado(self.nombre)
+            self.pendientes += 1
+        try:
+            futuro = self.executor().submit(partial(funcion, *args, **kwargs))
+        except BaseException:
+            self._liberar()
+            raise
+        # Se libera cuando el trabajo termina de verdad, no cuando se cancela quien lo espera:
+        # un trabajo ya en ejecución sigue ocupando el pool hasta acabar
+        futuro.add_done_callback(self._liberar)
+        return await asyncio.wrap_future(futuro)
+
+    def estado(self) -> Dict:
+        return {"trabajadores": self.trabajadores, "pendientes": self.pendientes, "max_pendientes": self.max_pendientes}
+
+    def cerrar(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+def _iniciar_trabajador():
+    # Cada proceso hijo precarga las plantillas ORB antes de su primer trabajo
+    from filtros.filtro_pixeles import cargar_plantillas
+    cargar_plantillas()
+
+pool_hilos = PoolAcotado(
+    "hilos",
+    lambda: ThreadPoolExecutor(max_workers=EJECUTOR_HILOS, thread_name_prefix="filtros"),
+    EJECUTOR_HILOS,
+    EJECUTOR_COLA_HILOS
+)
+pool_procesos = PoolAcotado(
+    "procesos",
+    lambda: ProcessPoolExecutor(
+        max_workers=EJECUTOR_PROCESOS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_iniciar_trabajador
+    ),
+    EJECUTOR_PROCESOS,
+    EJECUTOR_COLA_PROCESOS
+) if EJECUTOR_PROCESOS > 0 else pool_hilos
+pool_hash = PoolAcotado(
+    "hash",
+    lambda: ThreadPoolExecutor(max_workers=HASH_HILOS, thread_name_prefix="bcrypt"),
+    HASH_HILOS,
+    HASH_COLA
+)
+
+async def en_hilos(funcion, *args, **kwargs):
+    """Para llamadas cv2/numpy que liberan el GIL."""
+    return await pool_hilos.ejecutar(funcion, *args, **kwargs)
+
+async def en_procesos(funcion, *args, **kwargs):
+    """Para trabajo con mucho Python puro; la función y sus argumentos deben ser serializables."""
+    if pool_procesos is pool_hilos:
+        return await pool_hilos.ejecutar(funcion, *args, **kwargs)
+    # Los tiempos por etapa medidos en el proceso hijo vuelven con el resultado
+    resultado, etapas = await pool_procesos.ejecutar(ejecutar_con_etapas, funcion, *args, **kwargs)
+    registrar_etapas(etapas)
+    return resultado
+
+async def en_hash(funcion, *args, **kwargs):
+    """Para bcrypt (passlib); la extensión C libera el GIL mientras calcula."""
+    return await pool_hash.ejecutar(funcion, *args, **kwargs)
+
+def estado_ejecutores() -> Dict:
+    return {"hilos": pool_hilos.estado(), "procesos": pool_procesos.estado(), "hash": pool_hash.estado()}
+
+def cerrar_ejecutores():
+    pool_hilos.cerrar()
+    pool_procesos.cerrar()
+    pool_hash.cerrar()
@@ -1,11 +1,17 @@
-import requests
 import math
-import tempfile
-import os
-from typing import Dict, List
+from functools import lru_cache
+from typing import Dict, List, Tuple
 from fastapi import APIRouter, File, UploadFile, HTTPException
+from filtros.cache_veredictos import memorizar
+from filtros.cliente_ocr import cliente_ocr, OCRError
+from filtros.ejecutor import en_hilos
+from filtros.imagen import decodificar_imagen
+from filtros.preprocesado_ocr import DATOS_OCR, ImagenOCR, mapear_overlay, preparar_comprobante, preparar_imagen_ocr
+from metricas import contar_veredicto
 
 router = APIRouter()
+# Distancia (px) a partir de la cual la posición ya no suma en la similitud
+RADIO_POSICION = 200
 
 PLANTILLA1 = [
     {"WordText": "Yapeaste!", "Left": 85, "Top": 313},
@@ -32,24 +38,28 @@ PLANTILLA2 = [
     {"WordText": "operaci6n", "Left": 276, "Top": 1332}
 ]
 
-OCR_API_KEY = "e0b0a3ad7d88957"
-
-def ocr_api(file_path: str) -> Dict:
+async def enviar_ocr(archivo) -> Dict:
     try:
-        with open(file_path, 'rb') as f:
-            response = requests.post(
-                "https://api.ocr.space/parse/image",
-                data={
-                    'apikey': OCR_API_KEY,
-                    'language': 'spa',
-                    'isOverlayRequired': 'true'
-                },
-                files={'file': f}
-            )
-        return response.json() if response.status_code == 200 else {}
-    except:
+        return await cliente_ocr.enviar(archivo, DATOS_OCR)
+    except OCRError:
         return {}
 
+def preparar_imagen_claves(imagen) -> ImagenOCR:
+    # Mismo recorte que filtro_ocr; sin cuadro blanco claro se envía la imagen completa (con la misma reducción de color)
+    return preparar_comprobante(imagen) or preparar_imagen_ocr(imagen, recortar=False)
+
+async def ocr_imagen(imagen) -> Dict:
+    """OCR del cuadro blanco con el overlay devuelto a coordenadas de la imagen original (las de PLANTILLA1/2)."""
+    recorte = await en_hilos(preparar_imagen_claves, imagen)
+    return mapear_overlay(await enviar_ocr(recorte.archivo), recorte.transformacion)
+
+async def ocr_api_bytes(contenido: bytes, nombre: str = 'imagen.jpg') -> Dict:
+    imagen = await en_hilos(decodificar_imagen, contenido)
+    if imagen is None:
+        return await enviar_ocr((nombre, contenido, 'application/octet-stream'))
+    return await ocr_imagen(imagen)
+
+@lru_cache(maxsize=4096)
 def normalizar_texto(texto: str) -> str:
     if not texto:
         return ""
@@ -74,9 +84,48 @@ def extraer_palabras(data_ocr: Dict) -> List[Dict]:
         pass
     return palabras
 
-def calcular_similitud(plantilla: List[Dict], palabras_ocr: List[Dict]) -> float:
+@lru_cache(maxsize=16384)
+def similitud_texto(texto_plantilla: str, texto_ocr: str) -> float:
+    if texto_plantilla == texto_ocr:
+        return 1.0
+    if texto_plantilla in texto_ocr or texto_ocr in texto_plantilla:
+        return 0.8
+    comunes = set(texto_plantilla) & set(texto_ocr)
+    return len(comunes) / max(len(texto_plantilla), len(texto_ocr)) if texto_plantilla and texto_ocr else 0.0
+
+class IndicePalabras:
+    """Palabras OCR normalizadas una sola vez, agrupadas por texto y en una grilla de celdas de RADIO_POSICION px."""
+
+    def __init__(self, palabras_ocr: List[Dict]):
+        self.palabras = palabras_ocr
+        self.textos = [normalizar_texto(p['WordText']) for p in palabras_ocr]
+        # texto normalizado -> índices en orden; el primero libre es el único candidato lejano que puede ganar
+        self.por_texto: Dict[str, List[int]] = {}
+        self.grilla: Dict[Tuple[int, int], List[int]] = {}
+        for i, (palabra, texto) in enumerate(zip(palabras_ocr, self.textos)):
+            self.por_texto.setdefault(texto, []).append(i)
+            self.grilla.setdefault(self._celda(palabra['Left'], palabra['Top']), []).append(i)
+
+    def __len__(self) -> int:
+        return len(self.palabras)
+
+    @staticmethod
+    def _celda(left, top) -> Tuple[int, int]:
+        return math.floor(left / RADIO_POSICION), math.floor(top / RADIO_POSICION)
+
+    def cercanas(self, left, top) -> List[int]:
+        cx, cy = self._celda(left, top)
+        indices = []
+        for x in (cx - 1, cx, cx + 1):
+            for y in (cy - 1, cy, cy + 1):
+                indices.extend(self.grilla.get((x, y), ()))
+        return indices
+
+def calcular_similitud(plantilla: List[Dict], palabras_ocr) -> float:
+    """palabras_ocr puede ser la lista de extraer_palabras o un IndicePalabras ya construido."""
     if not plantilla or not palabras_ocr:
         return 0.0
+    indice = palabras_ocr if isinstance(palabras_ocr, IndicePalabras) else IndicePalabras(palabras_ocr)
 
     coincidencias = 0
     usadas = set()
@@ -86,71 +135,83 @@ def calcular_similitud(plantilla: List[Dict], palabras_ocr: List[Dict]) -> float
         mejor_puntuacion = 0.0
         mejor_indice = -1
 
-        for i, palabra_ocr in enumerate(palabras_ocr):
-            if i in usadas:
-                continue
-
-            texto_ocr = normalizar_texto(palabra_ocr['WordText'])
-
-            if texto_plantilla == texto_ocr:
-                sim_texto = 1.0
-            elif texto_plantilla in texto_ocr or texto_ocr in texto_plantilla:
-                sim_texto = 0.8
-            else:
-                comunes = set(texto_plantilla) & set(texto_ocr)
-                sim_texto = len(comunes) / max(len(texto_plantilla), len(texto_ocr)) if texto_plantilla and texto_ocr else 0.0
-
+        # Fuera del radio la posición no suma, así que de cada texto basta con la primera palabra libre;
+        # dentro del radio se puntúan todas. El resultado es el mismo que recorriendo todas las palabras.
+        similitudes = {}
+        candidatas = set()
+        for texto_ocr, indices in indice.por_texto.items():
+            sim_texto = similitud_texto(texto_plantilla, texto_ocr)
             if sim_texto > 0.3:
-                distancia = math.sqrt(
-                    (item_plantilla['Left'] - palabra_ocr['Left'])**2 +
-                    (item_plantilla['Top'] - palabra_ocr['Top'])**2
-                )
-                sim_posicion = max(0, (200 - distancia) / 200) if distancia <= 200 else 0.0
-                puntuacion = (sim_texto * 0.7) + (sim_posicion * 0.3)
-                if puntuacion > mejor_puntuacion:
-                    mejor_puntuacion = puntuacion
-                    mejor_indice = i
+                similitudes[texto_ocr] = sim_texto
+                primera_libre = next((i for i in indices if i not in usadas), None)
+                if primera_libre is not None:
+                    candidatas.add(primera_libre)
+        if not similitudes:
+            continue
+        for i in indice.cercanas(item_plantilla['Left'], item_plantilla['Top']):
+            if i not in usadas and indice.textos[i] in similitudes:
+                candidatas.add(i)
+
+        for i in sorted(candidatas):
+            palabra_ocr = indice.palabras[i]
+            sim_texto = similitudes[indice.textos[i]]
+            distancia = math.sqrt(
+                (item_plantilla['Left'] - palabra_ocr['Left'])**2 +
+                (item_plantilla['Top'] - palabra_ocr['Top'])**2
+            )
+            sim_posicion = max(0, (RADIO_POSICION - distancia) / RADIO_POSICION) if distancia <= RADIO_POSICION else 0.0
+            puntuacion = (sim_texto * 0.7) + (sim_posicion * 0.3)
+            if puntuacion > mejor_puntuacion:
+                mejor_puntuacion = puntuacion
+                mejor_indice = i
         if mejor_puntuacion > 0.5:
             coincidencias += 1
             usadas.add(mejor_indice)
     return (coincidencias / len(plantilla)) * 100
 
+def analizar_claves(data_ocr: Dict) -> Dict:
+    palabras = extraer_palabras(data_ocr)
+    if not palabras:
+        return {"porcentaje": 0}
+
+    indice = IndicePalabras(palabras)
+    porcentaje1 = calcular_similitud(PLANTILLA1, indice)
+    porcentaje2 = calcular_similitud(PLANTILLA2, indice)
+    porcentaje = round(max(porcentaje1, porcentaje2), 2)
+
+    advertencia = ""
+    if porcentaje < 90:
+        advertencia = "Alterado"
+    elif porcentaje < 98:
+        advertencia = "Sospechoso"
+    else:
+        advertencia = "Auténtico"
+
+    return {"porcentaje": porcentaje, "advertencia": advertencia}
+
+def advertencia_claves(resultado: Dict) -> str:
+    # Sin palabras reconocidas no hay advertencia: se trata como Alterado
+    return resultado.get("advertencia", "Alterado")
+
 @router.post("/ocr")
 async def procesar_imagen(file: UploadFile = File(...)):
     if not file.content_type or not file.content_type.startswith('image/'):
         raise HTTPException(400, "Debe ser una imagen")
 
-    temp_path = None
     try:
         content = await file.read()
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp:
-            temp.write(content)
-            temp_path = temp.name
-        data_ocr = ocr_api(temp_path)
-        if not data_ocr:
-            raise HTTPException(500, "Error en OCR")
-        palabras = extraer_palabras(data_ocr)
-        if not palabras:
-            return {"porcentaje": 0}
-
-        porcentaje1 = calcular_similitud(PLANTILLA1, palabras)
-        porcentaje2 = calcular_similitud(PLANTILLA2, palabras)
-        porcentaje = round(max(porcentaje1, porcentaje2), 2)
-
-        advertencia = ""
-        if porcentaje < 90:
-            advertencia = "Alterado"
-        elif porcentaje < 98:
-            advertencia = "Sospechoso"
-        else:
-            advertencia = "Auténtico"
-
-        return {"porcentaje": porcentaje, "advertencia": advertencia}
+
+        async def calcular():
+            data_ocr = await ocr_api_bytes(content, file.filename or 'imagen.jpg')
+            if not data_ocr:
+                raise HTTPException(500, "Error en OCR")
+            return analizar_claves(data_ocr)
+
+        resultado = await memorizar("ocr", content, calcular)
+        contar_veredicto("ocr", advertencia_claves(resultado), "ruta")
+        return resultado
 
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(500, f"Error: {str(e)}")
-    finally:
-        if temp_path and os.path.exists(temp_path):
-            os.unlink(temp_path)
\ No newline at end of file
+        raise HTTPException(500, f"Error: {str(e)}")
\ No newline at end of file
@@ -3,9 +3,14 @@ from fastapi import APIRouter, File, UploadFile, HTTPException
 from PIL import Image
 from PIL.ExifTags import TAGS
 import io
+import logging
 import piexif
+from filtros.cache_veredictos import memorizar
+from filtros.ejecutor import en_hilos
+from metricas import contar_veredicto
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 def _convert_gps_to_decimal(coord, ref):
     """Convierte coordenadas GPS EXIF a grados decimales"""
@@ -97,7 +102,7 @@ def extraer_exif(imagen_bytes: bytes):
                         for gps_field in ["GPSLatitude", "GPSLatitudeRef", "GPSLongitude", "GPSLongitudeRef"]:
                             datos_utiles.pop(gps_field, None)
             except Exception as e:
-                print(f"Error con piexif: {e}")
+                logger.warning("Error con piexif: %s", e)
 
         # Solo mostrar advertencia si el formato NO es JPEG/JPG o PNG
         formato = (info_basica.get("format") or "").lower()
@@ -122,6 +127,13 @@ def extraer_exif(imagen_bytes: bytes):
     except Exception as e:
         return None, f"❌ Error procesando imagen: {e}"
 
+def advertencia_exif(resultado: dict, mensaje: str) -> str:
+    if resultado["editado"]:
+        return "Alterado"
+    if mensaje == "Sospechoso" or resultado["advertencia_formato"]:
+        return "Sospechoso"
+    return "Auténtico"
+
 @router.post("/filtro_exif")
 async def filtro_exif(file: UploadFile = File(...)):
     try:
@@ -144,10 +156,11 @@ async def filtro_exif(file: UploadFile = File(...)):
                 detail="El archivo está vacío"
             )
 
-        resultado, mensaje = extraer_exif(content)
+        resultado, mensaje = await memorizar("filtro_exif", content, lambda: en_hilos(extraer_exif, content))
 
         if resultado is None:
             raise HTTPException(status_code=500, detail=mensaje)
+        contar_veredicto("filtro_exif", advertencia_exif(resultado, mensaje), "ruta")
 
         return {
             "archivo": file.filename,
@@ -1,15 +1,35 @@
 import cv2
+import hashlib
+import json
+import logging
 import numpy as np
 import os
 import tempfile
+import threading
 from typing import Dict, List
 from fastapi import APIRouter, File, UploadFile, HTTPException
 from fastapi.responses import JSONResponse
+from filtros.cache_veredictos import memorizar
+from filtros.ejecutor import en_hilos
+from filtros.imagen import decodificar_imagen
+from filtros.recursos import vigilar
+from metricas import contar_veredicto, medir
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+# Las distancias de las plantillas se midieron a 0.6x de la resolución completa
+REDUCCION_DECODIFICACION = 1
 plantilla1 = "./filtros/plantillas/yape.jpg"
 plantilla2 = "./filtros/plantillas/yape2.jpg"
-logo_path = "./filtros/Logo.jpg"
+logo_path = "./filtros/logo.jpg"
+distancias_path = "./config/distancias_guardadas.json"
+# Las distancias recalculadas van a un archivo aparte (sin versionar); el de config/ solo se lee
+distancias_calculadas_path = os.getenv("DISTANCIAS_CALCULADAS_PATH", "./config/distancias_calculadas.json")
+
+_logo_cache = {}
+_distancias_cache = {}
+_cache_lock = threading.RLock()
+vigilar(lambda: [logo_path])
 
 def detectar_cuadro_blanco(imagen):
     gris = cv2.cvtColor(imagen, cv2.COLOR_BGR2GRAY)
@@ -29,40 +49,90 @@ def detectar_cuadro_blanco(imagen):
 
     return imagen, cuadro_blanco_box
 
-def detectar_logo_multiescala(imagen, logo, umbral=0.7):
-    img_gray = cv2.cvtColor(imagen, cv2.COLOR_BGR2GRAY)
-    logo_gray = cv2.cvtColor(logo, cv2.COLOR_BGR2GRAY)
+ESCALAS_LOGO = np.linspace(0.4, 1.5, 20)[::-1]
+LOGO_PIRAMIDE = os.getenv("LOGO_PIRAMIDE", "1") == "1"
+LOGO_CONFIANZA_SALIDA = float(os.getenv("LOGO_CONFIANZA_SALIDA", "0")) or None
+
+def _comparar_escala(img_gray, logo_gray, escala, region=None):
+    """matchTemplate del logo a una escala; si se da region=(x0, y0, x1, y1) solo busca dentro de ella."""
+    ancho_nuevo = int(logo_gray.shape[1] * escala)
+    alto_nuevo = int(logo_gray.shape[0] * escala)
+    if ancho_nuevo < 10 or alto_nuevo < 10:
+        return None
+    x0, y0 = 0, 0
+    if region is not None:
+        x0, y0, x1, y1 = region
+        img_gray = img_gray[y0:y1 + alto_nuevo, x0:x1 + ancho_nuevo]
+
+    if img_gray.shape[0] < alto_nuevo or img_gray.shape[1] < ancho_nuevo:
+        return None
 
-    mejor_confianza = 0
-    mejor_top_left = None
-    mejor_bottom_right = None
+    logo_redimensionado = cv2.resize(logo_gray, (ancho_nuevo, alto_nuevo), interpolation=cv2.INTER_AREA)
+    resultado = cv2.matchTemplate(img_gray, logo_redimensionado, cv2.TM_CCOEFF_NORMED)
+    _, max_val, _, max_loc = cv2.minMaxLoc(resultado)
+    return max_val, (max_loc[0] + x0, max_loc[1] + y0), ancho_nuevo, alto_nuevo
 
-    for escala in np.linspace(0.4, 1.5, 20)[::-1]:
-        ancho_nuevo = int(logo_gray.shape[1] * escala)
-        alto_nuevo = int(logo_gray.shape[0] * escala)
-        if ancho_nuevo < 10 or alto_nuevo < 10:
+def _busqueda_exhaustiva(img_gray, logo_gray, umbral, confianza_salida=None):
+    mejor = None
+    for escala in ESCALAS_LOGO:
+        candidato = _comparar_escala(img_gray, logo_gray, escala)
+        if candidato is None:
             continue
+        if candidato[0] >= umbral and (mejor is None or candidato[0] > mejor[0]):
+            mejor = candidato
+            if confianza_salida is not None and mejor[0] >= confianza_salida:
+                break
+    return mejor
+
+def _busqueda_piramide(img_gray, logo_gray, umbral, confianza_salida=None, factor=0.5, vecinos=1):
+    """Busca escala y posición aproximadas en la imagen reducida y refina solo alrededor del mejor candidato."""
+    img_reducida = cv2.resize(img_gray, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+    logo_reducido = cv2.resize(logo_gray, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
 
-        logo_redimensionado = cv2.resize(logo_gray, (ancho_nuevo, alto_nuevo), interpolation=cv2.INTER_AREA)
+    mejor_indice, mejor_gruesa = None, None
+    for i, escala in enumerate(ESCALAS_LOGO):
+        candidato = _comparar_escala(img_reducida, logo_reducido, escala)
+        if candidato is not None and (mejor_gruesa is None or candidato[0] > mejor_gruesa[0]):
+            mejor_indice, mejor_gruesa = i, candidato
+    if mejor_gruesa is None:
+        return _busqueda_exhaustiva(img_gray, logo_gray, umbral, confianza_salida)
 
-        if img_gray.shape[0] < logo_redimensionado.shape[0] or img_gray.shape[1] < logo_redimensionado.shape[1]:
+    margen = int(round(2 / factor)) + 2
+    x, y = int(mejor_gruesa[1][0] / factor), int(mejor_gruesa[1][1] / factor)
+    region = (max(0, x - margen), max(0, y - margen), x + margen, y + margen)
+
+    mejor = None
+    desde, hasta = max(0, mejor_indice - vecinos), min(len(ESCALAS_LOGO), mejor_indice + vecinos + 1)
+    for escala in ESCALAS_LOGO[desde:hasta]:
+        candidato = _comparar_escala(img_gray, logo_gray, escala, region)
+        if candidato is None:
             continue
+        if candidato[0] >= umbral and (mejor is None or candidato[0] > mejor[0]):
+            mejor = candidato
+            if confianza_salida is not None and mejor[0] >= confianza_salida:
+                break
+    return mejor
 
-        resultado = cv2.matchTemplate(img_gray, logo_redimensionado, cv2.TM_CCOEFF_NORMED)
-        _, max_val, _, max_loc = cv2.minMaxLoc(resultado)
+def detectar_logo_multiescala(imagen, logo, umbral=0.7, piramide=None, confianza_salida=None):
+    """Busca el logo en 20 escalas. Con piramide=True hace una búsqueda gruesa a media resolución y refina
+    solo alrededor del mejor candidato; confianza_salida corta la búsqueda al superar esa confianza."""
+    img_gray = cv2.cvtColor(imagen, cv2.COLOR_BGR2GRAY)
+    logo_gray = cv2.cvtColor(logo, cv2.COLOR_BGR2GRAY)
+    if piramide is None:
+        piramide = LOGO_PIRAMIDE
+    if confianza_salida is None:
+        confianza_salida = LOGO_CONFIANZA_SALIDA
 
-        if max_val > mejor_confianza and max_val >= umbral:
-            mejor_confianza = max_val
-            mejor_top_left = max_loc
-            mejor_bottom_right = (max_loc[0] + ancho_nuevo, max_loc[1] + alto_nuevo)
+    with medir("logo_match_template"):
+        if piramide:
+            mejor = _busqueda_piramide(img_gray, logo_gray, umbral, confianza_salida)
+        else:
+            mejor = _busqueda_exhaustiva(img_gray, logo_gray, umbral, confianza_salida)
 
-    if mejor_top_left and mejor_bottom_right:
-        x, y = mejor_top_left
-        w = mejor_bottom_right[0] - x
-        h = mejor_bottom_right[1] - y
-        return imagen, (x, y, w, h)
-    else:
+    if mejor is None:
         return imagen, None
+    _, (x, y), w, h = mejor
+    return imagen, (x, y, w, h)
 
 def remarcar_contorno_recibo(imagen):
     gris = cv2.cvtColor(imagen, cv2.COLOR_BGR2GRAY)
@@ -119,6 +189,84 @@ def procesar_imagen_plantilla(ruta_plantilla, logo):
     
     return None
 
+def _mtime(ruta):
+    try:
+        return os.path.getmtime(ruta)
+    except OSError:
+        return None
+
+def obtener_logo():
+    """Devuelve el logo decodificado, releyéndolo solo si cambia su mtime."""
+    mtime = _mtime(logo_path)
+    if mtime is None:
+        return None
+    with _cache_lock:
+        if _logo_cache.get("mtime") != mtime:
+            logo = cv2.imread(logo_path)
+            if logo is None:
+                return None
+            _logo_cache.update(mtime=mtime, logo=logo)
+        return _logo_cache["logo"]
+
+def huellas_recursos_logo() -> Dict[str, str]:
+    """sha256 de las plantillas y el logo: las distancias guardadas valen mientras el contenido coincida
+    (los mtimes de un checkout nuevo no dicen nada)."""
+    huellas = {}
+    for ruta in (plantilla1, plantilla2, logo_path):
+        try:
+            with open(ruta, "rb") as f:
+                huellas[os.path.basename(ruta)] = hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            huellas[os.path.basename(ruta)] = None
+    return huellas
+
+def _leer_distancias_guardadas(ruta, huellas):
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            guardadas = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(guardadas, dict) or guardadas.get("recursos") != huellas:
+        return None
+    distancias = guardadas.get("distancias")
+    if not isinstance(distancias, list) or len(distancias) != 2 or not all(isinstance(d, dict) for d in distancias):
+        return None
+    return distancias
+
+def _guardar_distancias(distancias, huellas):
+    # Archivo temporal + os.replace: otro worker nunca lee un JSON a medio escribir
+    directorio = os.path.dirname(distancias_calculadas_path) or "."
+    temporal = None
+    try:
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=directorio, suffix=".tmp", delete=False) as f:
+            temporal = f.name
+            json.dump({"recursos": huellas, "distancias": distancias}, f, indent=4, ensure_ascii=False)
+        os.replace(temporal, distancias_calculadas_path)
+    except OSError as e:
+        logger.warning("No se pudieron guardar las distancias: %s", e)
+        if temporal is not None and os.path.exists(temporal):
+            os.remove(temporal)
+
+def distancias_plantillas():
+    """Distancias del logo en [plantilla1, plantilla2], leídas de disco si están al día o calculadas una vez."""
+    version = (_mtime(plantilla1), _mtime(plantilla2), _mtime(logo_path))
+    with _cache_lock:
+        if _distancias_cache.get("version") == version:
+            return _distancias_cache["distancias"]
+        huellas = huellas_recursos_logo()
+        distancias = (_leer_distancias_guardadas(distancias_calculadas_path, huellas)
+                      or _leer_distancias_guardadas(distancias_path, huellas))
+        if distancias is None:
+            logo = obtener_logo()
+            distancias = [
+                procesar_imagen_plantilla(ruta, logo) if logo is not None else None
+                for ruta in (plantilla1, plantilla2)
+            ]
+            if all(distancias):
+                _guardar_distancias(distancias, huellas)
+        _distancias_cache.update(version=version, distancias=distancias)
+        return distancias
+
 def calcular_porcentaje_cambio(distancias_nueva, distancias_plantilla):
     """Calcula el porcentaje promedio de cambio entre dos conjuntos de distancias"""
     if not distancias_nueva or not distancias_plantilla:
@@ -150,12 +298,94 @@ def calcular_porcentaje_cambio(distancias_nueva, distancias_plantilla):
     
     return float('inf'), {}
 
+def analizar_logo(imagen, logo=None):
+    """Compara las distancias del logo en la imagen con las de las plantillas. Devuelve (contenido, status_code)."""
+    if logo is None:
+        logo = obtener_logo()
+    imagen = cv2.resize(imagen, None, fx=0.6, fy=0.6, interpolation=cv2.INTER_AREA)
+    imagen, cuadro_blanco_box = detectar_cuadro_blanco(imagen)
+    imagen, pos_logo = detectar_logo_multiescala(imagen, logo)
+    imagen, borde_recibo = remarcar_contorno_recibo(imagen)
+
+    if not pos_logo:
+        return ({
+            "logo_detectado": False,
+            "mensaje": "No se detectó el logo en la imagen"
+        }, 200)
+
+    if not (borde_recibo and cuadro_blanco_box):
+        elementos_faltantes = []
+        if not borde_recibo:
+            elementos_faltantes.append("contorno del recibo")
+        if not cuadro_blanco_box:
+            elementos_faltantes.append("cuadro blanco")
+        
+        return ({
+            "logo_detectado": True,
+            "error": f"No se detectaron elementos necesarios para el cálculo: {', '.join(elementos_faltantes)}"
+        }, 400)
+
+    distancias_nueva, _, _ = calcular_distancias(pos_logo, borde_recibo, cuadro_blanco_box)
+    
+    distancias_plantilla1, distancias_plantilla2 = distancias_plantillas()
+    
+    resultados = []
+    
+
+    if distancias_plantilla1:
+        porcentaje1 = float('inf')  
+        resultado_porcentaje1 = calcular_porcentaje_cambio(distancias_nueva, distancias_plantilla1)
+        comparacion1 = {}
+        if isinstance(resultado_porcentaje1, tuple):
+            porcentaje1, comparacion1 = resultado_porcentaje1
+        if porcentaje1 != float('inf'):
+            resultados.append({
+                "plantilla": "plantilla1",
+                "porcentaje_cambio": round(porcentaje1, 2),
+                "detalles": comparacion1
+            })
+
+    if distancias_plantilla2:
+        resultado_porcentaje2 = calcular_porcentaje_cambio(distancias_nueva, distancias_plantilla2)
+        porcentaje2, comparacion2 = (resultado_porcentaje2 if isinstance(resultado_porcentaje2, tuple) else (float('inf'), {}))
+        if porcentaje2 != float('inf'):
+            resultados.append({
+                "plantilla": "plantilla2",
+                "porcentaje_cambio": round(porcentaje2, 2),
+                "detalles": comparacion2
+            })
+    
+    if not resultados:
+        return ({
+            "logo_detectado": True,
+            "error": "No se pudo procesar ninguna de las plantillas o no se detectó el logo en las plantillas"
+        }, 400)
+    
+    mejor_resultado = min(resultados, key=lambda x: x["porcentaje_cambio"])
+    advertencia = ""
+    if mejor_resultado["porcentaje_cambio"] <= 95:
+        advertencia = "Sospechoso"
+    elif mejor_resultado["porcentaje_cambio"] < 90:
+        advertencia = "Alterado"
+    else:
+        advertencia = "Auténtico"
+
+    return ({
+        "logo_detectado": True,
+        "mejor_coincidencia": mejor_resultado,
+        "todas_las_comparaciones": resultados,
+        "porcentaje_cambio_minimo": mejor_resultado["porcentaje_cambio"],
+        "advertencia": advertencia
+    }, 200)
+
+def advertencia_logo(contenido: Dict) -> str:
+    return contenido["advertencia"] if contenido.get("logo_detectado") else "Sospechoso"
+
 @router.post("/logo")
 async def procesar_imagen_logo(file: UploadFile = File(...)):
     if not file.content_type or not file.content_type.startswith('image/'):
         raise HTTPException(400, "Debe ser una imagen")
     
-    temp_path = None
     try:
         archivos_faltantes = []
         if not os.path.exists(logo_path):
@@ -168,97 +398,23 @@ async def procesar_imagen_logo(file: UploadFile = File(...)):
         if archivos_faltantes:
             raise HTTPException(400, f"Archivos no encontrados: {', '.join(archivos_faltantes)}")
         content = await file.read()
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp:
-            temp.write(content)
-            temp_path = temp.name
-        imagen = cv2.imread(temp_path)
-        if imagen is None:
-            raise HTTPException(400, "No se pudo leer la imagen subida")
-
-        logo = cv2.imread(logo_path)
-        if logo is None:
-            raise HTTPException(400, "No se pudo leer el archivo de logo")
-        imagen = cv2.resize(imagen, None, fx=0.6, fy=0.6, interpolation=cv2.INTER_AREA)
-        imagen, cuadro_blanco_box = detectar_cuadro_blanco(imagen)
-        imagen, pos_logo = detectar_logo_multiescala(imagen, logo)
-        imagen, borde_recibo = remarcar_contorno_recibo(imagen)
-
-        if not pos_logo:
-            return JSONResponse(content={
-                "logo_detectado": False,
-                "mensaje": "No se detectó el logo en la imagen"
-            }, status_code=200)
-
-        if not (borde_recibo and cuadro_blanco_box):
-            elementos_faltantes = []
-            if not borde_recibo:
-                elementos_faltantes.append("contorno del recibo")
-            if not cuadro_blanco_box:
-                elementos_faltantes.append("cuadro blanco")
-            
-            return JSONResponse(content={
-                "logo_detectado": True,
-                "error": f"No se detectaron elementos necesarios para el cálculo: {', '.join(elementos_faltantes)}"
-            }, status_code=400)
 
-        distancias_nueva, _, _ = calcular_distancias(pos_logo, borde_recibo, cuadro_blanco_box)
-        
-        distancias_plantilla1 = procesar_imagen_plantilla(plantilla1, logo)
-        distancias_plantilla2 = procesar_imagen_plantilla(plantilla2, logo)
-        
-        resultados = []
-        
+        async def calcular():
+            imagen = await en_hilos(decodificar_imagen, content, reduccion=REDUCCION_DECODIFICACION)
+            if imagen is None:
+                raise HTTPException(400, "No se pudo leer la imagen subida")
 
-        if distancias_plantilla1:
-            porcentaje1 = float('inf')  
-            resultado_porcentaje1 = calcular_porcentaje_cambio(distancias_nueva, distancias_plantilla1)
-            comparacion1 = {}
-            if isinstance(resultado_porcentaje1, tuple):
-                porcentaje1, comparacion1 = resultado_porcentaje1
-            if porcentaje1 != float('inf'):
-                resultados.append({
-                    "plantilla": "plantilla1",
-                    "porcentaje_cambio": round(porcentaje1, 2),
-                    "detalles": comparacion1
-                })
-    
-        if distancias_plantilla2:
-            resultado_porcentaje2 = calcular_porcentaje_cambio(distancias_nueva, distancias_plantilla2)
-            porcentaje2, comparacion2 = (resultado_porcentaje2 if isinstance(resultado_porcentaje2, tuple) else (float('inf'), {}))
-            if porcentaje2 != float('inf'):
-                resultados.append({
-                    "plantilla": "plantilla2",
-                    "porcentaje_cambio": round(porcentaje2, 2),
-                    "detalles": comparacion2
-                })
-        
-        if not resultados:
-            return JSONResponse(content={
-                "logo_detectado": True,
-                "error": "No se pudo procesar ninguna de las plantillas o no se detectó el logo en las plantillas"
-            }, status_code=400)
-        
-        mejor_resultado = min(resultados, key=lambda x: x["porcentaje_cambio"])
-        advertencia = ""
-        if mejor_resultado["porcentaje_cambio"] <= 95:
-            advertencia = "Sospechoso"
-        elif mejor_resultado["porcentaje_cambio"] < 90:
-            advertencia = "Alterado"
-        else:
-            advertencia = "Auténtico"
+            logo = obtener_logo()
+            if logo is None:
+                raise HTTPException(400, "No se pudo leer el archivo de logo")
+            return await en_hilos(analizar_logo, imagen, logo)
 
-        return JSONResponse(content={
-            "logo_detectado": True,
-            "mejor_coincidencia": mejor_resultado,
-            "todas_las_comparaciones": resultados,
-            "porcentaje_cambio_minimo": mejor_resultado["porcentaje_cambio"],
-            "advertencia": advertencia
-        }, status_code=200)
+        contenido, status_code = await memorizar("logo", content, calcular)
+        if status_code == 200:
+            contar_veredicto("logo", advertencia_logo(contenido), "ruta")
+        return JSONResponse(content=contenido, status_code=status_code)
         
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(500, f"Error procesando la imagen: {str(e)}")
-    finally:
-        if temp_path and os.path.exists(temp_path):
-            os.unlink(temp_path)
\ No newline at end of file
+        raise HTTPException(500, f"Error procesando la imagen: {str(e)}")
\ No newline at end of file
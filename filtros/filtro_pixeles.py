@@ -1,14 +1,106 @@
 import cv2
+import logging
 import numpy as np
 import os
 import glob
-import tempfile
-from typing import List, Tuple, Optional
+import threading
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
 from fastapi import APIRouter, File, UploadFile, HTTPException
+from filtros.cache_veredictos import memorizar
+from filtros.ejecutor import en_procesos
+from filtros.imagen import decodificar_imagen
+from filtros.recursos import vigilar
+from metricas import contar_veredicto, medir
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+# Alineación ORB contra plantillas a resolución completa
+REDUCCION_DECODIFICACION = 1
+PLANTILLAS_DIR = "./filtros/plantillas/"
+# Solo las PIXELES_TOP_K plantillas más parecidas por descriptor global pasan a la alineación ORB completa
+PIXELES_TOP_K = int(os.getenv("PIXELES_TOP_K", "3"))
+LADO_MINIATURA = 32
+BINS_DESCRIPTOR = 64
 
-def alinear_imagen(sospechosa_gray: np.ndarray, plantilla_gray: np.ndarray) -> Tuple[np.ndarray, int]:
+def listar_plantillas(plantillas_dir: str = PLANTILLAS_DIR) -> List[str]:
+    extensiones = ['*.jpg', '*.jpeg', '*.png', '*.bmp']
+    plantillas_paths = []
+    for ext in extensiones:
+        plantillas_paths.extend(glob.glob(os.path.join(plantillas_dir, ext)))
+    return plantillas_paths
+
+vigilar(listar_plantillas)
+
+class DescriptorGlobal(NamedTuple):
+    """Resumen barato de una imagen en gris para preseleccionar plantillas antes de ORB."""
+    aspecto: float
+    miniatura: np.ndarray
+    histograma: np.ndarray
+
+class PlantillaORB(NamedTuple):
+    ruta: str
+    mtime: float
+    gray: np.ndarray
+    keypoints: Sequence
+    descriptores: Optional[np.ndarray]
+    descriptor: DescriptorGlobal
+
+_registro_plantillas: Dict[str, PlantillaORB] = {}
+_registro_lock = threading.Lock()
+
+def calcular_caracteristicas(gray: np.ndarray) -> Tuple[Sequence, Optional[np.ndarray]]:
+    orb = cv2.ORB.create(nfeatures=1000)
+    mask = np.ones(gray.shape, dtype=np.uint8)
+    with medir("orb_deteccion"):
+        return orb.detectAndCompute(gray, mask)
+
+def _normalizar(vector: np.ndarray) -> np.ndarray:
+    centrado = vector.astype(np.float32).ravel() - vector.mean()
+    norma = np.linalg.norm(centrado)
+    return centrado / norma if norma > 0 else centrado
+
+def calcular_descriptor(gray: np.ndarray) -> DescriptorGlobal:
+    """Relación de aspecto, miniatura 32x32 y histograma de 64 niveles, ambos normalizados (producto punto = correlación)."""
+    miniatura = cv2.resize(gray, (LADO_MINIATURA, LADO_MINIATURA), interpolation=cv2.INTER_AREA)
+    histograma = cv2.calcHist([gray], [0], None, [BINS_DESCRIPTOR], [0, 256])
+    return DescriptorGlobal(gray.shape[1] / gray.shape[0], _normalizar(miniatura), _normalizar(histograma))
+
+def distancia_descriptores(a: DescriptorGlobal, b: DescriptorGlobal) -> float:
+    """0 para imágenes idénticas; suma la diferencia de aspecto (log) y lo que falta para correlación 1."""
+    return (abs(np.log(a.aspecto / b.aspecto))
+            + (1.0 - float(a.miniatura @ b.miniatura))
+            + (1.0 - float(a.histograma @ b.histograma)))
+
+def obtener_plantilla(plantilla_path: str) -> Optional[PlantillaORB]:
+    """Devuelve la plantilla con sus características ORB ya calculadas; se recarga si cambia el mtime del archivo."""
+    try:
+        mtime = os.path.getmtime(plantilla_path)
+    except OSError:
+        _registro_plantillas.pop(plantilla_path, None)
+        return None
+    plantilla = _registro_plantillas.get(plantilla_path)
+    if plantilla is not None and plantilla.mtime == mtime:
+        return plantilla
+    with _registro_lock:
+        plantilla = _registro_plantillas.get(plantilla_path)
+        if plantilla is not None and plantilla.mtime == mtime:
+            return plantilla
+        gray = cv2.imread(plantilla_path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            return None
+        keypoints, descriptores = calcular_caracteristicas(gray)
+        plantilla = PlantillaORB(plantilla_path, mtime, gray, keypoints, descriptores, calcular_descriptor(gray))
+        _registro_plantillas[plantilla_path] = plantilla
+        return plantilla
+
+def cargar_plantillas(plantillas_dir: str = PLANTILLAS_DIR) -> List[PlantillaORB]:
+    """Precarga todas las plantillas del directorio (se llama al iniciar la app)."""
+    plantillas = [obtener_plantilla(path) for path in listar_plantillas(plantillas_dir)]
+    return [p for p in plantillas if p is not None]
+
+def alinear_imagen(sospechosa_gray: np.ndarray, plantilla_gray: np.ndarray,
+                   plantilla_caracteristicas: Optional[Tuple] = None,
+                   sospechosa_caracteristicas: Optional[Tuple] = None) -> Tuple[np.ndarray, int]:
     if sospechosa_gray is None or plantilla_gray is None:
         raise ValueError("Una o ambas imágenes están vacías")
     if sospechosa_gray.shape[0] < 50 or sospechosa_gray.shape[1] < 50:
@@ -18,17 +110,15 @@ def alinear_imagen(sospechosa_gray: np.ndarray, plantilla_gray: np.ndarray) -> T
     if sospechosa_gray.shape == plantilla_gray.shape:
         if np.array_equal(sospechosa_gray, plantilla_gray):
             return sospechosa_gray, 1000    
-    orb = cv2.ORB.create(nfeatures=1000)
-    mask1 = np.ones(plantilla_gray.shape, dtype=np.uint8)
-    mask2 = np.ones(sospechosa_gray.shape, dtype=np.uint8)
-    kp1, des1 = orb.detectAndCompute(plantilla_gray, mask1)
-    kp2, des2 = orb.detectAndCompute(sospechosa_gray, mask2)
+    kp1, des1 = plantilla_caracteristicas or calcular_caracteristicas(plantilla_gray)
+    kp2, des2 = sospechosa_caracteristicas or calcular_caracteristicas(sospechosa_gray)
     if des1 is None or des2 is None:
         raise ValueError("No se pudieron extraer características de una o ambas imágenes")    
     if len(des1) < 10 or len(des2) < 10:
         raise ValueError(f"Muy pocas características detectadas: plantilla={len(des1) if des1 is not None else 0}, sospechosa={len(des2) if des2 is not None else 0}")
     bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False)
-    matches = bf.knnMatch(des1, des2, k=2)
+    with medir("knn_match"):
+        matches = bf.knnMatch(des1, des2, k=2)
     buenos = []
     for match_pair in matches:
         if len(match_pair) == 2:
@@ -39,19 +129,27 @@ def alinear_imagen(sospechosa_gray: np.ndarray, plantilla_gray: np.ndarray) -> T
         raise ValueError(f"Pocos matches buenos: {len(buenos)}. Características detectadas: plantilla={len(des1)}, sospechosa={len(des2)}")
     src_pts = np.array([[kp1[m.queryIdx].pt[0], kp1[m.queryIdx].pt[1]] for m in buenos], dtype=np.float32).reshape(-1,1,2)
     dst_pts = np.array([[kp2[m.trainIdx].pt[0], kp2[m.trainIdx].pt[1]] for m in buenos], dtype=np.float32).reshape(-1,1,2)
-    H, _ = cv2.findHomography(dst_pts, src_pts, cv2.RANSAC, 5.0)
+    with medir("homografia"):
+        H, _ = cv2.findHomography(dst_pts, src_pts, cv2.RANSAC, 5.0)
     if H is None:
         raise ValueError("No se pudo calcular la homografía")
     h, w = plantilla_gray.shape
-    alineada = cv2.warpPerspective(sospechosa_gray, H, (w, h))
+    with medir("warp_perspectiva"):
+        alineada = cv2.warpPerspective(sospechosa_gray, H, (w, h))
     return alineada, len(buenos)
 
-def evaluar_similitud(plantilla_path: str, sospechosa_gray: np.ndarray, threshold: int = 30) -> Tuple[Optional[np.ndarray], float, int, str]:
-    plantilla = cv2.imread(plantilla_path, cv2.IMREAD_GRAYSCALE)
-    if plantilla is None:
+def evaluar_similitud(plantilla_path: str, sospechosa_gray: np.ndarray, threshold: int = 30,
+                      sospechosa_caracteristicas: Optional[Tuple] = None) -> Tuple[Optional[np.ndarray], float, int, str]:
+    registrada = obtener_plantilla(plantilla_path)
+    if registrada is None:
         return None, 0.0, 0, f"❌ No se pudo cargar plantilla: {plantilla_path}"
+    plantilla = registrada.gray
     try:
-        alineada, matches = alinear_imagen(sospechosa_gray, plantilla)
+        alineada, matches = alinear_imagen(
+            sospechosa_gray, plantilla,
+            (registrada.keypoints, registrada.descriptores),
+            sospechosa_caracteristicas
+        )
         diff = cv2.absdiff(plantilla, alineada)
         _, mask = cv2.threshold(diff, threshold, 255, cv2.THRESH_BINARY)
         pixeles_diferentes = int((mask > 0).sum())
@@ -59,14 +157,35 @@ def evaluar_similitud(plantilla_path: str, sospechosa_gray: np.ndarray, threshol
         similitud = 100.0 - (pixeles_diferentes / total_pixeles * 100.0)
         return mask, similitud, matches, "✅ Comparación exitosa"
     except Exception as e:
-        print(f"DEBUG: Error en evaluar_similitud: {e}")
+        logger.warning("Error en evaluar_similitud: %s", e, exc_info=True)
         return None, 0.0, 0, f"❌ Error: {e}"
 
-def detectar_diferencias(plantillas_paths: List[str], sospechosa_gray: np.ndarray, threshold: int = 30):
+def ordenar_plantillas(plantillas_paths: List[str], sospechosa_gray: np.ndarray) -> List[str]:
+    """Plantillas de la más a la menos parecida por descriptor global (las que no cargan van al final)."""
+    with medir("preseleccion_plantillas"):
+        descriptor = calcular_descriptor(sospechosa_gray)
+        distancias = {}
+        for path in plantillas_paths:
+            registrada = obtener_plantilla(path)
+            distancias[path] = distancia_descriptores(descriptor, registrada.descriptor) if registrada else float("inf")
+        return sorted(plantillas_paths, key=distancias.__getitem__)
+
+def detectar_diferencias(plantillas_paths: List[str], sospechosa_gray: np.ndarray, threshold: int = 30,
+                         top_k: int = PIXELES_TOP_K):
     resultados = []
+    sospechosa_caracteristicas = calcular_caracteristicas(sospechosa_gray) if sospechosa_gray is not None else None
+    if sospechosa_gray is not None and 0 < top_k < len(plantillas_paths):
+        plantillas_paths = ordenar_plantillas(plantillas_paths, sospechosa_gray)
+    else:
+        top_k = len(plantillas_paths)
+    evaluadas = 0
     for plantilla_path in plantillas_paths:
+        # Si ninguna de las top_k se pudo alinear se sigue con el resto en orden
+        if evaluadas >= top_k and resultados:
+            break
+        evaluadas += 1
         mask, similitud, matches, mensaje = evaluar_similitud(
-            plantilla_path, sospechosa_gray, threshold
+            plantilla_path, sospechosa_gray, threshold, sospechosa_caracteristicas
         )
         if mask is not None:
             resultados.append({
@@ -80,9 +199,43 @@ def detectar_diferencias(plantillas_paths: List[str], sospechosa_gray: np.ndarra
     mejor_resultado = max(resultados, key=lambda x: x['porcentaje'])
     return {
         'porcentaje': round(mejor_resultado['porcentaje'], 2),
-        'coincidencias': mejor_resultado['coincidencias']
+        'coincidencias': mejor_resultado['coincidencias'],
+        'plantilla': mejor_resultado['plantilla'],
+        'evaluadas': evaluadas
     }
 
+def analizar_pixeles(sospechosa_gray: np.ndarray, threshold: int = 30) -> Dict:
+    if sospechosa_gray is None:
+        raise ValueError("❌ No se pudo decodificar la imagen subida")
+    if sospechosa_gray.size == 0:
+        raise ValueError("❌ La imagen está vacía")
+    plantillas_paths = listar_plantillas()
+    if not plantillas_paths:
+        raise ValueError("❌ No hay plantillas disponibles para comparar")
+    result = detectar_diferencias(plantillas_paths, sospechosa_gray, threshold)
+    if result is None:
+        raise ValueError("❌ No se pudo comparar la imagen con las plantillas")
+    porcentaje = result['porcentaje']
+    advertencia = ""
+    if porcentaje <= 85:
+        advertencia = "Alterado"
+    elif porcentaje <= 98:
+        advertencia = "Sospechoso"
+    else:
+        advertencia = "Auténtico"
+
+    return {
+        "porcentaje_coincidencia": round(porcentaje, 2),
+        "coincidencias": result['coincidencias'],
+        "plantilla": result['plantilla'],
+        "plantillas_alineadas": result['evaluadas'],
+        "advertencia": advertencia
+    }
+
+def analizar_pixeles_bytes(content: bytes, threshold: int = 30) -> Dict:
+    sospechosa_gray = decodificar_imagen(content, cv2.IMREAD_GRAYSCALE, REDUCCION_DECODIFICACION)
+    return analizar_pixeles(sospechosa_gray, threshold)
+
 @router.post("/filtro_pixeles")
 async def filtro_pixeles(file: UploadFile = File(...)):
     try:
@@ -90,44 +243,17 @@ async def filtro_pixeles(file: UploadFile = File(...)):
             raise HTTPException(status_code=422, detail="❌ El archivo debe ser una imagen")
 
         content = await file.read()
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-            tmp.write(content)
-            tmp_path = tmp.name
 
         try:
-            nparr = np.frombuffer(content, np.uint8)
-            sospechosa_gray = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
-            if sospechosa_gray is None:
-                raise Exception("❌ No se pudo decodificar la imagen subida")
-            if sospechosa_gray.size == 0:
-                raise Exception("❌ La imagen está vacía")
-            plantillas_dir = "./filtros/plantillas/"
-            extensiones = ['*.jpg', '*.jpeg', '*.png', '*.bmp']
-            plantillas_paths = []
-            for ext in extensiones:
-                plantillas_paths.extend(glob.glob(os.path.join(plantillas_dir, ext)))
-            if not plantillas_paths:
-                raise Exception("❌ No hay plantillas disponibles para comparar")
-            threshold = 30
-            result = detectar_diferencias(plantillas_paths, sospechosa_gray, threshold)
-            if result is None:
-                raise Exception("❌ No se pudo comparar la imagen con las plantillas")
-            porcentaje = result['porcentaje']
-            advertencia = ""
-            if porcentaje <= 85:
-                advertencia = "Alterado"
-            elif porcentaje <= 98:
-                advertencia = "Sospechoso"
-            else:
-                advertencia = "Auténtico"
-
-            return {
-                "porcentaje_coincidencia": round(porcentaje, 2),
-                "coincidencias": result['coincidencias'],
-                "advertencia": advertencia
-            }
+            resultado = await memorizar("filtro_pixeles", content, lambda: en_procesos(analizar_pixeles_bytes, content))
+            contar_veredicto("filtro_pixeles", resultado.get("advertencia"), "ruta")
+            return resultado
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=422, detail=f"❌ Error al procesar la imagen: {e}")
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=422, detail=f"❌ Error al leer el archivo: {e}")
\ No newline at end of file
@@ -1,17 +1,45 @@
 import cv2
-import tempfile
 from fastapi import APIRouter, File, UploadFile, HTTPException
+from filtros.cache_veredictos import memorizar
+from filtros.ejecutor import en_hilos
+from filtros.imagen import decodificar_imagen
+from metricas import contar_veredicto
 
 router = APIRouter()
+# La varianza del laplaciano depende de la resolución
+REDUCCION_DECODIFICACION = 1
 
 def porcentaje_nitidez(image_path, max_var=399):
     image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
     if image is None:
         raise ValueError("No se pudo cargar la imagen.")
+    return porcentaje_nitidez_gray(image, max_var)
+
+def porcentaje_nitidez_bytes(content, max_var=399):
+    image = decodificar_imagen(content, cv2.IMREAD_GRAYSCALE, REDUCCION_DECODIFICACION)
+    if image is None:
+        raise ValueError("No se pudo cargar la imagen.")
+    return porcentaje_nitidez_gray(image, max_var)
+
+def porcentaje_nitidez_gray(image, max_var=399):
     laplacian_var = cv2.Laplacian(image, cv2.CV_64F).var()
     porcentaje = min(100.0, (laplacian_var / max_var) * 100.0)
     return porcentaje
 
+def clasificar_nitidez(porcentaje):
+    advertencia = ""
+    if porcentaje < 70:
+        advertencia = "Alterado"
+    elif porcentaje < 90:
+        advertencia = "Sospechoso"
+    else:
+        advertencia = "Auténtico"
+
+    return {
+        "porcentaje_nitidez": round(porcentaje, 2),
+        "advertencia": advertencia
+    }
+
 @router.post("/filtro_ruido")
 async def filtro_ruido(file: UploadFile = File(...)):
     try:
@@ -19,26 +47,18 @@ async def filtro_ruido(file: UploadFile = File(...)):
             raise HTTPException(status_code=422, detail="❌ El archivo debe ser una imagen")
 
         content = await file.read()
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-            tmp.write(content)
-            tmp_path = tmp.name
 
         try:
-            porcentaje = porcentaje_nitidez(tmp_path)
+            porcentaje = await memorizar("filtro_ruido", content, lambda: en_hilos(porcentaje_nitidez_bytes, content))
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=422, detail=f"❌ Error al procesar la imagen: {e}")
 
-        advertencia = ""
-        if porcentaje < 70:
-            advertencia = "Alterado"
-        elif porcentaje < 90:
-            advertencia = "Sospechoso"
-        else:
-            advertencia = "Auténtico"
-
-        return {
-            "porcentaje_nitidez": round(porcentaje, 2),
-            "advertencia": advertencia
-        }
+        resultado = clasificar_nitidez(porcentaje)
+        contar_veredicto("filtro_ruido", resultado["advertencia"], "ruta")
+        return resultado
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=422, detail=f"❌ Error al leer el archivo: {e}")
\ No newline at end of file
@@ -0,0 +1,398 @@
+# Filtro verificar: una sola subida para todos los filtros
+import asyncio
+import json
+import os
+import time
+import zipfile
+from typing import Awaitable, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from fastapi import APIRouter, File, Request, UploadFile, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.datastructures import UploadFile as ArchivoSubido
+from filtros.ejecutor import en_hilos, en_procesos, EjecutorSaturado
+from filtros.imagen import ImagenDecodificada
+from filtros.filtro_yape import is_yape_transaction_hsv, NotYapeTransaction, REDUCCION_DECODIFICACION as REDUCCION_YAPE
+from filtros.filtro_pixeles import analizar_pixeles
+from filtros.filtro_exif import advertencia_exif, extraer_exif
+from filtros.filtro_ruido import porcentaje_nitidez_gray, clasificar_nitidez
+from filtros.filtro_histograma import analizar_histograma, REDUCCION_DECODIFICACION as REDUCCION_HISTOGRAMA
+from filtros.filtro_logo import advertencia_logo, analizar_logo, obtener_logo
+from filtros.filtro_claves import advertencia_claves, ocr_imagen, analizar_claves
+from filtros.filtro_ocr import advertencia_comprobante, analizar_comprobante
+from filtros.cache_veredictos import cache_veredictos
+from filtros.huellas import indice_huellas, HUELLAS_ACTIVAS, HUELLA_REUTILIZAR
+from metricas import contar_veredicto, contar_reenvio
+
+router = APIRouter()
+
+NIVELES = {"Auténtico": 0, "Sospechoso": 1, "Alterado": 2}
+
+# Cascada: los filtros corren del más barato al más caro (costo medido en ejecución) y se corta en cuanto
+# el veredicto combinado ya está decidido. Con CASCADA_ACTIVA=0 corren todos a la vez, como antes.
+CASCADA_ACTIVA = os.getenv("CASCADA_ACTIVA", "1") == "1"
+# Nivel que corta la cascada: con "Alterado" el resultado es el mismo que corriendo todo (el combinado
+# es el peor nivel); con "Sospechoso" se corta antes a costa de no distinguir Sospechoso de Alterado
+CASCADA_DETENER_EN = os.getenv("CASCADA_DETENER_EN", "Alterado")
+# Filtros cuyo veredicto puede cortar la cascada, separados por comas (vacío = todos)
+CASCADA_DECISIVOS = {n.strip() for n in os.getenv("CASCADA_DECISIVOS", "").split(",") if n.strip()}
+# Límites de costo (ms) de cada etapa: "50" = los de hasta 50 ms juntos primero, después el resto
+CASCADA_ETAPAS_MS = [float(v) for v in os.getenv("CASCADA_ETAPAS_MS", "50").split(",") if v.strip()]
+
+# Lote: comprobantes verificados a la vez, máximo de comprobantes por petición y tamaño máximo de cada uno
+LOTE_CONCURRENCIA = int(os.getenv("LOTE_CONCURRENCIA", "2"))
+LOTE_MAXIMO = int(os.getenv("LOTE_MAXIMO", "500"))
+LOTE_TAMANO_MAXIMO = int(os.getenv("LOTE_TAMANO_MAXIMO", str(15 * 1024 * 1024)))
+TIPOS_ZIP = {"application/zip", "application/x-zip-compressed"}
+
+def _filtro_yape(img: ImagenDecodificada) -> Dict:
+    try:
+        is_yape_transaction_hsv(img.hsv_reducida(REDUCCION_YAPE))
+        return {"resultado": "ok", "advertencia": "Auténtico"}
+    except NotYapeTransaction as e:
+        return {"resultado": str(e), "advertencia": "Alterado"}
+
+async def _filtro_pixeles(img: ImagenDecodificada) -> Dict:
+    gray = await en_hilos(getattr, img, "gray")
+    return await en_procesos(analizar_pixeles, gray)
+
+def _filtro_exif(img: ImagenDecodificada) -> Dict:
+    resultado, mensaje = extraer_exif(img.contenido)
+    if resultado is None:
+        raise ValueError(mensaje)
+    return {
+        "mensaje": mensaje,
+        "editado": resultado["editado"],
+        "tiene_gps": resultado["tiene_gps"],
+        "advertencia_formato": resultado["advertencia_formato"],
+        "advertencia": advertencia_exif(resultado, mensaje)
+    }
+
+def _filtro_ruido(img: ImagenDecodificada) -> Dict:
+    return clasificar_nitidez(porcentaje_nitidez_gray(img.gray))
+
+def _filtro_histograma(img: ImagenDecodificada) -> Dict:
+    resultado = analizar_histograma(img.bgr_reducida(REDUCCION_HISTOGRAMA), bins="ninguno")
+    return {"similitud": resultado["similitud"], "plantilla": resultado["plantilla"], "advertencia": resultado["advertencia"]}
+
+def _filtro_logo(img: ImagenDecodificada) -> Dict:
+    logo = obtener_logo()
+    if logo is None:
+        raise ValueError("No se pudo leer el archivo de logo")
+    contenido, status_code = analizar_logo(img.bgr, logo)
+    if status_code != 200:
+        raise ValueError(contenido.get("error", "Error procesando el logo"))
+    contenido["advertencia"] = advertencia_logo(contenido)
+    return contenido
+
+async def _filtro_claves(img: ImagenDecodificada) -> Dict:
+    data_ocr = await ocr_imagen(img.bgr)
+    if not data_ocr:
+        raise ValueError("Error en OCR")
+    resultado = analizar_claves(data_ocr)
+    resultado["advertencia"] = advertencia_claves(resultado)
+    return resultado
+
+async def _filtro_ocr(img: ImagenDecodificada) -> Dict:
+    resultado = await analizar_comprobante(img.bgr)
+    resultado["advertencia"] = advertencia_comprobante(resultado)
+    return resultado
+
+FILTROS = {
+    "filter_yape": _filtro_yape,
+    "filtro_pixeles": _filtro_pixeles,
+    "filtro_exif": _filtro_exif,
+    "filtro_ruido": _filtro_ruido,
+    "histograma": _filtro_histograma,
+    "logo": _filtro_logo,
+    "ocr": _filtro_claves,
+    "filtro_ocr": _filtro_ocr,
+}
+
+# Costos de partida (ms) hasta que haya mediciones; OCR remoto y ORB dominan
+COSTOS_INICIALES = {
+    "filtro_exif": 1, "filter_yape": 3, "histograma": 5, "filtro_ruido": 10,
+    "logo": 40, "filtro_pixeles": 150, "ocr": 1000, "filtro_ocr": 1000,
+}
+
+class CostosFiltros:
+    """Costo de cada filtro en ms como media móvil exponencial de sus ejecuciones."""
+
+    def __init__(self, iniciales: Dict[str, float], alfa: float = 0.2):
+        self.alfa = alfa
+        self._costos = dict(iniciales)
+        self.mediciones = {nombre: 0 for nombre in iniciales}
+
+    def registrar(self, nombre: str, ms: float):
+        anterior = self._costos.get(nombre)
+        self._costos[nombre] = ms if anterior is None else anterior + self.alfa * (ms - anterior)
+        self.mediciones[nombre] = self.mediciones.get(nombre, 0) + 1
+
+    def costo(self, nombre: str) -> float:
+        return self._costos.get(nombre, float("inf"))
+
+    def etapas(self, nombres: List[str], limites: List[float]) -> List[List[str]]:
+        """Filtros ordenados por costo y agrupados según los límites; las etapas vacías se omiten."""
+        etapas: List[List[str]] = [[] for _ in range(len(limites) + 1)]
+        for nombre in sorted(nombres, key=self.costo):
+            etapas[sum(self.costo(nombre) > limite for limite in limites)].append(nombre)
+        return [etapa for etapa in etapas if etapa]
+
+    def estadisticas(self) -> Dict:
+        return {nombre: {"costo_ms": round(costo, 2), "mediciones": self.mediciones.get(nombre, 0)}
+                for nombre, costo in sorted(self._costos.items(), key=lambda c: c[1])}
+
+costos_filtros = CostosFiltros(COSTOS_INICIALES)
+
+async def _ejecutar_filtro(nombre: str, img: ImagenDecodificada):
+    inicio = time.perf_counter()
+    try:
+        filtro = FILTROS[nombre]
+        if asyncio.iscoroutinefunction(filtro):
+            resultado = await filtro(img)
+        else:
+            resultado = await en_hilos(filtro, img)
+        salida = {"resultado": resultado, "advertencia": resultado.get("advertencia")}
+    except EjecutorSaturado:
+        raise
+    except HTTPException as e:
+        salida = {"error": e.detail, "codigo": e.status_code, "advertencia": None}
+    except Exception as e:
+        salida = {"error": str(e), "advertencia": None}
+    salida["tiempo_ms"] = round((time.perf_counter() - inicio) * 1000, 2)
+    costos_filtros.registrar(nombre, salida["tiempo_ms"])
+    contar_veredicto(nombre, salida["advertencia"])
+    return nombre, salida
+
+def decide_veredicto(nombre: str, salida: Dict) -> bool:
+    """Según las reglas de la cascada, si este resultado ya fija el veredicto combinado."""
+    nivel = NIVELES.get(salida.get("advertencia"), -1)
+    if nivel < NIVELES.get(CASCADA_DETENER_EN, NIVELES["Alterado"]):
+        return False
+    return not CASCADA_DECISIVOS or nombre in CASCADA_DECISIVOS
+
+async def ejecutar_cascada(img: ImagenDecodificada) -> Tuple[Dict[str, Dict], Dict]:
+    """Corre los filtros por etapas de costo; dentro de una etapa, a la vez. Cuando un resultado decide el
+    veredicto se cancela lo pendiente y las etapas siguientes quedan omitidas."""
+    if CASCADA_ACTIVA:
+        etapas = costos_filtros.etapas(list(FILTROS), CASCADA_ETAPAS_MS)
+    else:
+        etapas = [list(FILTROS)]
+    filtros: Dict[str, Dict] = {}
+    decidido_por = None
+    for etapa in etapas:
+        if decidido_por is not None:
+            break
+        pendientes = {asyncio.ensure_future(_ejecutar_filtro(nombre, img)) for nombre in etapa}
+        try:
+            while pendientes and decidido_por is None:
+                hechas, pendientes = await asyncio.wait(pendientes, return_when=asyncio.FIRST_COMPLETED)
+                for tarea in hechas:
+                    nombre, salida = tarea.result()
+                    filtros[nombre] = salida
+                    if CASCADA_ACTIVA and decidido_por is None and decide_veredicto(nombre, salida):
+                        decidido_por = nombre
+        finally:
+            for tarea in pendientes:
+                tarea.cancel()
+    omitidos = [nombre for nombre in FILTROS if nombre not in filtros]
+    for nombre in omitidos:
+        filtros[nombre] = {"omitido": True, "advertencia": None}
+        contar_veredicto(nombre, "omitido")
+    cascada = {"etapas": etapas, "decidido_por": decidido_por, "omitidos": omitidos}
+    return {nombre: filtros[nombre] for nombre in FILTROS}, cascada
+
+def es_definitivo(filtros: Dict[str, Dict]) -> bool:
+    """Sin errores transitorios (OCR caído, pool saturado): un 4xx del filtro depende solo de la imagen."""
+    return all("error" not in f or 400 <= f.get("codigo", 500) < 500 for f in filtros.values())
+
+def combinar_veredicto(filtros: Dict[str, Dict]) -> Optional[str]:
+    """El veredicto combinado es el peor de los filtros que llegaron a una advertencia."""
+    advertencias = [f["advertencia"] for f in filtros.values() if f.get("advertencia") in NIVELES]
+    if not advertencias:
+        return None
+    return max(advertencias, key=lambda a: NIVELES[a])
+
+async def _buscar_duplicado(img: ImagenDecodificada) -> Tuple[Optional[int], Optional[Dict], Optional[Dict]]:
+    """Huella de la imagen, bloque "duplicado" si ya se vio una captura casi igual y su documento guardado."""
+    huella = await en_hilos(getattr, img, "huella")
+    coincidencia = indice_huellas.buscar(huella)
+    if coincidencia is None:
+        return huella, None, None
+    duplicado = {"id": coincidencia.id, "distancia": coincidencia.distancia, "exacto": coincidencia.id == img.sha256}
+    doc = await indice_huellas.obtener(coincidencia.id)
+    if doc:
+        duplicado["veces"] = doc.get("veces")
+        duplicado["primera_vez"] = doc["creada"].isoformat() if doc.get("creada") else None
+        duplicado["veredicto"] = (doc.get("respuesta") or {}).get("veredicto")
+    return huella, duplicado, doc
+
+async def verificar_imagen(img: ImagenDecodificada) -> Dict:
+    huella = duplicado = doc = None
+    if HUELLAS_ACTIVAS:
+        huella, duplicado, doc = await _buscar_duplicado(img)
+        misma_captura = duplicado is not None and (duplicado["exacto"] or duplicado["distancia"] == 0)
+        if misma_captura and HUELLA_REUTILIZAR and doc and doc.get("respuesta"):
+            contar_reenvio(True)
+            indice_huellas.visto(duplicado["id"])
+            contar_veredicto("verificar", doc["respuesta"]["veredicto"])
+            return {**doc["respuesta"], "duplicado": duplicado}
+        if duplicado is not None:
+            contar_reenvio(False)
+    sha256 = await en_hilos(getattr, img, "sha256")
+    memorizada = cache_veredictos.obtener(f"verificar:{sha256}")
+    if memorizada is not None:
+        respuesta = {**memorizada, "memorizado": True}
+        contar_veredicto("verificar", respuesta["veredicto"])
+        if huella is not None:
+            indice_huellas.registrar(sha256, huella)
+    else:
+        filtros, cascada = await ejecutar_cascada(img)
+        veredicto = combinar_veredicto(filtros)
+        contar_veredicto("verificar", veredicto)
+        respuesta = {"veredicto": veredicto, "filtros": filtros, "cascada": cascada}
+        completo = es_definitivo(filtros)
+        if completo:
+            cache_veredictos.guardar(f"verificar:{sha256}", dict(respuesta))
+        if huella is not None:
+            indice_huellas.registrar(sha256, huella, dict(respuesta) if completo else None)
+    if duplicado is not None:
+        respuesta["duplicado"] = duplicado
+    return respuesta
+
+@router.post("/verificar")
+async def verificar(file: UploadFile = File(...)):
+    if not file.content_type or not file.content_type.startswith('image/'):
+        raise HTTPException(status_code=422, detail="El archivo debe ser una imagen")
+    inicio = time.perf_counter()
+    content = await file.read()
+    try:
+        img = await en_hilos(ImagenDecodificada, content)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    tiempo_decodificacion = time.perf_counter() - inicio
+
+    respuesta = await verificar_imagen(img)
+    respuesta["tiempos"] = {
+        "decodificacion_ms": round(tiempo_decodificacion * 1000, 2),
+        "total_ms": round((time.perf_counter() - inicio) * 1000, 2)
+    }
+    return respuesta
+
+@router.get("/verificar/costos")
+async def costos_verificar():
+    return {"cascada": CASCADA_ACTIVA, "detener_en": CASCADA_DETENER_EN, "etapas_ms": CASCADA_ETAPAS_MS,
+            "filtros": costos_filtros.estadisticas()}
+
+#Lote
+class ElementoLote(NamedTuple):
+    nombre: str
+    tamano: Optional[int]
+    # El contenido se lee recién al verificarlo, para no tener el lote entero en memoria
+    leer: Callable[[], bytes]
+
+def _es_zip(archivo: ArchivoSubido) -> bool:
+    return archivo.content_type in TIPOS_ZIP or (archivo.filename or "").lower().endswith(".zip")
+
+def _leer_subida(archivo: ArchivoSubido) -> bytes:
+    archivo.file.seek(0)
+    return archivo.file.read()
+
+def indexar_lote(archivos: List[ArchivoSubido], zips: List[zipfile.ZipFile]) -> List[ElementoLote]:
+    """Un elemento por imagen subida o por archivo dentro de cada zip (solo se lee el índice del zip)."""
+    elementos = []
+    for archivo in archivos:
+        if not _es_zip(archivo):
+            elementos.append(ElementoLote(archivo.filename or "imagen", archivo.size, lambda a=archivo: _leer_subida(a)))
+            continue
+        try:
+            zf = zipfile.ZipFile(archivo.file)
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail=f"Zip inválido: {archivo.filename}")
+        zips.append(zf)
+        for info in zf.infolist():
+            if not info.is_dir():
+                elementos.append(ElementoLote(info.filename, info.file_size, lambda zf=zf, info=info: zf.read(info)))
+    if not elementos:
+        raise HTTPException(status_code=422, detail="El lote no contiene imágenes")
+    if len(elementos) > LOTE_MAXIMO:
+        raise HTTPException(status_code=413, detail=f"El lote supera el máximo de {LOTE_MAXIMO} comprobantes")
+    return elementos
+
+async def verificar_elemento(indice: int, elemento: ElementoLote) -> Dict:
+    inicio = time.perf_counter()
+    linea = {"indice": indice, "nombre": elemento.nombre}
+    try:
+        if elemento.tamano is not None and elemento.tamano > LOTE_TAMANO_MAXIMO:
+            raise ValueError("La imagen supera el tamaño máximo")
+        img = await en_hilos(lambda: ImagenDecodificada(elemento.leer()))
+        linea.update(await verificar_imagen(img))
+    except HTTPException as e:
+        linea["error"] = e.detail
+    except Exception as e:
+        linea["error"] = str(e)
+    linea["total_ms"] = round((time.perf_counter() - inicio) * 1000, 2)
+    return linea
+
+async def _trabajador_lote(pendientes: Iterator[Tuple[int, ElementoLote]], cola: asyncio.Queue):
+    cancelado = False
+    try:
+        for indice, elemento in pendientes:
+            await cola.put(await verificar_elemento(indice, elemento))
+    except asyncio.CancelledError:
+        # El cliente dejó de leer: nadie va a sacar el aviso de fin y la cola puede estar llena
+        cancelado = True
+        raise
+    finally:
+        if not cancelado:
+            await cola.put(None)
+
+async def lineas_lote(elementos: List[ElementoLote], zips: List[zipfile.ZipFile],
+                      cerrar: Optional[Callable[[], Awaitable[None]]] = None):
+    """NDJSON en orden de llegada: a lo sumo LOTE_CONCURRENCIA comprobantes en curso y otros tantos esperando
+    al cliente, así la memoria no crece con el tamaño del lote. Al terminar o cortarse el stream se cancelan
+    los trabajadores, se cierran los zips y se llama a cerrar (el formulario multipart)."""
+    pendientes = enumerate(elementos)
+    cola = asyncio.Queue(maxsize=LOTE_CONCURRENCIA)
+    trabajadores = [asyncio.create_task(_trabajador_lote(pendientes, cola)) for _ in range(min(LOTE_CONCURRENCIA, len(elementos)))]
+    try:
+        activos = len(trabajadores)
+        while activos:
+            linea = await cola.get()
+            if linea is None:
+                activos -= 1
+                continue
+            yield json.dumps(linea, ensure_ascii=False) + "\n"
+    finally:
+        for trabajador in trabajadores:
+            trabajador.cancel()
+        await asyncio.gather(*trabajadores, return_exceptions=True)
+        for zf in zips:
+            zf.close()
+        if cerrar is not None:
+            await cerrar()
+
+ESQUEMA_LOTE = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["files"],
+            "properties": {"files": {"type": "array", "items": {"type": "string", "format": "binary"},
+                                     "description": "Imágenes y/o archivos .zip con imágenes"}},
+        }}},
+    }
+}
+
+@router.post("/verificar/lote", openapi_extra=ESQUEMA_LOTE)
+async def verificar_lote(request: Request):
+    # El formulario se lee aquí y no con File(...): FastAPI cierra esas subidas antes de que termine el streaming
+    formulario = await request.form(max_files=LOTE_MAXIMO)
+    zips: List[zipfile.ZipFile] = []
+    try:
+        archivos = [a for a in formulario.getlist("files") if isinstance(a, ArchivoSubido)]
+        elementos = await en_hilos(indexar_lote, archivos, zips)
+    except BaseException:
+        for zf in zips:
+            zf.close()
+        await formulario.close()
+        raise
+    return StreamingResponse(lineas_lote(elementos, zips, formulario.close), media_type="application/x-ndjson")
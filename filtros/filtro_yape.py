@@ -2,8 +2,14 @@
 import cv2
 import numpy as np
 from fastapi import APIRouter, File, UploadFile, HTTPException
+from filtros.cache_veredictos import memorizar
+from filtros.ejecutor import en_hilos
+from filtros.imagen import decodificar_imagen
+from metricas import contar_veredicto
 
 router = APIRouter()
+# Solo mide proporciones de color: basta con 1/4 de la resolución
+REDUCCION_DECODIFICACION = 4
 
 class NotYapeTransaction(Exception):
     pass
@@ -13,20 +19,26 @@ def is_yape_transaction(
     purple_ratio_thresh: float = 0.2,
     white_ratio_thresh: float = 0.3
 ) -> bool:
-    nparr = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-    if img is None or img.size == 0:
+    img = decodificar_imagen(image_bytes, reduccion=REDUCCION_DECODIFICACION)
+    if img is None:
         raise ValueError("Imagen corrupta o formato no soportado.")
 
     hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    return is_yape_transaction_hsv(hsv, purple_ratio_thresh, white_ratio_thresh)
+
+def is_yape_transaction_hsv(
+    hsv: np.ndarray,
+    purple_ratio_thresh: float = 0.2,
+    white_ratio_thresh: float = 0.3
+) -> bool:
     lower_purple = np.array([120, 50, 50])
     upper_purple = np.array([160, 255, 255])
     mask_purple = cv2.inRange(hsv, lower_purple, upper_purple)
-    purple_ratio = cv2.countNonZero(mask_purple) / (img.shape[0] * img.shape[1])
+    purple_ratio = cv2.countNonZero(mask_purple) / (hsv.shape[0] * hsv.shape[1])
     lower_white = np.array([0, 0, 200])
     upper_white = np.array([180, 30, 255])
     mask_white = cv2.inRange(hsv, lower_white, upper_white)
-    white_ratio = cv2.countNonZero(mask_white) / (img.shape[0] * img.shape[1])
+    white_ratio = cv2.countNonZero(mask_white) / (hsv.shape[0] * hsv.shape[1])
     if purple_ratio > purple_ratio_thresh and white_ratio > white_ratio_thresh:
         return True
 
@@ -37,11 +49,22 @@ def is_yape_transaction(
 @router.post("/filter_yape")
 async def filter_yape(file: UploadFile = File(...)):
     img_bytes = await file.read()
+
+    async def evaluar() -> str:
+        try:
+            await en_hilos(is_yape_transaction, img_bytes)
+            return ""
+        except NotYapeTransaction as e:
+            return str(e)
+
     try:
-        is_yape_transaction(img_bytes)
+        motivo = await memorizar("filter_yape", img_bytes, evaluar)
+        contar_veredicto("filter_yape", "Alterado" if motivo else "Auténtico", "ruta")
+        if motivo:
+            raise HTTPException(status_code=400, detail=motivo)
         return {"resultado": "ok"}
-    except NotYapeTransaction as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
@@ -0,0 +1,241 @@
+# Índice de huellas perceptuales: detecta reenvíos de la misma captura (recomprimida, escalada o recortada)
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional
+from fastapi import APIRouter
+from fastapi.encoders import jsonable_encoder
+from pymongo import UpdateOne
+from bd import huellas_coll
+from filtros.imagen import BITS_HUELLA
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+HUELLAS_ACTIVAS = os.getenv("HUELLAS_ACTIVAS", "1") == "1"
+# Distancia de Hamming (de BITS_HUELLA) hasta la que dos subidas se consideran la misma captura.
+# Recompresión, escala y recorte de bordes quedan en <= 12 bits; otro comprobante de la misma plantilla
+# que solo cambia un dígito puede quedar cerca, por eso la coincidencia se informa como posible reenvío.
+HUELLA_BITS = int(os.getenv("HUELLA_BITS", "12"))
+# Con la misma captura (sha256 igual o huella a distancia 0), devolver el veredicto ya guardado en lugar de
+# volver a correr los filtros. Nunca con coincidencias aproximadas: una edición de un dígito puede quedar cerca
+HUELLA_REUTILIZAR = os.getenv("HUELLA_REUTILIZAR", "0") == "1"
+HUELLA_MAXIMO = int(os.getenv("HUELLA_MAXIMO", "100000"))
+HUELLA_MONGO_TIMEOUT = float(os.getenv("HUELLA_MONGO_TIMEOUT", "0.5"))
+HUELLA_CARGA_TIMEOUT = float(os.getenv("HUELLA_CARGA_TIMEOUT", "10"))
+# Las altas y reenvíos se escriben en MongoDB en segundo plano, en lotes cada intervalo (o al llenarse el lote)
+HUELLA_ESCRITURA_INTERVALO = float(os.getenv("HUELLA_ESCRITURA_INTERVALO", "1"))
+HUELLA_ESCRITURA_LOTE = int(os.getenv("HUELLA_ESCRITURA_LOTE", "500"))
+
+def distancia(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+class IndiceHamming:
+    """Multi-index hashing: la huella se parte en radio+1 bloques de bits. Por el principio del palomar, toda
+    huella a distancia <= radio coincide exactamente en al menos un bloque: basta mirar esos cubos y verificar."""
+
+    def __init__(self, bits: int, radio: int):
+        self.radio = radio
+        bloques = radio + 1
+        ancho = -(-bits // bloques)
+        self._cortes = [(i * ancho, (1 << ancho) - 1) for i in range(bloques)]
+        self._cubos: List[Dict[int, List[str]]] = [{} for _ in range(bloques)]
+
+    def agregar(self, huella: int, ident: str):
+        for (desplazamiento, mascara), cubos in zip(self._cortes, self._cubos):
+            cubos.setdefault((huella >> desplazamiento) & mascara, []).append(ident)
+
+    def quitar(self, huella: int, ident: str):
+        for (desplazamiento, mascara), cubos in zip(self._cortes, self._cubos):
+            clave = (huella >> desplazamiento) & mascara
+            cubo = cubos.get(clave)
+            if cubo is not None and ident in cubo:
+                cubo.remove(ident)
+                if not cubo:
+                    del cubos[clave]
+
+    def candidatos(self, huella: int) -> set:
+        encontrados = set()
+        for (desplazamiento, mascara), cubos in zip(self._cortes, self._cubos):
+            encontrados.update(cubos.get((huella >> desplazamiento) & mascara, ()))
+        return encontrados
+
+class Coincidencia(NamedTuple):
+    id: str
+    distancia: int
+
+class IndiceHuellas:
+    """Huellas en memoria (multi-index hashing) respaldadas por la colección huellas, con el veredicto de cada captura."""
+
+    def __init__(self, bits: int = HUELLA_BITS, maximo: int = HUELLA_MAXIMO, coleccion=huellas_coll,
+                 intervalo: float = HUELLA_ESCRITURA_INTERVALO, lote: int = HUELLA_ESCRITURA_LOTE):
+        self.bits = bits
+        self.maximo = maximo
+        self.coleccion = coleccion
+        self.intervalo = intervalo
+        self.lote = lote
+        self._entradas: "OrderedDict[str, int]" = OrderedDict()
+        self._indice = IndiceHamming(BITS_HUELLA, bits)
+        # Cambios aún no escritos en MongoDB, combinados por captura
+        self._pendientes: Dict[str, Dict] = {}
+        self._lote_lleno: Optional[asyncio.Event] = None
+        self._tarea: Optional[asyncio.Task] = None
+        self.escrituras_fallidas = 0
+        self.consultas = 0
+        self.coincidencias = 0
+        self.candidatos_verificados = 0
+        self._tiempo_busqueda = 0.0
+
+    def _agregar_local(self, ident: str, huella: int):
+        if ident in self._entradas:
+            self._entradas.move_to_end(ident)
+            return
+        self._entradas[ident] = huella
+        self._indice.agregar(huella, ident)
+        while len(self._entradas) > self.maximo:
+            viejo, huella_vieja = self._entradas.popitem(last=False)
+            self._indice.quitar(huella_vieja, viejo)
+
+    async def cargar(self):
+        """Carga las huellas más recientes de MongoDB (se llama al iniciar la app)."""
+        async def _cargar():
+            cursor = self.coleccion.find({}, {"huella": 1}).sort("vista", -1).limit(self.maximo)
+            documentos = await cursor.to_list(length=self.maximo)
+            for doc in reversed(documentos):
+                self._agregar_local(doc["_id"], int(doc["huella"], 16))
+        try:
+            await asyncio.wait_for(_cargar(), HUELLA_CARGA_TIMEOUT)
+        except Exception as e:
+            logger.warning("No se pudieron cargar las huellas: %s", e)
+
+    def buscar(self, huella: int) -> Optional[Coincidencia]:
+        inicio = time.perf_counter()
+        candidatos = self._indice.candidatos(huella)
+        mejor = min(((distancia(huella, self._entradas[i]), i) for i in candidatos), default=None)
+        self._tiempo_busqueda += time.perf_counter() - inicio
+        self.consultas += 1
+        self.candidatos_verificados += len(candidatos)
+        if mejor is None or mejor[0] > self.bits:
+            return None
+        self.coincidencias += 1
+        return Coincidencia(mejor[1], mejor[0])
+
+    async def obtener(self, ident: str) -> Optional[Dict]:
+        """Documento de la captura, con los cambios que aún no llegaron a MongoDB."""
+        try:
+            doc = await asyncio.wait_for(self.coleccion.find_one({"_id": ident}), HUELLA_MONGO_TIMEOUT)
+        except Exception as e:
+            logger.warning("Huellas en MongoDB no disponibles: %s", e)
+            doc = None
+        pendiente = self._pendientes.get(ident)
+        if pendiente is None:
+            return doc
+        doc = dict(doc or {"_id": ident})
+        doc["veces"] = doc.get("veces", 0) + pendiente["veces"]
+        doc.setdefault("creada", pendiente["creada"])
+        if pendiente["respuesta"] is not None:
+            doc["respuesta"] = pendiente["respuesta"]
+        return doc
+
+    def registrar(self, ident: str, huella: int, respuesta: Optional[Dict] = None):
+        """Guarda la captura (o suma un reenvío si ya existía); respuesta = {"veredicto", "filtros"} a reutilizar.
+        Solo toca memoria: la escritura en MongoDB queda pendiente para el próximo lote."""
+        self._agregar_local(ident, huella)
+        pendiente = self._anotar(ident)
+        pendiente["huella"] = format(huella, "x")
+        if respuesta is not None:
+            pendiente["respuesta"] = jsonable_encoder(respuesta)
+
+    def visto(self, ident: str):
+        """Suma un reenvío de una captura ya guardada sin tocar su huella (la subida nueva puede diferir en algunos bits)."""
+        if ident in self._entradas:
+            self._entradas.move_to_end(ident)
+        self._anotar(ident)
+
+    def _anotar(self, ident: str) -> Dict:
+        ahora = datetime.utcnow()
+        pendiente = self._pendientes.setdefault(ident, {"creada": ahora, "veces": 0, "huella": None, "respuesta": None})
+        pendiente.update(vista=ahora, veces=pendiente["veces"] + 1)
+        if len(self._pendientes) >= self.lote and self._lote_lleno is not None:
+            self._lote_lleno.set()
+        return pendiente
+
+    async def escribir(self):
+        """Escribe en MongoDB los cambios pendientes con un solo bulk_write."""
+        if not self._pendientes:
+            return
+        pendientes, self._pendientes = self._pendientes, {}
+        operaciones = []
+        for ident, p in pendientes.items():
+            cambios = {"$set": {"vista": p["vista"]}, "$setOnInsert": {"creada": p["creada"]}, "$inc": {"veces": p["veces"]}}
+            if p["huella"] is not None:
+                cambios["$set"]["huella"] = p["huella"]
+            if p["respuesta"] is not None:
+                cambios["$set"]["respuesta"] = p["respuesta"]
+            # Un reenvío (sin huella) solo actualiza la captura si sigue guardada
+            operaciones.append(UpdateOne({"_id": ident}, cambios, upsert=p["huella"] is not None))
+        try:
+            await asyncio.wait_for(self.coleccion.bulk_write(operaciones, ordered=False), HUELLA_CARGA_TIMEOUT)
+        except asyncio.CancelledError:
+            self._devolver(pendientes)
+            raise
+        except Exception as e:
+            self.escrituras_fallidas += len(operaciones)
+            logger.warning("No se pudieron guardar %d huellas en MongoDB: %s", len(operaciones), e)
+            # Se reintentan en el próximo lote mientras no se acumulen más que las huellas en memoria
+            if len(self._pendientes) + len(pendientes) <= self.maximo:
+                self._devolver(pendientes)
+
+    def _devolver(self, pendientes: Dict[str, Dict]):
+        for ident, p in pendientes.items():
+            nuevo = self._pendientes.get(ident)
+            if nuevo is not None:
+                p.update(huella=nuevo["huella"] if nuevo["huella"] is not None else p["huella"],
+                         vista=nuevo["vista"], veces=p["veces"] + nuevo["veces"],
+                         respuesta=nuevo["respuesta"] if nuevo["respuesta"] is not None else p["respuesta"])
+            self._pendientes[ident] = p
+
+    async def _bucle(self):
+        while self._tarea is not None:
+            try:
+                await asyncio.wait_for(self._lote_lleno.wait(), self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            self._lote_lleno.clear()
+            await self.escribir()
+
+    def iniciar(self):
+        self._lote_lleno = asyncio.Event()
+        self._tarea = asyncio.create_task(self._bucle())
+
+    async def detener(self):
+        """Detiene el escritor (sin cancelarlo a mitad de un lote) y escribe lo que quede pendiente."""
+        if self._tarea is not None:
+            tarea, self._tarea = self._tarea, None
+            self._lote_lleno.set()
+            await tarea
+        await self.escribir()
+
+    def estadisticas(self) -> Dict:
+        return {
+            "activas": HUELLAS_ACTIVAS,
+            "huellas": len(self._entradas),
+            "maximo": self.maximo,
+            "bits": self.bits,
+            "reutilizar": HUELLA_REUTILIZAR,
+            "escrituras_pendientes": len(self._pendientes),
+            "escrituras_fallidas": self.escrituras_fallidas,
+            "consultas": self.consultas,
+            "coincidencias": self.coincidencias,
+            "candidatos_medios": round(self.candidatos_verificados / self.consultas, 2) if self.consultas else 0.0,
+            "busqueda_media_ms": round(self._tiempo_busqueda / self.consultas * 1000, 4) if self.consultas else 0.0,
+        }
+
+indice_huellas = IndiceHuellas()
+
+@router.get("/verificar/huellas")
+async def estadisticas_huellas():
+    return indice_huellas.estadisticas()
@@ -0,0 +1,108 @@
+# Imagen decodificada compartida
+import hashlib
+import io
+import threading
+from typing import Optional
+import cv2
+import numpy as np
+from PIL import Image
+from filtros.preprocesado_ocr import detectar_cuadro_blanco
+from metricas import medir
+
+_FLAGS_REDUCIDOS = {
+    (cv2.IMREAD_COLOR, 2): cv2.IMREAD_REDUCED_COLOR_2,
+    (cv2.IMREAD_COLOR, 4): cv2.IMREAD_REDUCED_COLOR_4,
+    (cv2.IMREAD_COLOR, 8): cv2.IMREAD_REDUCED_COLOR_8,
+    (cv2.IMREAD_GRAYSCALE, 2): cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    (cv2.IMREAD_GRAYSCALE, 4): cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    (cv2.IMREAD_GRAYSCALE, 8): cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+def decodificar_imagen(contenido: bytes, flags: int = cv2.IMREAD_COLOR, reduccion: int = 1) -> Optional[np.ndarray]:
+    """Decodifica directamente desde el buffer de la subida (sin copiar ni pasar por disco). None si no es una imagen.
+    Con reduccion 2, 4 u 8 los JPEG se decodifican ya reducidos (escalado DCT), más rápido y con menos memoria."""
+    if not contenido:
+        return None
+    flags = _FLAGS_REDUCIDOS.get((flags, reduccion), flags)
+    with medir("decodificacion"):
+        imagen = cv2.imdecode(np.frombuffer(memoryview(contenido), np.uint8), flags)
+    if imagen is None or imagen.size == 0:
+        return None
+    return imagen
+
+# Huella perceptual: DCT 24x24 de la miniatura 48x48 del cuadro blanco, sin la componente continua
+LADO_HUELLA = 48
+BLOQUE_HUELLA = 24
+BITS_HUELLA = BLOQUE_HUELLA * BLOQUE_HUELLA - 1
+# Orden fijo pseudoaleatorio de los bits: reparte los que fija la plantilla entre los bloques del índice de huellas
+_ORDEN_HUELLA = np.random.default_rng(0).permutation(BITS_HUELLA)
+
+def huella_perceptual(imagen: np.ndarray) -> int:
+    """pHash de 575 bits: estable ante recompresión, escala y recorte de bordes (el cuadro blanco se detecta)."""
+    gris = cv2.cvtColor(imagen, cv2.COLOR_BGR2GRAY)
+    cuadro = detectar_cuadro_blanco(gris)
+    if cuadro is not None:
+        x, y, w, h = cuadro
+        gris = gris[y:y + h, x:x + w]
+    reducida = cv2.resize(gris, (LADO_HUELLA, LADO_HUELLA), interpolation=cv2.INTER_AREA).astype(np.float32)
+    coeficientes = cv2.dct(reducida)[:BLOQUE_HUELLA, :BLOQUE_HUELLA].ravel()[1:]
+    bits = (coeficientes > np.median(coeficientes))[_ORDEN_HUELLA]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big") >> (-BITS_HUELLA % 8)
+
+def abrir_imagen_rgb(contenido: bytes, reduccion: int = 1) -> Image.Image:
+    with medir("decodificacion_pil"):
+        imagen = Image.open(io.BytesIO(contenido))
+        if reduccion > 1 and imagen.format == "JPEG":
+            imagen.draft("RGB", (imagen.width // reduccion, imagen.height // reduccion))
+        return imagen.convert("RGB")
+
+class ImagenDecodificada:
+    """Decodifica una subida una sola vez y expone sus representaciones (BGR, gris, HSV, PIL)."""
+
+    def __init__(self, contenido: bytes):
+        if not contenido:
+            raise ValueError("El archivo está vacío")
+        self.contenido = contenido
+        self.bgr = decodificar_imagen(contenido)
+        if self.bgr is None:
+            raise ValueError("Imagen corrupta o formato no soportado.")
+        self._locks = {}
+        self._cache = {}
+
+    def _obtener(self, clave, construir):
+        with self._locks.setdefault(clave, threading.Lock()):
+            if clave not in self._cache:
+                self._cache[clave] = construir()
+            return self._cache[clave]
+
+    @property
+    def gray(self) -> np.ndarray:
+        # El gris sale del decodificador (no de cvtColor) para que los puntajes coincidan con los endpoints individuales
+        return self._obtener("gray", lambda: decodificar_imagen(self.contenido, cv2.IMREAD_GRAYSCALE))
+
+    def bgr_reducida(self, reduccion: int = 1) -> np.ndarray:
+        if reduccion <= 1:
+            return self.bgr
+        return self._obtener(("bgr", reduccion), lambda: decodificar_imagen(self.contenido, cv2.IMREAD_COLOR, reduccion))
+
+    def hsv_reducida(self, reduccion: int = 1) -> np.ndarray:
+        return self._obtener(("hsv", reduccion), lambda: cv2.cvtColor(self.bgr_reducida(reduccion), cv2.COLOR_BGR2HSV))
+
+    def pil_rgb_reducida(self, reduccion: int = 1) -> Image.Image:
+        return self._obtener(("pil_rgb", reduccion), lambda: abrir_imagen_rgb(self.contenido, reduccion))
+
+    @property
+    def sha256(self) -> str:
+        return self._obtener("sha256", lambda: hashlib.sha256(self.contenido).hexdigest())
+
+    @property
+    def huella(self) -> int:
+        return self._obtener("huella", lambda: huella_perceptual(self.bgr))
+
+    @property
+    def hsv(self) -> np.ndarray:
+        return self.hsv_reducida(1)
+
+    @property
+    def pil_rgb(self) -> Image.Image:
+        return self.pil_rgb_reducida(1)
@@ -0,0 +1,104 @@
+# Backend OCR local (Tesseract vía tesserocr) con la misma forma de respuesta que ocr.space
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import cv2
+from filtros.cliente_ocr import BackendOCR, OCRNoDisponible, OCRTimeout, OCR_TIMEOUT
+from filtros.ejecutor import en_hilos
+from filtros.imagen import decodificar_imagen
+
+# Dependencia opcional; se importa aquí porque tesserocr instala manejadores de señales y exige el hilo principal
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+# Carpeta con los .traineddata; por defecto la de la instalación de Tesseract (o TESSDATA_PREFIX)
+OCR_LOCAL_TESSDATA = os.getenv("OCR_LOCAL_TESSDATA")
+# Idioma fijo para el motor local; vacío = el 'language' de cada petición (spa)
+OCR_LOCAL_IDIOMA = os.getenv("OCR_LOCAL_IDIOMA", "")
+
+_hilo = threading.local()
+
+def _api(idioma: str):
+    # PyTessBaseAPI no es thread-safe: una instancia por hilo del pool e idioma, reutilizada entre llamadas
+    apis = getattr(_hilo, "apis", None)
+    if apis is None:
+        apis = _hilo.apis = {}
+    if idioma not in apis:
+        if tesserocr is None:
+            raise OCRNoDisponible("Motor OCR local no disponible: falta el paquete tesserocr", 503)
+        try:
+            if OCR_LOCAL_TESSDATA:
+                apis[idioma] = tesserocr.PyTessBaseAPI(path=OCR_LOCAL_TESSDATA, lang=idioma)
+            else:
+                apis[idioma] = tesserocr.PyTessBaseAPI(lang=idioma)
+        except RuntimeError as e:
+            raise OCRNoDisponible(f"Motor OCR local no disponible ({idioma}): {e}", 503)
+    return apis[idioma]
+
+def _respuesta_error(mensaje: str, inicio: float) -> Dict:
+    return {
+        "ParsedResults": [],
+        "OCRExitCode": 3,
+        "IsErroredOnProcessing": True,
+        "ErrorMessage": [mensaje],
+        "ProcessingTimeInMilliseconds": str(int((time.perf_counter() - inicio) * 1000)),
+    }
+
+def reconocer_imagen(contenido: bytes, idioma: str) -> Dict:
+    inicio = time.perf_counter()
+    gris = decodificar_imagen(contenido, cv2.IMREAD_GRAYSCALE)
+    if gris is None:
+        return _respuesta_error("No se pudo leer la imagen", inicio)
+    api = _api(idioma)
+    alto, ancho = gris.shape
+    api.SetImageBytes(gris.tobytes(), ancho, alto, 1, ancho)
+    api.Recognize()
+
+    lineas: List[Dict] = []
+    nivel = tesserocr.RIL.WORD
+    for r in tesserocr.iterate_level(api.GetIterator(), nivel):
+        texto = (r.GetUTF8Text(nivel) or "").strip()
+        caja: Optional[Tuple[int, int, int, int]] = r.BoundingBox(nivel)
+        if not texto or caja is None:
+            continue
+        x1, y1, x2, y2 = caja
+        palabra = {"WordText": texto, "Left": x1, "Top": y1, "Height": y2 - y1, "Width": x2 - x1}
+        if not lineas or r.IsAtBeginningOf(tesserocr.RIL.TEXTLINE):
+            lineas.append({"LineText": "", "Words": []})
+        lineas[-1]["Words"].append(palabra)
+    for linea in lineas:
+        linea["LineText"] = " ".join(p["WordText"] for p in linea["Words"])
+        linea["MaxHeight"] = max(p["Height"] for p in linea["Words"])
+        linea["MinTop"] = min(p["Top"] for p in linea["Words"])
+
+    return {
+        "ParsedResults": [{
+            "TextOverlay": {"Lines": lineas, "HasOverlay": True},
+            "FileParseExitCode": 1,
+            "ParsedText": "".join(linea["LineText"] + "\r\n" for linea in lineas),
+            "ErrorMessage": "",
+        }],
+        "OCRExitCode": 1,
+        "IsErroredOnProcessing": False,
+        "ProcessingTimeInMilliseconds": str(int((time.perf_counter() - inicio) * 1000)),
+    }
+
+class BackendOCRLocal(BackendOCR):
+    """Tesseract en el pool de hilos (tesserocr libera el GIL mientras reconoce): sin red ni límites de cuota."""
+
+    nombre = "local"
+
+    def __init__(self, idioma: str = OCR_LOCAL_IDIOMA, timeout: float = OCR_TIMEOUT):
+        self.idioma = idioma
+        self.timeout = timeout
+
+    async def reconocer(self, archivo: Tuple[str, bytes, str], datos: Dict[str, str], timeout: Optional[float] = None) -> Dict:
+        idioma = self.idioma or datos.get("language", "spa")
+        try:
+            return await asyncio.wait_for(en_hilos(reconocer_imagen, archivo[1], idioma), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            raise OCRTimeout("El OCR local tardó demasiado (timeout).", 504)
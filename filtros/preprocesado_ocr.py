@@ -0,0 +1,104 @@
+# Preprocesado compartido antes del OCR: recorte del cuadro blanco, menos profundidad de color y coordenadas de vuelta
+import os
+from typing import Dict, NamedTuple, Optional, Tuple
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "binario" (PNG de 1 bit, Otsu), "gris" (JPEG en escala de grises) o "color" (PNG a color, como antes).
+# binario solo está validado con el backend local; ocr.space recibe gris mientras no se compare su precisión
+OCR_PREPROCESADO = os.getenv("OCR_PREPROCESADO", "binario" if os.getenv("OCR_BACKEND", "ocrspace") == "local" else "gris")
+OCR_CALIDAD_JPEG = int(os.getenv("OCR_CALIDAD_JPEG", "85"))
+# Por encima de este lado (px) la imagen se reduce a la mitad antes de recortar
+LADO_MAXIMO = 2000
+UMBRAL_BLANCO = 240
+# Fracción mínima de la imagen que debe ocupar el cuadro blanco para enviar solo el recorte
+AREA_MINIMA_RECORTE = 0.2
+# Parámetros del OCR comunes a filtro_claves y filtro_ocr: con el mismo recorte, una sola llamada sirve a los dos
+DATOS_OCR = {"language": "spa", "OCREngine": "2", "isOverlayRequired": "true"}
+
+TIPOS_MIME = {".png": "image/png", ".jpg": "image/jpeg"}
+
+class TransformacionOCR(NamedTuple):
+    """Posición del recorte y escala aplicada: original = (recorte + desplazamiento) / escala."""
+    x: int
+    y: int
+    escala: float
+
+class ImagenOCR(NamedTuple):
+    contenido: bytes
+    extension: str
+    transformacion: TransformacionOCR
+
+    @property
+    def archivo(self) -> Tuple[str, bytes, str]:
+        return f"recorte{self.extension}", self.contenido, TIPOS_MIME[self.extension]
+
+def detectar_cuadro_blanco(gris: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+    _, binaria = cv2.threshold(gris, UMBRAL_BLANCO, 255, cv2.THRESH_BINARY)
+    contornos, _ = cv2.findContours(binaria, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contornos:
+        return None
+    return cv2.boundingRect(max(contornos, key=cv2.contourArea))
+
+def codificar(imagen: np.ndarray, gris: np.ndarray, modo: str) -> Tuple[bytes, str]:
+    if modo == "color":
+        return cv2.imencode(".png", imagen)[1].tobytes(), ".png"
+    if modo == "gris":
+        return cv2.imencode(".jpg", gris, [cv2.IMWRITE_JPEG_QUALITY, OCR_CALIDAD_JPEG])[1].tobytes(), ".jpg"
+    _, binaria = cv2.threshold(gris, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return cv2.imencode(".png", binaria, [cv2.IMWRITE_PNG_BILEVEL, 1])[1].tobytes(), ".png"
+
+def preparar_imagen_ocr(imagen: np.ndarray, modo: str = OCR_PREPROCESADO, recortar: bool = True,
+                        area_minima: float = 0.0) -> Optional[ImagenOCR]:
+    """Imagen BGR -> bytes listos para el OCR. None si se pidió recorte y no hay cuadro blanco de al menos
+    area_minima (fracción de la imagen); con recortar=False se envía la imagen completa."""
+    escala = 1.0
+    if imagen.shape[0] > LADO_MAXIMO or imagen.shape[1] > LADO_MAXIMO:
+        imagen = cv2.resize(imagen, (0, 0), fx=0.5, fy=0.5)
+        escala = 0.5
+    gris = cv2.cvtColor(imagen, cv2.COLOR_BGR2GRAY)
+    x = y = 0
+    if recortar:
+        cuadro = detectar_cuadro_blanco(gris)
+        if cuadro is None or cuadro[2] * cuadro[3] < area_minima * gris.size:
+            return None
+        x, y, w, h = cuadro
+        imagen, gris = imagen[y:y + h, x:x + w], gris[y:y + h, x:x + w]
+    contenido, extension = codificar(imagen, gris, modo)
+    return ImagenOCR(contenido, extension, TransformacionOCR(x, y, escala))
+
+def _mapear(valor, desplazamiento: int, escala: float):
+    try:
+        return (float(valor) + desplazamiento) / escala
+    except (TypeError, ValueError):
+        return valor
+
+def mapear_overlay(data_ocr: Dict, t: TransformacionOCR) -> Dict:
+    """Copia de la respuesta con las coordenadas del overlay en el marco de la imagen original
+    (la respuesta puede venir de la caché del cliente OCR: no se modifica)."""
+    if t == (0, 0, 1.0) or not data_ocr:
+        return data_ocr
+    resultados = []
+    for resultado in data_ocr.get("ParsedResults") or []:
+        overlay = resultado.get("TextOverlay") or {}
+        lineas = []
+        for linea in overlay.get("Lines") or []:
+            palabras = [
+                {**p, **{k: _mapear(p[k], d, t.escala) for k, d in (("Left", t.x), ("Top", t.y), ("Width", 0), ("Height", 0)) if k in p}}
+                for p in linea.get("Words") or []
+            ]
+            nueva = {**linea, "Words": palabras}
+            if "MinTop" in linea:
+                nueva["MinTop"] = _mapear(linea["MinTop"], t.y, t.escala)
+            if "MaxHeight" in linea:
+                nueva["MaxHeight"] = _mapear(linea["MaxHeight"], 0, t.escala)
+            lineas.append(nueva)
+        resultados.append({**resultado, "TextOverlay": {**overlay, "Lines": lineas}})
+    return {**data_ocr, "ParsedResults": resultados}
+
+def preparar_comprobante(imagen: np.ndarray) -> Optional[ImagenOCR]:
+    """Recorte del cuadro blanco que leen filtro_claves y filtro_ocr; None si no hay uno de AREA_MINIMA_RECORTE."""
+    return preparar_imagen_ocr(imagen, area_minima=AREA_MINIMA_RECORTE)
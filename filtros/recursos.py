@@ -0,0 +1,50 @@
+# Versión de los recursos de los filtros (plantillas, logo): huella de mtimes vista desde este proceso
+# más un contador que suben los filtros al cambiar recursos que no son archivos
+import hashlib
+import os
+import threading
+import time
+from typing import Callable, Iterable, List, Optional
+
+# Cada cuánto (s) se vuelven a mirar los mtimes de los archivos vigilados; 0 = en cada consulta
+RECURSOS_REVISION_SEGUNDOS = float(os.getenv("RECURSOS_REVISION_SEGUNDOS", "1"))
+
+_version = 0
+_fuentes: List[Callable[[], Iterable[str]]] = []
+_huella: Optional[str] = None
+_revisada = 0.0
+_lock = threading.Lock()
+
+def vigilar(rutas: Callable[[], Iterable[str]]):
+    """Registra una función que devuelve archivos de los que dependen los resultados de un filtro."""
+    global _huella
+    with _lock:
+        _fuentes.append(rutas)
+        _huella = None
+
+def recursos_cambiaron():
+    global _version
+    with _lock:
+        _version += 1
+
+def _calcular_huella() -> str:
+    h = hashlib.sha256()
+    for ruta in sorted({ruta for fuente in _fuentes for ruta in fuente()}):
+        try:
+            estado = os.stat(ruta)
+            h.update(f"{ruta}:{estado.st_mtime_ns}:{estado.st_size}\0".encode())
+        except OSError:
+            h.update(f"{ruta}:-\0".encode())
+    return h.hexdigest()[:16]
+
+def huella_recursos() -> str:
+    global _huella, _revisada
+    ahora = time.monotonic()
+    with _lock:
+        if _huella is None or ahora - _revisada >= RECURSOS_REVISION_SEGUNDOS:
+            _huella = _calcular_huella()
+            _revisada = ahora
+        return _huella
+
+def version_recursos() -> str:
+    return f"{_version}:{huella_recursos()}"
@@ -1,12 +1,13 @@
 # Login
+import uuid
 from fastapi import APIRouter, HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 from bson import ObjectId
 from bd import users_coll
-from auth import create_password_reset_token, reset_password
+from auth import create_password_reset_token, reset_password, invalidar_usuario_cache
 from typing import Optional
 from schemas import UserCreate, UserOut, Token, PasswordChange, RequestPasswordReset, ConfirmPasswordReset
-from auth import get_password_hash, verify_password, create_access_token, get_current_user, save_token, revoke_token, revoke_all_tokens
+from auth import hash_password_async, verify_password_async, verify_and_update_password, create_access_token, get_current_user, save_token, revoke_token, revoke_all_tokens
 
 router = APIRouter()
 
@@ -20,7 +21,7 @@ async def register(user: UserCreate):
     if await users_coll.find_one({"username": user.username}):
         raise HTTPException(status.HTTP_400_BAD_REQUEST,
             detail={"error_code":"USERNAME_TAKEN","message":"Usuario ya en uso"})
-    hashed_pw = get_password_hash(user.password)
+    hashed_pw = await hash_password_async(user.password)
     res = await users_coll.insert_one({
         "email": user.email,
         "username": user.username,
@@ -38,16 +39,23 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
         user = await users_coll.find_one({"username": form_data.username})
     
     # Verificamos si el usuario existe y la contraseña es correcta
-    if not user or not verify_password(form_data.password, user["hashed_password"]):
+    valida, nuevo_hash = (await verify_and_update_password(form_data.password, user["hashed_password"])) if user else (False, None)
+    if not valida:
         raise HTTPException(status.HTTP_401_UNAUTHORIZED,
             detail={"error_code":"INVALID_CREDENTIALS","message":"Email o contraseña incorrectos"},
             headers={"WWW-Authenticate": "Bearer"})
+
+    # Rehash transparente si el hash guardado usa un esquema o costo obsoleto
+    if nuevo_hash:
+        await users_coll.update_one({"_id": user["_id"]}, {"$set": {"hashed_password": nuevo_hash}})
+        invalidar_usuario_cache(user_id=str(user["_id"]))
     
-    # Generamos el token con el email del usuario
-    token = create_access_token(sub=user["email"])
+    # Generamos el token con el email del usuario y el id de sesión (sid) que usa el modo stateless
+    session_id = str(uuid.uuid4())
+    token = create_access_token(sub=user["email"], session_id=session_id)
     
     # Guardamos el token en la colección de sesiones
-    session_id = await save_token(str(user["_id"]), token)
+    await save_token(str(user["_id"]), token, session_id)
     
     return {"access_token": token, "token_type": "bearer", "session_id": session_id}
 
@@ -63,14 +71,15 @@ async def logout_all(current_user=Depends(get_current_user)):
 
 @router.put("/change-password")
 async def change_password(data: PasswordChange, current_user=Depends(get_current_user)):
-    if not verify_password(data.old_password, current_user["hashed_password"]):
+    if not await verify_password_async(data.old_password, current_user["hashed_password"]):
         raise HTTPException(status.HTTP_400_BAD_REQUEST,
             detail={"error_code":"INVALID_OLD_PASSWORD","message":"Contraseña antigua incorrecta"})
-    new_hashed = get_password_hash(data.new_password)
+    new_hashed = await hash_password_async(data.new_password)
     await users_coll.update_one(
         {"_id": ObjectId(current_user["_id"])},
         {"$set": {"hashed_password": new_hashed}}
     )
+    invalidar_usuario_cache(user_id=str(current_user["_id"]))
     return {"message": "Contraseña actualizada correctamente"}
 
 @router.post("/request-password-reset")
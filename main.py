@@ -1,17 +1,43 @@
 # main
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from login import router as auth_router
+from auth import ACCESS_TOKEN_EXPIRE_MINUTES, AUTH_MODO, revocaciones
+from bd import preparar_bd
 from filtros.filtro_yape import router as yape_router
-from filtros.filtro_pixeles import router as pixeles_router
+from filtros.filtro_pixeles import router as pixeles_router, cargar_plantillas
 from filtros.filtro_exif import router as exif_router
 from filtros.filtro_ruido import router as ruido_router
 from filtros.filtro_histograma import router as histograma_router
 from filtros.filtro_claves import router as claves_router
-from filtros.filtro_logo import router as logo_router
+from filtros.filtro_logo import router as logo_router, distancias_plantillas
 from filtros.filtro_ocr import router as ocr_router
+from filtros.cliente_ocr import cliente_ocr
+from filtros.ejecutor import cerrar_ejecutores
+from filtros.cache_ocr import router as cache_ocr_router
+from filtros.filtro_verificar import router as verificar_router
+from filtros.cache_veredictos import router as cache_veredictos_router
+from filtros.huellas import router as huellas_router, indice_huellas, HUELLAS_ACTIVAS
+from metricas import router as metricas_router, MiddlewareMetricas
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await preparar_bd(ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+    cargar_plantillas()
+    distancias_plantillas()
+    if HUELLAS_ACTIVAS:
+        await indice_huellas.cargar()
+        indice_huellas.iniciar()
+    if AUTH_MODO == "stateless":
+        await revocaciones.iniciar()
+    yield
+    await revocaciones.detener()
+    await indice_huellas.detener()
+    await cliente_ocr.cerrar()
+    cerrar_ejecutores()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,6 +46,7 @@ app.add_middleware(
     allow_headers=["*"],      
     allow_credentials=False,   
 )
+app.add_middleware(MiddlewareMetricas)
 
 app.include_router(auth_router)
 app.include_router(yape_router)
@@ -29,4 +56,9 @@ app.include_router(ruido_router)
 app.include_router(histograma_router)
 app.include_router(claves_router)
 app.include_router(logo_router)
-app.include_router(ocr_router)
\ No newline at end of file
+app.include_router(ocr_router)
+app.include_router(huellas_router)
+app.include_router(cache_veredictos_router)
+app.include_router(verificar_router)
+app.include_router(cache_ocr_router)
+app.include_router(metricas_router)
\ No newline at end of file
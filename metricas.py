@@ -0,0 +1,102 @@
+# Métricas Prometheus: latencia por ruta, por etapa de los filtros y veredictos
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from pymongo import monitoring
+
+router = APIRouter()
+
+# De 1 ms (decodificar una imagen chica) a 30 s (timeout del OCR)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+PETICIONES = Histogram(
+    "http_peticion_duracion_segundos", "Duración de las peticiones HTTP por ruta",
+    ["metodo", "ruta", "estado"], buckets=BUCKETS
+)
+PETICIONES_EN_CURSO = Gauge("http_peticiones_en_curso", "Peticiones HTTP en curso")
+ETAPAS = Histogram("etapa_duracion_segundos", "Duración de cada etapa de los filtros, OCR, MongoDB y bcrypt",
+                   ["etapa"], buckets=BUCKETS)
+# origen: "verificar" (filtro corrido dentro de /verificar) o "ruta" (petición directa al router del filtro)
+VEREDICTOS = Counter("veredictos_total", "Veredictos por filtro", ["filtro", "veredicto", "origen"])
+REENVIOS = Counter("reenvios_total", "Comprobantes casi idénticos a uno ya verificado", ["reutilizado"])
+
+_hilo = threading.local()
+
+@contextmanager
+def medir(etapa: str):
+    """Mide el bloque en etapa_duracion_segundos{etapa}. Dentro de ejecutar_con_etapas (pool de procesos)
+    los tiempos se acumulan para que el proceso principal los registre."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracion = time.perf_counter() - inicio
+        pendientes = getattr(_hilo, "pendientes", None)
+        if pendientes is None:
+            ETAPAS.labels(etapa).observe(duracion)
+        else:
+            pendientes.append((etapa, duracion))
+
+def ejecutar_con_etapas(funcion, *args, **kwargs) -> Tuple[object, List[Tuple[str, float]]]:
+    # Se ejecuta en el proceso hijo: sus métricas no son visibles desde el proceso que sirve /metrics
+    _hilo.pendientes = []
+    try:
+        return funcion(*args, **kwargs), _hilo.pendientes
+    finally:
+        _hilo.pendientes = None
+
+def registrar_etapas(etapas: List[Tuple[str, float]]):
+    for etapa, duracion in etapas:
+        ETAPAS.labels(etapa).observe(duracion)
+
+def contar_veredicto(filtro: str, veredicto: Optional[str], origen: str = "verificar"):
+    VEREDICTOS.labels(filtro, veredicto or "sin_veredicto", origen).inc()
+
+def contar_reenvio(reutilizado: bool):
+    REENVIOS.labels("si" if reutilizado else "no").inc()
+
+class MonitorMongo(monitoring.CommandListener):
+    """Duración de cada comando de MongoDB como etapa mongo_<comando> (find, insert, update, ...)."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        ETAPAS.labels(f"mongo_{event.command_name}").observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        ETAPAS.labels(f"mongo_{event.command_name}").observe(event.duration_micros / 1e6)
+
+class MiddlewareMetricas:
+    """Middleware ASGI: la ruta se etiqueta con la plantilla (/verificar/lote), no con la URL, para acotar las series.
+    En respuestas en streaming mide hasta el último fragmento."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        inicio = time.perf_counter()
+        estado: Dict[str, int] = {"codigo": 500}
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado["codigo"] = mensaje["status"]
+            await send(mensaje)
+
+        PETICIONES_EN_CURSO.inc()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            PETICIONES_EN_CURSO.dec()
+            ruta = getattr(scope.get("route"), "path", "sin_ruta")
+            PETICIONES.labels(scope["method"], ruta, str(estado["codigo"])).observe(time.perf_counter() - inicio)
+
+@router.get("/metrics", include_in_schema=False)
+async def metricas():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
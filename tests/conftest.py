@@ -0,0 +1,28 @@
+# Configuración común de las pruebas: sin MongoDB al arrancar, sin pool de procesos y sin cachés persistentes
+import os
+import sys
+import pytest
+
+os.environ.setdefault("MONGO_CREAR_INDICES", "0")
+os.environ.setdefault("EJECUTOR_PROCESOS", "0")
+os.environ.setdefault("HUELLAS_ACTIVAS", "0")
+os.environ.setdefault("VEREDICTOS_CACHE_TAMANO", "0")
+os.environ.setdefault("OCR_API_KEY", "clave-de-prueba")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def archivo_tocado(monkeypatch):
+    """Adelanta el mtime de un archivo real y lo restaura al terminar; la huella de recursos se revisa siempre."""
+    from filtros import recursos
+    monkeypatch.setattr(recursos, "RECURSOS_REVISION_SEGUNDOS", 0)
+    tocados = []
+
+    def tocar(ruta):
+        estado = os.stat(ruta)
+        tocados.append((ruta, estado.st_atime_ns, estado.st_mtime_ns))
+        os.utime(ruta, ns=(estado.st_atime_ns, estado.st_mtime_ns + 1_000_000_000))
+
+    yield tocar
+    for ruta, atime, mtime in tocados:
+        os.utime(ruta, ns=(atime, mtime))
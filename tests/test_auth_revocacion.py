@@ -0,0 +1,107 @@
+# Revocación de sesiones: una validación concurrente no debe volver a cachear un token revocado
+import asyncio
+import pytest
+from fastapi import HTTPException
+from mongomock_motor import AsyncMongoMockClient
+import auth
+
+@pytest.fixture
+def colecciones(monkeypatch):
+    db = AsyncMongoMockClient()["pruebas"]
+    for nombre in ("users_coll", "sessions_coll", "revocaciones_coll"):
+        monkeypatch.setattr(auth, nombre, db[nombre.replace("_coll", "")])
+    monkeypatch.setattr(auth, "AUTH_MODO", "sesiones")
+    auth._sesiones_cache.clear()
+    yield db
+    auth._sesiones_cache.clear()
+
+async def _crear_sesion(db):
+    resultado = await db["users"].insert_one({"email": "ana@example.com", "hashed_password": "x"})
+    sid = "sesion-1"
+    token = auth.create_access_token("ana@example.com", session_id=sid)
+    await auth.save_token(str(resultado.inserted_id), token, sid)
+    return token
+
+def test_logout_durante_validacion_no_deja_el_token_en_cache(colecciones, monkeypatch):
+    async def escenario():
+        token = await _crear_sesion(colecciones)
+        users = colecciones["users"]
+        buscar_original = users.find_one
+        validando, revocado = asyncio.Event(), asyncio.Event()
+
+        async def buscar_lento(*args, **kwargs):
+            # La validación ya pasó is_token_valid: el logout ocurre antes de que guarde en la caché
+            validando.set()
+            await revocado.wait()
+            return await buscar_original(*args, **kwargs)
+
+        monkeypatch.setattr(auth.users_coll, "find_one", buscar_lento)
+        validacion = asyncio.ensure_future(auth.get_current_user(token))
+        await validando.wait()
+        await auth.revoke_token(token)
+        revocado.set()
+        await validacion
+        monkeypatch.setattr(auth.users_coll, "find_one", buscar_original)
+
+        assert auth._cache_obtener(token) is None
+        with pytest.raises(HTTPException) as error:
+            await auth.get_current_user(token)
+        assert error.value.status_code == 401
+
+    asyncio.run(escenario())
+
+def test_token_valido_se_cachea(colecciones):
+    async def escenario():
+        token = await _crear_sesion(colecciones)
+        await auth.get_current_user(token)
+        assert auth._cache_obtener(token) is not None
+        await auth.revoke_token(token)
+        assert auth._cache_obtener(token) is None
+
+    asyncio.run(escenario())
+
+class ColeccionLotes:
+    """mongomock no acepta los UpdateOne de pymongo reciente en bulk_write: se aplican uno a uno."""
+
+    def __init__(self, coleccion):
+        self.coleccion = coleccion
+        self.lotes = []
+
+    async def bulk_write(self, operaciones, ordered=True):
+        self.lotes.append((len(operaciones), ordered))
+        for op in operaciones:
+            await self.coleccion.update_one(op._filter, op._doc, upsert=op._upsert)
+
+    def __getattr__(self, nombre):
+        return getattr(self.coleccion, nombre)
+
+async def _sesiones(db, cantidad):
+    resultado = await db["users"].insert_one({"email": "ana@example.com", "hashed_password": "x"})
+    user_id = str(resultado.inserted_id)
+    for i in range(cantidad):
+        await auth.save_token(user_id, auth.create_access_token("ana@example.com", session_id=f"s{i}"), f"s{i}")
+    return user_id
+
+def test_modo_sesiones_no_escribe_revocaciones(colecciones):
+    async def escenario():
+        user_id = await _sesiones(colecciones, 3)
+        await auth.revoke_all_tokens(user_id)
+        assert await colecciones["revocaciones"].count_documents({}) == 0
+        assert await colecciones["sessions"].count_documents({}) == 0
+
+    asyncio.run(escenario())
+
+def test_modo_stateless_revoca_todo_en_un_lote(colecciones, monkeypatch):
+    lotes = ColeccionLotes(colecciones["revocaciones"])
+    monkeypatch.setattr(auth, "revocaciones_coll", lotes)
+    monkeypatch.setattr(auth, "AUTH_MODO", "stateless")
+    monkeypatch.setattr(auth, "revocaciones", auth.Revocaciones(auth.AUTH_REVOCACION_INTERVALO))
+
+    async def escenario():
+        user_id = await _sesiones(colecciones, 3)
+        await auth.revoke_all_tokens(user_id)
+        assert lotes.lotes == [(3, False)]
+        assert sorted(await colecciones["revocaciones"].distinct("_id")) == ["s0", "s1", "s2"]
+        assert all(auth.revocaciones.revocada(f"s{i}") for i in range(3))
+
+    asyncio.run(escenario())
@@ -0,0 +1,29 @@
+# Migración de arranque: crear_indices es idempotente y verificar_planes detecta consultas sin índice
+import asyncio
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+import bd
+
+COLECCIONES = ("users", "sessions", "ocr_cache", "revocaciones", "huellas")
+
+@pytest.fixture
+def db(monkeypatch):
+    db = AsyncMongoMockClient()["pruebas"]
+    monkeypatch.setattr(bd, "db", db)
+    for nombre in COLECCIONES:
+        monkeypatch.setattr(bd, f"{nombre}_coll", db[nombre])
+    return db
+
+def test_crear_indices_y_verificar_planes(db):
+    async def escenario():
+        await bd.crear_indices(3600)
+        await bd.crear_indices(3600)
+        await bd.verificar_planes()
+        return await db["sessions"].index_information()
+    indices = asyncio.run(escenario())
+    assert {"token_unico", "user_id", "sesiones_ttl"} <= set(indices)
+    assert indices["sesiones_ttl"]["expireAfterSeconds"] == 3600
+
+def test_verificar_planes_sin_indices_lanza_excepcion(db):
+    with pytest.raises(bd.ConsultasSinIndice, match="sin índice sobre email"):
+        asyncio.run(bd.verificar_planes())
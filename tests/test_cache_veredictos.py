@@ -0,0 +1,74 @@
+# Memoización por ruta: segundo envío idéntico sin recalcular; un cambio de recursos invalida
+import asyncio
+import pytest
+from fastapi import HTTPException
+from filtros import cache_veredictos as modulo, recursos
+from filtros.cache_veredictos import CacheVeredictos, memorizar
+from filtros.filtro_logo import logo_path
+from filtros.filtro_pixeles import listar_plantillas
+from filtros.recursos import recursos_cambiaron
+
+@pytest.fixture
+def cache(monkeypatch):
+    nueva = CacheVeredictos(tamano=16, ttl=60)
+    monkeypatch.setattr(modulo, "cache_veredictos", nueva)
+    return nueva
+
+class Contador:
+    def __init__(self, resultado=None, error=None):
+        self.llamadas = 0
+        self.resultado = resultado
+        self.error = error
+
+    async def __call__(self):
+        self.llamadas += 1
+        if self.error:
+            raise self.error
+        return self.resultado
+
+def test_segundo_envio_identico_usa_la_memoria(cache):
+    calcular = Contador({"resultado": "ok"})
+    for _ in range(3):
+        assert asyncio.run(memorizar("filtro_ruido", b"imagen", calcular)) == {"resultado": "ok"}
+    assert calcular.llamadas == 1
+    assert cache.aciertos == 2
+
+def test_clave_distingue_ruta_parametros_y_contenido(cache):
+    calcular = Contador({"resultado": "ok"})
+    asyncio.run(memorizar("histograma", b"imagen", calcular, "completo"))
+    asyncio.run(memorizar("histograma", b"imagen", calcular, "compacto"))
+    asyncio.run(memorizar("filtro_ruido", b"imagen", calcular))
+    asyncio.run(memorizar("filtro_ruido", b"otra", calcular))
+    assert calcular.llamadas == 4
+
+def test_cambio_de_recursos_invalida(cache):
+    calcular = Contador({"resultado": "ok"})
+    asyncio.run(memorizar("logo", b"imagen", calcular))
+    recursos_cambiaron()
+    asyncio.run(memorizar("logo", b"imagen", calcular))
+    assert calcular.llamadas == 2
+    assert cache.invalidaciones == 1
+
+def test_errores_no_se_memorizan(cache):
+    calcular = Contador(error=HTTPException(400, "Estructura desconocida"))
+    for _ in range(2):
+        with pytest.raises(HTTPException):
+            asyncio.run(memorizar("filtro_ocr", b"imagen", calcular))
+    assert calcular.llamadas == 2
+
+@pytest.mark.parametrize("archivo", ["plantilla", "logo"])
+def test_tocar_una_plantilla_o_el_logo_invalida(cache, archivo_tocado, archivo):
+    calcular = Contador({"resultado": "ok"})
+    asyncio.run(memorizar("filtro_pixeles", b"imagen", calcular))
+    archivo_tocado(sorted(listar_plantillas())[0] if archivo == "plantilla" else logo_path)
+    asyncio.run(memorizar("filtro_pixeles", b"imagen", calcular))
+    assert calcular.llamadas == 2
+    assert cache.invalidaciones == 1
+
+def test_revision_de_mtimes_acotada_por_intervalo(cache, archivo_tocado, monkeypatch):
+    calcular = Contador({"resultado": "ok"})
+    asyncio.run(memorizar("filtro_ruido", b"imagen", calcular))
+    monkeypatch.setattr(recursos, "RECURSOS_REVISION_SEGUNDOS", 3600)
+    archivo_tocado(logo_path)
+    asyncio.run(memorizar("filtro_ruido", b"imagen", calcular))
+    assert calcular.llamadas == 1
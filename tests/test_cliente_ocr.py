@@ -0,0 +1,150 @@
+# BackendOCRSpace contra un servidor OCR de prueba (httpx.MockTransport)
+import asyncio
+import httpx
+import pytest
+from filtros.cliente_ocr import BackendOCR, BackendOCRSpace, OCRError, OCRNoDisponible, OCRTimeout
+
+ARCHIVO = ("recorte.png", b"imagen", "image/png")
+DATOS = {"language": "spa"}
+RESPUESTA = {"IsErroredOnProcessing": False, "ParsedResults": [{"ParsedText": "Yapeaste!"}]}
+
+class ServidorPrueba:
+    """Responde con la lista de respuestas en orden (la última se repite) y cuenta las llamadas."""
+
+    def __init__(self, *respuestas, demora: float = 0.0):
+        self.respuestas = list(respuestas)
+        self.demora = demora
+        self.llamadas = 0
+        self.en_curso = 0
+        self.max_en_curso = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.llamadas += 1
+        self.en_curso += 1
+        self.max_en_curso = max(self.max_en_curso, self.en_curso)
+        try:
+            if self.demora:
+                await asyncio.sleep(self.demora)
+            respuesta = self.respuestas[min(self.llamadas, len(self.respuestas)) - 1]
+            if isinstance(respuesta, Exception):
+                raise respuesta
+            if isinstance(respuesta, int):
+                return httpx.Response(respuesta)
+            return httpx.Response(200, json=respuesta)
+        finally:
+            self.en_curso -= 1
+
+def crear_backend(servidor, **kwargs) -> BackendOCRSpace:
+    opciones = {"url": "http://ocr.prueba/parse/image", "api_key": "clave", "backoff_base": 0.0,
+                "transport": httpx.MockTransport(servidor)}
+    opciones.update(kwargs)
+    return BackendOCRSpace(**opciones)
+
+def reconocer(backend, veces: int = 1):
+    async def llamar():
+        try:
+            return await asyncio.gather(*(backend.reconocer(ARCHIVO, DATOS) for _ in range(veces)), return_exceptions=True)
+        finally:
+            await backend.cerrar()
+    resultados = asyncio.run(llamar())
+    return resultados[0] if veces == 1 else resultados
+
+def test_reintenta_y_luego_responde():
+    servidor = ServidorPrueba(503, 500, RESPUESTA)
+    assert reconocer(crear_backend(servidor, reintentos=2)) == RESPUESTA
+    assert servidor.llamadas == 3
+
+def test_timeout_agota_los_reintentos():
+    servidor = ServidorPrueba(httpx.ReadTimeout("lento"))
+    resultado = reconocer(crear_backend(servidor, reintentos=1))
+    assert isinstance(resultado, OCRTimeout)
+    assert resultado.status_code == 504
+    assert servidor.llamadas == 2
+
+def test_error_4xx_no_se_reintenta():
+    servidor = ServidorPrueba(400)
+    resultado = reconocer(crear_backend(servidor, reintentos=3))
+    assert isinstance(resultado, OCRError)
+    assert servidor.llamadas == 1
+
+def test_5xx_abre_el_circuito():
+    servidor = ServidorPrueba(500)
+    backend = crear_backend(servidor, reintentos=0, fallos_circuito=3, enfriamiento=60)
+
+    async def escenario():
+        errores = []
+        for _ in range(4):
+            try:
+                await backend.reconocer(ARCHIVO, DATOS)
+            except OCRError as e:
+                errores.append(e)
+        await backend.cerrar()
+        return errores
+
+    errores = asyncio.run(escenario())
+    assert [type(e) for e in errores[:3]] == [OCRError] * 3
+    assert isinstance(errores[3], OCRNoDisponible)
+    assert servidor.llamadas == 3
+    assert backend.circuito_abierto
+
+def test_semiabierto_deja_pasar_una_sola_sonda():
+    servidor = ServidorPrueba(500, 500, 500, RESPUESTA, demora=0.05)
+    backend = crear_backend(servidor, reintentos=0, fallos_circuito=3, enfriamiento=0.1)
+
+    async def escenario():
+        for _ in range(3):
+            with pytest.raises(OCRError):
+                await backend.reconocer(ARCHIVO, DATOS)
+        assert backend.circuito_abierto
+        await asyncio.sleep(0.15)
+        # Pasado el enfriamiento solo la sonda llega al servidor; las demás se rechazan sin llamar
+        resultados = await asyncio.gather(*(backend.reconocer(ARCHIVO, DATOS) for _ in range(3)), return_exceptions=True)
+        # La sonda respondió: el circuito queda cerrado
+        despues = await backend.reconocer(ARCHIVO, DATOS)
+        await backend.cerrar()
+        return resultados, despues
+
+    resultados, despues = asyncio.run(escenario())
+    assert resultados[0] == RESPUESTA
+    assert all(isinstance(r, OCRNoDisponible) for r in resultados[1:])
+    assert despues == RESPUESTA
+    assert servidor.llamadas == 5
+
+def test_sonda_fallida_reabre_el_circuito():
+    servidor = ServidorPrueba(500)
+    backend = crear_backend(servidor, reintentos=0, fallos_circuito=2, enfriamiento=0.05)
+
+    async def escenario():
+        for _ in range(2):
+            with pytest.raises(OCRError):
+                await backend.reconocer(ARCHIVO, DATOS)
+        await asyncio.sleep(0.08)
+        with pytest.raises(OCRError) as sonda:
+            await backend.reconocer(ARCHIVO, DATOS)
+        abierto = backend.circuito_abierto
+        await backend.cerrar()
+        return sonda.value, abierto
+
+    sonda, abierto = asyncio.run(escenario())
+    assert not isinstance(sonda, OCRNoDisponible)
+    assert abierto
+    assert servidor.llamadas == 3
+
+def test_semaforo_limita_la_concurrencia():
+    servidor = ServidorPrueba(RESPUESTA, demora=0.05)
+    resultados = reconocer(crear_backend(servidor, max_concurrencia=2), veces=6)
+    assert resultados == [RESPUESTA] * 6
+    assert servidor.max_en_curso == 2
+
+def test_sin_api_key_no_llama_a_la_api():
+    servidor = ServidorPrueba(RESPUESTA)
+    resultado = reconocer(crear_backend(servidor, api_key=None))
+    assert isinstance(resultado, OCRNoDisponible) and resultado.status_code == 503
+    assert servidor.llamadas == 0
+
+def test_backend_sin_reconocer_no_se_puede_instanciar():
+    class Incompleto(BackendOCR):
+        nombre = "incompleto"
+
+    with pytest.raises(TypeError):
+        Incompleto()
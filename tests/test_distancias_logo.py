@@ -0,0 +1,49 @@
+# Distancias del logo: el archivo versionado vale por contenido (sha256), no por mtime, y el recálculo va aparte
+import json
+import os
+import shutil
+import pytest
+from filtros import filtro_logo
+
+@pytest.fixture
+def rutas(tmp_path, monkeypatch):
+    versionado = tmp_path / "distancias_guardadas.json"
+    shutil.copy(filtro_logo.distancias_path, versionado)
+    # Como en un checkout nuevo: config/ queda más viejo que las plantillas
+    os.utime(versionado, (0, 0))
+    calculadas = tmp_path / "distancias_calculadas.json"
+    monkeypatch.setattr(filtro_logo, "distancias_path", str(versionado))
+    monkeypatch.setattr(filtro_logo, "distancias_calculadas_path", str(calculadas))
+    filtro_logo._distancias_cache.clear()
+    yield versionado, calculadas
+    filtro_logo._distancias_cache.clear()
+
+def _sin_recalculo(monkeypatch):
+    monkeypatch.setattr(filtro_logo, "procesar_imagen_plantilla", lambda *a: pytest.fail("no debía recalcular"))
+
+def test_archivo_versionado_vale_aunque_sea_mas_viejo(rutas, monkeypatch):
+    versionado, calculadas = rutas
+    _sin_recalculo(monkeypatch)
+    assert filtro_logo.distancias_plantillas() == json.loads(versionado.read_text(encoding="utf-8"))["distancias"]
+    assert not calculadas.exists()
+
+def test_contenido_distinto_recalcula_aparte_sin_tocar_el_versionado(rutas):
+    versionado, calculadas = rutas
+    guardado = json.loads(versionado.read_text(encoding="utf-8"))
+    guardado["recursos"]["logo.jpg"] = "0" * 64
+    versionado.write_text(json.dumps(guardado), encoding="utf-8")
+    original = versionado.read_bytes()
+    distancias = filtro_logo.distancias_plantillas()
+    assert all(distancias)
+    assert versionado.read_bytes() == original
+    escrito = json.loads(calculadas.read_text(encoding="utf-8"))
+    assert escrito == {"recursos": filtro_logo.huellas_recursos_logo(), "distancias": distancias}
+    assert [p.name for p in calculadas.parent.iterdir() if p.suffix == ".tmp"] == []
+
+def test_lee_el_archivo_calculado_si_coincide(rutas, monkeypatch):
+    versionado, calculadas = rutas
+    versionado.unlink()
+    distancias = filtro_logo.distancias_plantillas()
+    filtro_logo._distancias_cache.clear()
+    _sin_recalculo(monkeypatch)
+    assert filtro_logo.distancias_plantillas() == distancias
@@ -0,0 +1,52 @@
+# PoolAcotado: los pendientes se cuentan hasta que el trabajo termina, aunque se cancele quien espera
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from filtros.ejecutor import EjecutorSaturado, PoolAcotado
+
+@pytest.fixture
+def pool():
+    pool = PoolAcotado("prueba", lambda: ThreadPoolExecutor(max_workers=1), 1, 2)
+    yield pool
+    pool.cerrar()
+
+def test_cancelar_un_trabajo_en_curso_no_libera_su_lugar(pool):
+    liberar = threading.Event()
+    empezo = threading.Event()
+
+    def bloquear():
+        empezo.set()
+        liberar.wait(5)
+
+    async def escenario():
+        tarea = asyncio.ensure_future(pool.ejecutar(bloquear))
+        await asyncio.get_running_loop().run_in_executor(None, empezo.wait, 5)
+        tarea.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await tarea
+        assert pool.pendientes == 1
+        liberar.set()
+        while pool.pendientes:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(escenario())
+
+def test_cancelar_un_trabajo_en_cola_libera_su_lugar(pool):
+    liberar = threading.Event()
+
+    async def escenario():
+        en_curso = asyncio.ensure_future(pool.ejecutar(liberar.wait, 5))
+        en_cola = asyncio.ensure_future(pool.ejecutar(lambda: None))
+        await asyncio.sleep(0.01)
+        assert pool.pendientes == 2
+        with pytest.raises(EjecutorSaturado):
+            await pool.ejecutar(lambda: None)
+        en_cola.cancel()
+        await asyncio.sleep(0)
+        assert pool.pendientes == 1
+        liberar.set()
+        await en_curso
+        assert pool.pendientes == 0
+
+    asyncio.run(escenario())
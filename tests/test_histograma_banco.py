@@ -0,0 +1,34 @@
+# BancoHistogramas: una sola consulta al banco por análisis y revisión de plantillas acotada por intervalo
+import numpy as np
+from filtros import filtro_histograma, filtro_pixeles, recursos
+from filtros.filtro_histograma import BancoHistogramas, analizar_histograma
+from filtros.filtro_pixeles import listar_plantillas
+
+IMAGEN = np.full((32, 32, 3), 120, dtype=np.uint8)
+
+def test_un_analisis_consulta_el_banco_una_vez(monkeypatch):
+    banco = BancoHistogramas()
+    monkeypatch.setattr(filtro_histograma, "banco_histogramas", banco)
+    consultas = []
+    obtener = banco.obtener
+    monkeypatch.setattr(banco, "obtener", lambda: consultas.append(1) or obtener())
+    analizar_histograma(IMAGEN, bins="ninguno")
+    assert len(consultas) == 1
+
+def test_dentro_del_intervalo_no_se_revisan_las_plantillas(monkeypatch):
+    monkeypatch.setattr(filtro_histograma, "banco_histogramas", BancoHistogramas())
+    monkeypatch.setattr(recursos, "RECURSOS_REVISION_SEGUNDOS", 3600)
+    analizar_histograma(IMAGEN, bins="ninguno")
+    busquedas = []
+    glob = filtro_pixeles.glob.glob
+    monkeypatch.setattr(filtro_pixeles.glob, "glob", lambda patron: busquedas.append(patron) or glob(patron))
+    for _ in range(5):
+        analizar_histograma(IMAGEN, bins="ninguno")
+    assert busquedas == []
+
+def test_tocar_una_plantilla_reconstruye_el_banco(archivo_tocado):
+    banco = BancoHistogramas()
+    _, antes = banco.obtener()
+    assert banco.obtener()[1] is antes
+    archivo_tocado(sorted(listar_plantillas())[0])
+    assert banco.obtener()[1] is not antes
@@ -0,0 +1,170 @@
+# Índice de huellas: robustez de la huella, búsqueda MIH y escritura en lotes en segundo plano
+import asyncio
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from benchmarks.corpus import generar_corpus
+from filtros import filtro_verificar
+from filtros.huellas import HUELLA_BITS, Coincidencia, IndiceHamming, IndiceHuellas, distancia
+from filtros.imagen import BITS_HUELLA, ImagenDecodificada
+
+class ColeccionLotes:
+    """mongomock no acepta los UpdateOne de pymongo reciente en bulk_write: se aplican uno a uno."""
+
+    def __init__(self, coleccion):
+        self.coleccion = coleccion
+        self.lotes = 0
+
+    async def bulk_write(self, operaciones, ordered=True):
+        self.lotes += 1
+        for op in operaciones:
+            await self.coleccion.update_one(op._filter, op._doc, upsert=op._upsert)
+
+    def __getattr__(self, nombre):
+        return getattr(self.coleccion, nombre)
+
+@pytest.fixture
+def coleccion():
+    return ColeccionLotes(AsyncMongoMockClient()["pruebas"]["huellas"])
+
+def test_registrar_no_escribe_hasta_el_lote(coleccion):
+    async def escenario():
+        indice = IndiceHuellas(coleccion=coleccion)
+        indice.registrar("a", 0b1011)
+        indice.registrar("a", 0b1011, {"veredicto": "Válido", "filtros": {}})
+        assert await coleccion.count_documents({}) == 0
+        assert indice.buscar(0b1011).id == "a"
+        pendiente = await indice.obtener("a")
+        await indice.escribir()
+        assert coleccion.lotes == 1
+        return pendiente, await coleccion.find_one({"_id": "a"}), indice
+    pendiente, doc, indice = asyncio.run(escenario())
+    assert pendiente["veces"] == 2 and pendiente["respuesta"]["veredicto"] == "Válido"
+    assert doc["veces"] == 2 and doc["huella"] == "b" and doc["respuesta"]["veredicto"] == "Válido"
+    assert indice.estadisticas()["escrituras_pendientes"] == 0
+
+def test_reenvio_suma_sobre_el_documento_guardado(coleccion):
+    async def escenario():
+        indice = IndiceHuellas(coleccion=coleccion)
+        indice.registrar("a", 1)
+        await indice.escribir()
+        indice.registrar("a", 1)
+        pendiente = await indice.obtener("a")
+        await indice.escribir()
+        return pendiente, await coleccion.find_one({"_id": "a"})
+    pendiente, doc = asyncio.run(escenario())
+    assert pendiente["veces"] == 2
+    assert doc["veces"] == 2
+
+def test_escritor_vacia_al_llenarse_el_lote_y_al_detener(coleccion):
+    async def escenario():
+        indice = IndiceHuellas(coleccion=coleccion, intervalo=60, lote=2)
+        indice.iniciar()
+        indice.registrar("a", 1)
+        indice.registrar("b", 2)
+        for _ in range(100):
+            if await coleccion.count_documents({}) == 2:
+                break
+            await asyncio.sleep(0.01)
+        escritas_por_lote = await coleccion.count_documents({})
+        indice.registrar("c", 3)
+        await indice.detener()
+        return escritas_por_lote, await coleccion.count_documents({})
+    assert asyncio.run(escenario()) == (2, 3)
+
+def test_fallo_de_mongo_reintenta_en_el_siguiente_lote(coleccion, monkeypatch):
+    async def escenario():
+        indice = IndiceHuellas(coleccion=coleccion)
+
+        async def caida(*args, **kwargs):
+            raise ConnectionError("sin conexión")
+
+        with monkeypatch.context() as m:
+            m.setattr(coleccion, "bulk_write", caida)
+            indice.registrar("a", 1)
+            await indice.escribir()
+        await indice.escribir()
+        return indice.escrituras_fallidas, await coleccion.find_one({"_id": "a"})
+    fallidas, doc = asyncio.run(escenario())
+    assert fallidas == 1
+    assert doc["veces"] == 1
+
+def test_visto_no_cambia_la_huella_guardada(coleccion):
+    async def escenario():
+        indice = IndiceHuellas(coleccion=coleccion)
+        indice.registrar("a", 0b1011)
+        await indice.escribir()
+        indice.visto("a")
+        indice.visto("desconocida")
+        await indice.escribir()
+        return await coleccion.find_one({"_id": "a"}), await coleccion.count_documents({}), indice
+    doc, documentos, indice = asyncio.run(escenario())
+    assert doc["huella"] == "b" and doc["veces"] == 2
+    assert documentos == 1
+    assert indice.buscar(0b1011) == Coincidencia("a", 0)
+
+def test_indice_hamming_busca_hasta_el_radio_y_quita():
+    indice = IndiceHamming(BITS_HUELLA, 12)
+    base = (1 << BITS_HUELLA) - 1 ^ 0x5A5A5A
+    cerca = base ^ 0b111111111111
+    lejos = base ^ ((1 << 13) - 1)
+    indice.agregar(base, "base")
+    assert "base" in indice.candidatos(cerca)
+    assert distancia(base, cerca) == 12 and distancia(base, lejos) == 13
+    indice.quitar(base, "base")
+    assert indice.candidatos(base) == set()
+
+def test_indice_descarta_la_huella_mas_vieja(coleccion):
+    todos = (1 << BITS_HUELLA) - 1
+    alternados = int("01" * BITS_HUELLA, 2) & todos
+    indice = IndiceHuellas(maximo=2, coleccion=coleccion)
+    for ident, huella in (("a", 0), ("b", todos), ("c", alternados)):
+        indice.registrar(ident, huella)
+    assert indice.buscar(0) is None
+    assert indice.buscar(alternados) == Coincidencia("c", 0)
+    assert indice.estadisticas()["huellas"] == 2
+
+CORPUS = [(nombre, tipo, ImagenDecodificada(contenido).huella) for nombre, tipo, contenido in generar_corpus()]
+ORIGINALES = {nombre: huella for nombre, tipo, huella in CORPUS if tipo == "original"}
+
+@pytest.mark.parametrize("nombre,tipo,huella", [c for c in CORPUS if c[1] in ("escalada", "recomprimida", "recortada")],
+                         ids=[c[0] for c in CORPUS if c[1] in ("escalada", "recomprimida", "recortada")])
+def test_huella_resiste_recompresion_escala_y_recorte(nombre, tipo, huella):
+    assert distancia(huella, ORIGINALES[nombre.split("_")[0]]) <= HUELLA_BITS
+
+def test_comprobantes_distintos_no_coinciden():
+    originales = list(ORIGINALES.values())
+    assert all(distancia(a, b) > HUELLA_BITS for i, a in enumerate(originales) for b in originales[i + 1:])
+    for nombre, tipo, huella in CORPUS:
+        if tipo == "alterada":
+            assert distancia(huella, ORIGINALES[nombre.split("_")[0]]) > HUELLA_BITS
+
+def test_reutiliza_solo_la_misma_captura(coleccion, monkeypatch):
+    indice = IndiceHuellas(coleccion=coleccion)
+    cascadas = []
+
+    async def cascada(img):
+        cascadas.append(img)
+        return {"yape": {"advertencia": "Válido"}}, {}
+
+    monkeypatch.setattr(filtro_verificar, "indice_huellas", indice)
+    monkeypatch.setattr(filtro_verificar, "HUELLAS_ACTIVAS", True)
+    monkeypatch.setattr(filtro_verificar, "HUELLA_REUTILIZAR", True)
+    monkeypatch.setattr(filtro_verificar, "ejecutar_cascada", cascada)
+    variantes = {nombre: contenido for nombre, _, contenido in generar_corpus()}
+
+    async def verificar(nombre):
+        respuesta = await filtro_verificar.verificar_imagen(ImagenDecodificada(variantes[nombre]))
+        await indice.escribir()
+        return respuesta
+
+    async def escenario():
+        await verificar("yape")
+        cercana = await verificar("yape_q70")
+        misma = await verificar("yape")
+        return cercana, misma, await coleccion.find_one({"_id": misma["duplicado"]["id"]})
+
+    cercana, misma, doc = asyncio.run(escenario())
+    assert cercana["duplicado"]["distancia"] > 0
+    assert misma["duplicado"]["exacto"]
+    assert len(cascadas) == 2
+    assert doc["huella"] == format(ORIGINALES["yape"], "x") and doc["veces"] == 2
@@ -0,0 +1,40 @@
+# Veredictos contados también cuando se llama al router del filtro directamente
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from benchmarks.corpus import generar_corpus
+from filtros import filtro_exif, filtro_ruido
+from metricas import VEREDICTOS
+
+def _jpeg() -> bytes:
+    return next(iter(generar_corpus()))[2]
+
+def _contados(filtro: str, origen: str) -> float:
+    return sum(
+        muestra.value
+        for metrica in VEREDICTOS.collect()
+        for muestra in metrica.samples
+        if muestra.name.endswith("_total")
+        and muestra.labels["filtro"] == filtro
+        and muestra.labels["origen"] == origen
+    )
+
+@pytest.mark.parametrize("modulo, ruta, filtro", [
+    (filtro_ruido, "/filtro_ruido", "filtro_ruido"),
+    (filtro_exif, "/filtro_exif", "filtro_exif"),
+])
+def test_router_cuenta_su_veredicto(modulo, ruta, filtro):
+    app = FastAPI()
+    app.include_router(modulo.router)
+    antes = _contados(filtro, "ruta")
+    respuesta = TestClient(app).post(ruta, files={"file": ("comprobante.jpg", _jpeg(), "image/jpeg")})
+    assert respuesta.status_code == 200
+    assert _contados(filtro, "ruta") == antes + 1
+
+def test_error_del_router_no_cuenta_veredicto():
+    app = FastAPI()
+    app.include_router(filtro_ruido.router)
+    antes = _contados("filtro_ruido", "ruta")
+    respuesta = TestClient(app).post("/filtro_ruido", files={"file": ("x.jpg", b"no es imagen", "image/jpeg")})
+    assert respuesta.status_code >= 400
+    assert _contados("filtro_ruido", "ruta") == antes
@@ -0,0 +1,49 @@
+# Veredicto de cada filtro a resolución reducida vs completa sobre el corpus de benchmarks
+import importlib
+import cv2
+import pytest
+from benchmarks.corpus import generar_corpus
+from filtros.filtro_histograma import analizar_histograma
+from filtros.filtro_yape import NotYapeTransaction, is_yape_transaction_hsv
+from filtros.imagen import decodificar_imagen
+
+TOLERANCIA_YAPE = 0.01        # proporción de píxeles morados/blancos
+TOLERANCIA_HISTOGRAMA = 0.5   # puntos de similitud
+
+FILTROS = ["filtro_yape", "filtro_histograma", "filtro_pixeles", "filtro_logo", "filtro_ruido", "filtro_ocr"]
+CORPUS = list(generar_corpus())
+
+def proporciones_yape(bgr):
+    hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
+    total = hsv.shape[0] * hsv.shape[1]
+    morado = cv2.countNonZero(cv2.inRange(hsv, (120, 50, 50), (160, 255, 255))) / total
+    blanco = cv2.countNonZero(cv2.inRange(hsv, (0, 0, 200), (180, 30, 255))) / total
+    try:
+        veredicto = is_yape_transaction_hsv(hsv)
+    except NotYapeTransaction:
+        veredicto = False
+    return (morado, blanco), veredicto
+
+def similitud_histograma(bgr):
+    resultado = analizar_histograma(bgr, bins="ninguno")
+    return (resultado["similitud"],), resultado["advertencia"]
+
+EVALUAR = {
+    "filtro_yape": (proporciones_yape, TOLERANCIA_YAPE),
+    "filtro_histograma": (similitud_histograma, TOLERANCIA_HISTOGRAMA),
+}
+
+def reduccion(filtro):
+    return importlib.import_module(f"filtros.{filtro}").REDUCCION_DECODIFICACION
+
+def test_todo_filtro_reducido_tiene_comprobacion():
+    assert [f for f in FILTROS if reduccion(f) > 1 and f not in EVALUAR] == []
+
+@pytest.mark.parametrize("filtro", sorted(EVALUAR))
+@pytest.mark.parametrize("nombre,contenido", [(n, c) for n, _, c in CORPUS], ids=[n for n, _, _ in CORPUS])
+def test_veredicto_reducido_coincide_con_completo(filtro, nombre, contenido):
+    evaluar, tolerancia = EVALUAR[filtro]
+    puntajes_c, veredicto_c = evaluar(decodificar_imagen(contenido))
+    puntajes_r, veredicto_r = evaluar(decodificar_imagen(contenido, cv2.IMREAD_COLOR, reduccion(filtro)))
+    assert veredicto_r == veredicto_c
+    assert max(abs(c - r) for c, r in zip(puntajes_c, puntajes_r)) <= tolerancia
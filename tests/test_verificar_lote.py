@@ -0,0 +1,54 @@
+# /verificar/lote: cortar el stream a mitad termina los trabajadores y cierra los zips y el formulario
+import asyncio
+import io
+import json
+import zipfile
+from filtros import filtro_verificar
+from filtros.filtro_verificar import ElementoLote, lineas_lote
+
+def _zip(cantidad: int) -> zipfile.ZipFile:
+    contenido = io.BytesIO()
+    with zipfile.ZipFile(contenido, "w") as zf:
+        for i in range(cantidad):
+            zf.writestr(f"comprobante_{i}.jpg", b"imagen")
+    return zipfile.ZipFile(contenido)
+
+def _elementos(zf: zipfile.ZipFile):
+    return [ElementoLote(info.filename, info.file_size, lambda info=info: zf.read(info)) for info in zf.infolist()]
+
+async def _verificar_rapido(indice, elemento):
+    await asyncio.sleep(0)
+    return {"indice": indice, "nombre": elemento.nombre, "contenido": len(elemento.leer())}
+
+def test_cerrar_el_stream_a_mitad_termina_limpio(monkeypatch):
+    monkeypatch.setattr(filtro_verificar, "verificar_elemento", _verificar_rapido)
+
+    async def escenario():
+        zf = _zip(20)
+        cerrado = asyncio.Event()
+
+        async def cerrar():
+            cerrado.set()
+
+        lineas = lineas_lote(_elementos(zf), [zf], cerrar)
+        primera = json.loads(await lineas.__anext__())
+        # Los trabajadores llenan la cola mientras el cliente ya no lee
+        await asyncio.sleep(0.05)
+        await asyncio.wait_for(lineas.aclose(), 5)
+        otras = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        return primera, zf.fp, cerrado.is_set(), otras
+
+    primera, fp, formulario_cerrado, otras = asyncio.run(escenario())
+    assert primera["nombre"].startswith("comprobante_")
+    assert fp is None and formulario_cerrado
+    assert otras == []
+
+def test_stream_completo_devuelve_todas_las_lineas(monkeypatch):
+    monkeypatch.setattr(filtro_verificar, "verificar_elemento", _verificar_rapido)
+
+    async def escenario():
+        zf = _zip(7)
+        return [json.loads(l) async for l in lineas_lote(_elementos(zf), [zf])]
+
+    lineas = asyncio.run(escenario())
+    assert sorted(l["indice"] for l in lineas) == list(range(7))
@@ -0,0 +1,57 @@
+# /verificar: filtro_claves y filtro_ocr comparten una sola llamada al backend OCR
+import asyncio
+import pytest
+from benchmarks.corpus import generar_corpus
+from filtros import filtro_verificar
+from filtros.cache_ocr import cache_ocr
+from filtros.cliente_ocr import BackendOCR, cliente_ocr
+from filtros.imagen import ImagenDecodificada
+
+RESPUESTA = {
+    "IsErroredOnProcessing": False,
+    "ParsedResults": [{
+        "ParsedText": "¡Yapeaste!\nS/ 25\nJuan Perez",
+        "TextOverlay": {"Lines": [{"Words": [{"WordText": "Yapeaste!", "Left": 12, "Top": 30, "Width": 90, "Height": 20}]}]},
+    }],
+}
+
+class BackendContador(BackendOCR):
+    nombre = "contador"
+
+    def __init__(self):
+        self.llamadas = 0
+
+    async def reconocer(self, archivo, datos, timeout=None):
+        self.llamadas += 1
+        await asyncio.sleep(0.05)
+        return RESPUESTA
+
+@pytest.fixture
+def backend(monkeypatch):
+    falso = BackendContador()
+    monkeypatch.setattr(cliente_ocr, "backend", falso)
+    monkeypatch.setattr(filtro_verificar, "CASCADA_ACTIVA", False)
+    cache_ocr.limpiar()
+    yield falso
+    cache_ocr.limpiar()
+
+@pytest.mark.parametrize("tamano_cache", [512, 0])
+def test_verificar_hace_una_sola_llamada_ocr(backend, monkeypatch, tamano_cache):
+    monkeypatch.setattr(cache_ocr, "tamano", tamano_cache)
+    _, _, contenido = next(iter(generar_corpus()))
+    respuesta = asyncio.run(filtro_verificar.verificar_imagen(ImagenDecodificada(contenido)))
+    assert backend.llamadas == 1
+    assert "omitido" not in respuesta["filtros"]["ocr"]
+    assert "omitido" not in respuesta["filtros"]["filtro_ocr"]
+
+def test_llamada_compartida_sigue_si_un_pedido_se_cancela(backend):
+    async def escenario():
+        archivo = ("recorte.png", b"imagen", "image/png")
+        datos = {"language": "spa"}
+        primero = asyncio.ensure_future(cliente_ocr.enviar(archivo, datos))
+        segundo = asyncio.ensure_future(cliente_ocr.enviar(archivo, datos))
+        await asyncio.sleep(0.01)
+        primero.cancel()
+        return await segundo
+    assert asyncio.run(escenario()) == RESPUESTA
+    assert backend.llamadas == 1